@@ -0,0 +1,349 @@
+"""
+Prompt2Prod - Registre des backends de génération
+
+Chaque backend upstream (route KGateway, serveur vLLM, llama.cpp server,
+Ollama direct...) est décrit par sa configuration :
+- URL de l'endpoint de chat et adaptateur de format (payload, réponse,
+  streaming, liste des modèles) : `openai` (API chat completions, aussi
+  servie par KGateway, vLLM et llama.cpp) ou `ollama` (API native)
+- pool de connexions httpx dédié et profil de timeouts
+- ordonnanceur propre (limite de concurrence)
+- modèles déclarés, complétés par la découverte (`models_url`)
+- `balanced` : appels répartis sur les réplicas Ollama du load balancer
+
+Une requête désigne un backend par son nom (`mode`), ou par son type
+(`local` / `cloud`) : premier backend du type qui déclare le modèle, sinon
+premier backend du type. `/models` est construit à partir du registre.
+
+Sans BACKENDS_CONFIG, le registre reprend les deux routes KGateway
+historiques (`ollama` local, `openai` cloud).
+
+Configuration (variables d'environnement) :
+- BACKENDS_CONFIG : fichier JSON `{"backends": [...]}` (voir docs/api/api-reference-v2.md)
+"""
+import asyncio
+import json
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from src.api.httpclient import LoopClient
+from src.api.scheduler import STARVATION_SECONDS, WEIGHTS, FairScheduler, schedulers
+from src.api.tracing import tracer
+
+BACKEND_TYPES = ("local", "cloud")
+
+DEFAULT_PAYLOAD = {"max_tokens": 4000, "temperature": 0.7}
+DEFAULT_TIMEOUTS = {"connect": 10.0, "read": 180.0, "write": 30.0, "pool": 30.0}
+DEFAULT_POOL = {"max_connections": 100, "max_keepalive_connections": 20, "keepalive_expiry": 30.0}
+MODELS_TIMEOUT_SECONDS = 10.0
+
+# Modèles cloud supportés (OpenAI)
+CLOUD_MODELS = [
+    {
+        "id": "gpt-4o-mini",
+        "name": "GPT-4o Mini",
+        "provider": "openai",
+        "type": "cloud",
+        "description": "Modèle rapide et économique d'OpenAI",
+        "context_length": 128000,
+        "pricing": {"input": 0.15, "output": 0.60, "unit": "$/1M tokens"}
+    },
+    {
+        "id": "gpt-3.5-turbo",
+        "name": "GPT-3.5 Turbo",
+        "provider": "openai",
+        "type": "cloud",
+        "description": "Modèle conversationnel rapide d'OpenAI",
+        "context_length": 16385,
+        "pricing": {"input": 0.50, "output": 1.50, "unit": "$/1M tokens"}
+    }
+]
+
+
+class UnknownBackend(Exception):
+    """Aucun backend ne correspond au mode demandé"""
+
+    def __init__(self, mode: str):
+        super().__init__(f"Unknown mode or backend '{mode}'")
+        self.mode = mode
+
+
+# ----------------------------------------------------------------------
+# Adaptateurs de format
+# ----------------------------------------------------------------------
+
+def parse_chat_response(data: Dict) -> Tuple[str, str]:
+    """(texte, provider) d'une réponse non streamée, quel que soit son format"""
+    if "response" in data:
+        # Format Ollama (generate)
+        return data["response"], "ollama"
+    if "choices" in data and len(data["choices"]) > 0:
+        # Format OpenAI/OpenRouter
+        choice = data["choices"][0]
+        if "message" in choice:
+            return choice["message"]["content"], "openai"
+        return choice.get("text", ""), "openai"
+    if isinstance(data.get("message"), dict):
+        # Format Ollama (chat)
+        return data["message"].get("content", ""), "ollama"
+    return str(data), "unknown"
+
+
+def parse_stream_fragment(line: str) -> Optional[str]:
+    """Texte d'une ligne de stream upstream (SSE OpenAI ou NDJSON Ollama), None sinon"""
+    line = line.strip()
+    if line.startswith("data:"):
+        line = line[5:].strip()
+    if not line or line == "[DONE]" or not line.startswith("{"):
+        return None
+    chunk = json.loads(line)
+    if "choices" in chunk and chunk["choices"]:
+        choice = chunk["choices"][0]
+        delta = choice.get("delta") or choice.get("message") or {}
+        return delta.get("content") or choice.get("text") or None
+    if "message" in chunk:
+        return chunk["message"].get("content") or None
+    return chunk.get("response") or None
+
+
+class OpenAIAdapter:
+    """API chat completions (OpenAI, KGateway, vLLM, llama.cpp server)"""
+
+    name = "openai"
+    chat_path = "/v1/chat/completions"
+    models_path = "/v1/models"
+
+    def build_payload(self, model: Optional[str], messages: list, options: Dict) -> Dict:
+        return {"model": model, "messages": messages, **options, "stream": options.get("stream", False)}
+
+    def parse_response(self, data: Dict) -> Tuple[str, str]:
+        return parse_chat_response(data)
+
+    def stream_fragment(self, line: str) -> Optional[str]:
+        return parse_stream_fragment(line)
+
+    def parse_models(self, data: Dict, backend: "Backend") -> List[Dict]:
+        return [backend.describe_model({"id": m["id"]}) for m in data.get("data", []) if "id" in m]
+
+
+class OllamaAdapter(OpenAIAdapter):
+    """API native Ollama (/api/chat, /api/tags)"""
+
+    name = "ollama"
+    chat_path = "/api/chat"
+    models_path = "/api/tags"
+
+    def build_payload(self, model: Optional[str], messages: list, options: Dict) -> Dict:
+        options = dict(options)
+        payload = {"model": model, "messages": messages, "stream": options.pop("stream", False)}
+        if "max_tokens" in options:
+            options["num_predict"] = options.pop("max_tokens")
+        if options:
+            payload["options"] = options
+        return payload
+
+    def parse_models(self, data: Dict, backend: "Backend") -> List[Dict]:
+        return [
+            backend.describe_model({
+                "id": model["name"],
+                "name": model["name"].replace(":", " "),
+                "description": f"Modèle local {model['name']}",
+                "size_gb": round(model["size"] / (1024**3), 1),
+                "modified": model["modified_at"],
+                "family": model.get("details", {}).get("family", "unknown"),
+                "parameters": model.get("details", {}).get("parameter_size", "unknown"),
+            })
+            for model in data.get("models", [])
+        ]
+
+
+ADAPTERS: Dict[str, OpenAIAdapter] = {"openai": OpenAIAdapter(), "ollama": OllamaAdapter()}
+
+
+def register_adapter(adapter: OpenAIAdapter) -> None:
+    """Ajoute un format de backend (référencé par `adapter` dans la configuration)"""
+    ADAPTERS[adapter.name] = adapter
+
+
+# ----------------------------------------------------------------------
+# Backends
+# ----------------------------------------------------------------------
+
+class Backend:
+    """Un upstream de génération : endpoint, format, pool, timeouts, concurrence, modèles"""
+
+    def __init__(self, name: str, url: str, type: str = "cloud", adapter: str = "openai",
+                 provider: Optional[str] = None, models: Optional[List] = None,
+                 models_url: Optional[str] = None, models_adapter: Optional[str] = None,
+                 balanced: bool = False, concurrency: int = 4, timeouts: Optional[Dict] = None,
+                 pool: Optional[Dict] = None, payload: Optional[Dict] = None,
+                 scheduler: Optional[FairScheduler] = None,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        if type not in BACKEND_TYPES:
+            raise ValueError(f"Backend '{name}': unknown type '{type}' (expected local or cloud)")
+        for label in (adapter, models_adapter or adapter):
+            if label not in ADAPTERS:
+                raise ValueError(f"Backend '{name}': unknown adapter '{label}'")
+        self.name = name
+        self.url = url.rstrip("/")
+        self.type = type
+        self.adapter = ADAPTERS[adapter]
+        self.models_adapter = ADAPTERS[models_adapter or adapter]
+        self.provider = provider or name
+        self.models_url = models_url
+        self.balanced = balanced
+        self.payload = {**DEFAULT_PAYLOAD, **(payload or {})}
+        self.timeout = httpx.Timeout(**{**DEFAULT_TIMEOUTS, **(timeouts or {})})
+        self.limits = httpx.Limits(**{**DEFAULT_POOL, **(pool or {})})
+        self.scheduler = scheduler or FairScheduler(name, concurrency, WEIGHTS, STARVATION_SECONDS)
+        # Transport httpx explicite (upstream simulé en process : benchmarks, tests)
+        self.transport = transport
+        self.models = [self.describe_model(m if isinstance(m, dict) else {"id": m}) for m in models or []]
+        self._client = LoopClient(timeout=self.timeout, limits=self.limits, transport=self.transport)
+
+    def describe_model(self, model: Dict) -> Dict:
+        return {
+            "name": model["id"],
+            "provider": self.provider,
+            "type": self.type,
+            "description": f"Modèle {model['id']} ({self.name})",
+            **model,
+            "backend": self.name,
+        }
+
+    def has_model(self, model: Optional[str]) -> bool:
+        return any(m["id"] == model for m in self.models)
+
+    def context_length(self, model: Optional[str]) -> Optional[int]:
+        return next((m.get("context_length") for m in self.models if m["id"] == model), None)
+
+    # ------------------------------------------------------------------
+    # Appels
+    # ------------------------------------------------------------------
+
+    def client(self) -> httpx.AsyncClient:
+        """Client httpx du backend (pool de connexions réutilisé entre les requêtes)"""
+        return self._client.get()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    def build_request(self, model: Optional[str], messages: list,
+                      extra_payload: Optional[Dict] = None) -> Tuple[str, Dict, Dict]:
+        """Endpoint, payload et headers d'un appel de génération"""
+        payload = self.adapter.build_payload(model, messages, {**self.payload, **(extra_payload or {})})
+        return self.url, payload, {"Content-Type": "application/json"}
+
+    def replica_endpoint(self, replica_url: str) -> str:
+        """Endpoint de chat sur un réplica choisi par le load balancer"""
+        return f"{replica_url}{self.adapter.chat_path}"
+
+    def parse_response(self, data: Dict) -> Tuple[str, str]:
+        return self.adapter.parse_response(data)
+
+    def stream_fragment(self, line: str) -> Optional[str]:
+        return self.adapter.stream_fragment(line)
+
+    async def list_models(self, models_url: Optional[str] = None) -> Tuple[List[Dict], Dict]:
+        """Modèles déclarés + découverts, et état de la découverte"""
+        models_url = models_url or self.models_url
+        if not models_url:
+            return list(self.models), {"status": "static", "count": len(self.models)}
+        discovered: List[Dict] = []
+        try:
+            with tracer.start_span("upstream.attempt", {"upstream.endpoint": models_url}):
+                response = await self.client().get(models_url, headers=tracer.inject({}),
+                                                    timeout=MODELS_TIMEOUT_SECONDS)
+            if response.status_code == 200:
+                discovered = self.models_adapter.parse_models(response.json(), self)
+                status = {"status": "available", "count": len(discovered)}
+            else:
+                status = {"status": "error", "error": f"HTTP {response.status_code}"}
+        except Exception as e:
+            status = {"status": "unreachable", "error": str(e)}
+        # Un modèle déclaré et découvert garde ses métadonnées déclarées (contexte, tarifs...)
+        declared = {m["id"]: m for m in self.models}
+        merged = [{**m, **declared.pop(m["id"], {})} for m in discovered]
+        return list(declared.values()) + merged, status
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "type": self.type,
+            "adapter": self.adapter.name,
+            "url": self.url,
+            "balanced": self.balanced,
+            "concurrency": self.scheduler.concurrency,
+        }
+
+
+class BackendRegistry:
+    """Backends configurés, résolution d'une requête vers son backend"""
+
+    def __init__(self, backends: List[Backend]):
+        if not backends:
+            raise ValueError("At least one backend is required")
+        self.backends: Dict[str, Backend] = {}
+        for backend in backends:
+            if backend.name in self.backends:
+                raise ValueError(f"Duplicate backend '{backend.name}'")
+            self.backends[backend.name] = backend
+
+    def __iter__(self) -> Iterator[Backend]:
+        return iter(self.backends.values())
+
+    def get(self, name: str) -> Optional[Backend]:
+        return self.backends.get(name)
+
+    def resolve(self, mode: Optional[str], model: Optional[str] = None) -> Backend:
+        """
+        Backend nommé `mode`, sinon backend du type `mode` qui déclare le
+        modèle (ou le premier). Un mode qui n'est ni un nom ni un type est
+        servi par le cloud, comme historiquement.
+        """
+        mode = mode or "cloud"
+        backend = self.backends.get(mode)
+        if backend is not None:
+            return backend
+        kind = mode if mode in BACKEND_TYPES else "cloud"
+        candidates = [b for b in self if b.type == kind]
+        if not candidates:
+            raise UnknownBackend(mode)
+        return next((b for b in candidates if b.has_model(model)), candidates[0])
+
+    def schedulers(self) -> List[FairScheduler]:
+        return [b.scheduler for b in self]
+
+    def open(self) -> None:
+        """Démarrage : pools ouverts avant la première requête"""
+        for backend in self:
+            backend.client()
+
+    async def aclose(self) -> None:
+        await asyncio.gather(*(b.aclose() for b in self))
+
+    @classmethod
+    def from_config(cls, config: Dict) -> "BackendRegistry":
+        return cls([Backend(**entry) for entry in config.get("backends", [])])
+
+
+def default_backends(kgateway_endpoint: str, ollama_host: str) -> BackendRegistry:
+    """Routes KGateway historiques, avec les ordonnanceurs SCHEDULER_*_CONCURRENCY"""
+    return BackendRegistry([
+        # KGateway Ollama route: /ollama (format OpenAI) ; modèles installés lus sur Ollama
+        Backend("ollama", f"{kgateway_endpoint}/ollama", type="local", provider="ollama",
+                models_url=f"{ollama_host}/api/tags", models_adapter="ollama", balanced=True,
+                scheduler=schedulers["local"]),
+        # KGateway OpenAI route: /openai
+        Backend("openai", f"{kgateway_endpoint}/openai", type="cloud", provider="openai",
+                models=CLOUD_MODELS, scheduler=schedulers["cloud"]),
+    ])
+
+
+def load_backends(path: Optional[str], kgateway_endpoint: str, ollama_host: str) -> BackendRegistry:
+    """Registre lu dans `path` (JSON), sinon routes KGateway par défaut"""
+    if not path:
+        return default_backends(kgateway_endpoint, ollama_host)
+    with open(path, encoding="utf-8") as f:
+        return BackendRegistry.from_config(json.load(f))
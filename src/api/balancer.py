@@ -0,0 +1,267 @@
+"""
+Prompt2Prod - Load balancing client entre réplicas Ollama
+
+Répartit les appels locaux sur plusieurs instances Ollama :
+- liste statique (OLLAMA_HOSTS) ou découverte DNS d'un service headless
+  Kubernetes (OLLAMA_DISCOVERY, un enregistrement A par pod)
+- choix « power of two choices » ou « least outstanding requests »,
+  en privilégiant les réplicas qui ont déjà le modèle chargé en mémoire
+- éjection passive après des échecs consécutifs, réadmission après un
+  délai croissant (une seule requête d'essai à la réadmission)
+- affinité optionnelle (sessions) pour profiter du cache KV d'un réplica
+
+Configuration (variables d'environnement) :
+- OLLAMA_HOSTS              : liste d'URLs séparées par des virgules
+- OLLAMA_DISCOVERY          : "hote:port" d'un service headless à résoudre
+- OLLAMA_DISCOVERY_INTERVAL : période de re-résolution DNS / état des modèles (s)
+- OLLAMA_LB_STRATEGY        : p2c | least (défaut p2c)
+- OLLAMA_EJECT_FAILURES     : échecs consécutifs avant éjection (défaut 3)
+- OLLAMA_EJECT_SECONDS      : durée d'éjection initiale (doublée à chaque récidive)
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import random
+import socket
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+from src.api.httpclient import LoopClient
+
+logger = logging.getLogger("prompt2prod.balancer")
+
+# Écart de charge toléré avant de rompre l'affinité d'une session
+AFFINITY_SLACK = 2
+MAX_EJECT_SECONDS = 300.0
+
+
+class Replica:
+    """État d'un réplica Ollama vu par ce pod"""
+
+    __slots__ = ("url", "outstanding", "failures", "ejections", "ejected_until",
+                 "trial_in_flight", "loaded_models", "latency_ewma")
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.outstanding = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.trial_in_flight = False
+        self.loaded_models: Set[str] = set()
+        self.latency_ewma = 0.0
+
+    def available(self, now: float) -> bool:
+        if self.ejected_until == 0.0:
+            return True
+        # Réadmission « half-open » : une seule requête d'essai à la fois
+        return now >= self.ejected_until and not self.trial_in_flight
+
+    def to_dict(self) -> Dict:
+        now = time.monotonic()
+        return {
+            "url": self.url,
+            "healthy": self.ejected_until == 0.0,
+            "outstanding": self.outstanding,
+            "consecutive_failures": self.failures,
+            "ejected_for_seconds": round(max(0.0, self.ejected_until - now), 1),
+            "loaded_models": sorted(self.loaded_models),
+            "latency_ewma_ms": round(self.latency_ewma * 1000, 1),
+        }
+
+
+class NoReplicaAvailable(Exception):
+    """Tous les réplicas sont éjectés"""
+
+
+class OllamaBalancer:
+    """Sélection de réplica et détection passive des pannes"""
+
+    def __init__(self, hosts: Optional[List[str]] = None, discovery: Optional[str] = None,
+                 strategy: str = "p2c", eject_failures: int = 3, eject_seconds: float = 30.0,
+                 refresh_interval: float = 15.0):
+        self.replicas: Dict[str, Replica] = {}
+        self.discovery = discovery
+        self.strategy = strategy
+        self.eject_failures = eject_failures
+        self.eject_seconds = eject_seconds
+        self.refresh_interval = refresh_interval
+        self._last_refresh = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Client unique pour /api/ps, ouvert au démarrage (pas de pool ni de contexte SSL par sonde)
+        self._client = LoopClient(timeout=2.0)
+        for host in hosts or []:
+            self.replicas[host.rstrip("/")] = Replica(host)
+
+    @property
+    def enabled(self) -> bool:
+        """Actif dès qu'il y a de la découverte ou plusieurs réplicas"""
+        return bool(self.discovery) or len(self.replicas) > 1
+
+    # ------------------------------------------------------------------
+    # Découverte et état des modèles chargés
+    # ------------------------------------------------------------------
+
+    async def _resolve(self) -> None:
+        host, _, port = self.discovery.partition(":")
+        port = int(port or 11434)
+        loop = asyncio.get_running_loop()
+        infos = await loop.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        urls = set()
+        for family, _, _, _, sockaddr in infos:
+            address = f"[{sockaddr[0]}]" if family == socket.AF_INET6 else sockaddr[0]
+            urls.add(f"http://{address}:{port}")
+        if not urls:
+            return
+        for url in urls - set(self.replicas):
+            self.replicas[url] = Replica(url)
+        for url in set(self.replicas) - urls:
+            # Un pod disparu du DNS n'est retiré qu'une fois ses requêtes terminées
+            if self.replicas[url].outstanding == 0:
+                del self.replicas[url]
+
+    async def _poll_loaded_models(self) -> None:
+        client = self._client.get()
+
+        async def poll(replica: Replica):
+            try:
+                response = await client.get(f"{replica.url}/api/ps")
+                if response.status_code == 200:
+                    replica.loaded_models = {
+                        m.get("name") or m.get("model") for m in response.json().get("models", [])
+                    }
+            except Exception:
+                # L'état de santé reste piloté par le trafic réel (détection passive)
+                pass
+        await asyncio.gather(*(poll(r) for r in list(self.replicas.values())))
+
+    async def refresh(self) -> None:
+        """Re-résout le DNS puis met à jour les modèles chargés par réplica"""
+        self._last_refresh = time.monotonic()
+        if self.discovery:
+            try:
+                await self._resolve()
+            except OSError as e:
+                logger.warning("Ollama discovery failed: %s", e)
+        await self._poll_loaded_models()
+
+    async def maybe_refresh(self) -> None:
+        """
+        Rafraîchissement paresseux : bloquant au premier appel (aucun
+        réplica connu), en tâche de fond ensuite.
+        """
+        if time.monotonic() - self._last_refresh < self.refresh_interval:
+            return
+        if not self.replicas:
+            await self.refresh()
+        elif self._refresh_task is None or self._refresh_task.done():
+            self._last_refresh = time.monotonic()
+            self._refresh_task = asyncio.create_task(self.refresh())
+
+    # ------------------------------------------------------------------
+    # Sélection
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _load(replica: Replica):
+        return (replica.outstanding, replica.latency_ewma)
+
+    def pick(self, model: Optional[str] = None, affinity_key: Optional[str] = None) -> Replica:
+        now = time.monotonic()
+        candidates = [r for r in self.replicas.values() if r.available(now)]
+        if not candidates:
+            raise NoReplicaAvailable("No healthy Ollama replica")
+
+        warm = [r for r in candidates if model and model in r.loaded_models]
+        pool = warm or candidates
+
+        if affinity_key and len(pool) > 1:
+            # Rendezvous hashing : même réplica pour une session tant qu'il n'est pas surchargé
+            preferred = max(pool, key=lambda r: hashlib.md5(
+                f"{affinity_key}|{r.url}".encode(), usedforsecurity=False).digest())
+            least = min(r.outstanding for r in pool)
+            if preferred.outstanding <= least + AFFINITY_SLACK:
+                return preferred
+
+        if len(pool) == 1:
+            return pool[0]
+        if self.strategy == "least":
+            return min(pool, key=self._load)
+        first, second = random.sample(pool, 2)  # nosec B311
+        return min(first, second, key=self._load)
+
+    def record(self, replica: Replica, ok: bool, latency: float, model: Optional[str] = None) -> None:
+        """Détection passive : met à jour l'état du réplica après un appel"""
+        replica.trial_in_flight = False
+        if ok:
+            replica.failures = 0
+            replica.ejections = 0
+            replica.ejected_until = 0.0
+            if replica.latency_ewma == 0.0:
+                replica.latency_ewma = latency
+            else:
+                replica.latency_ewma = 0.8 * replica.latency_ewma + 0.2 * latency
+            if model:
+                replica.loaded_models.add(model)
+            return
+        replica.failures += 1
+        was_on_trial = replica.ejected_until != 0.0
+        if was_on_trial or replica.failures >= self.eject_failures:
+            backoff = min(MAX_EJECT_SECONDS, self.eject_seconds * (2 ** replica.ejections))
+            replica.ejections += 1
+            replica.ejected_until = time.monotonic() + backoff
+            logger.warning("Ollama replica ejected for %.0fs: %s", backoff, replica.url)
+
+    @asynccontextmanager
+    async def acquire(self, model: Optional[str] = None, affinity_key: Optional[str] = None):
+        """Réserve un réplica le temps d'un appel et enregistre son résultat"""
+        await self.maybe_refresh()
+        replica = self.pick(model, affinity_key)
+        if replica.ejected_until != 0.0:
+            replica.trial_in_flight = True
+        replica.outstanding += 1
+        started = time.monotonic()
+        try:
+            yield replica
+        except httpx.HTTPStatusError as e:
+            # Une erreur client (4xx) ne dit rien de la santé du réplica
+            self.record(replica, e.response.status_code < 500, time.monotonic() - started, model)
+            raise
+        except Exception:
+            self.record(replica, False, time.monotonic() - started, model)
+            raise
+        else:
+            self.record(replica, True, time.monotonic() - started, model)
+        finally:
+            # Annulation, générateur fermé... : ni succès ni échec, mais l'essai est libéré
+            replica.trial_in_flight = False
+            replica.outstanding -= 1
+
+    def status(self) -> List[Dict]:
+        return [r.to_dict() for r in self.replicas.values()]
+
+    def open(self) -> None:
+        if self.enabled:
+            self._client.get()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+
+def _hosts_from_env() -> List[str]:
+    hosts = os.getenv("OLLAMA_HOSTS", "")
+    return [h.strip() for h in hosts.split(",") if h.strip()]
+
+
+balancer = OllamaBalancer(
+    hosts=_hosts_from_env(),
+    discovery=os.getenv("OLLAMA_DISCOVERY") or None,
+    strategy=os.getenv("OLLAMA_LB_STRATEGY", "p2c"),
+    eject_failures=int(os.getenv("OLLAMA_EJECT_FAILURES", "3")),
+    eject_seconds=float(os.getenv("OLLAMA_EJECT_SECONDS", "30")),
+    refresh_interval=float(os.getenv("OLLAMA_DISCOVERY_INTERVAL", "15")),
+)
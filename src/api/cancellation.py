@@ -0,0 +1,52 @@
+"""
+Prompt2Prod - Annulation des générations quand le client se déconnecte
+
+Un client qui abandonne (timeout, onglet fermé) ne doit pas laisser tourner
+une génération que personne ne lira : la requête est surveillée pendant
+l'appel et, à la déconnexion, la tâche est annulée. L'annulation remonte
+jusqu'à httpx, qui ferme la connexion upstream (Ollama arrête alors de
+générer), et libère le slot de l'ordonnanceur.
+"""
+import asyncio
+from typing import Awaitable, TypeVar
+
+from starlette.requests import Request
+
+T = TypeVar("T")
+
+# Code non standard (nginx) : client parti avant la réponse
+CLIENT_CLOSED_REQUEST = 499
+
+
+class ClientDisconnected(Exception):
+    """Le client s'est déconnecté avant la fin du traitement"""
+
+
+async def _wait_disconnect(request: Request) -> None:
+    # Le corps a déjà été lu : le prochain message ASGI est la déconnexion
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T]) -> T:
+    """
+    Exécute `work` et l'annule si le client se déconnecte avant la fin.
+
+    Lève ClientDisconnected dans ce cas.
+    """
+    task = asyncio.ensure_future(work)
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    finally:
+        watcher.cancel()
+    if not task.done():
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        raise ClientDisconnected()
+    return task.result()
@@ -0,0 +1,169 @@
+"""
+Prompt2Prod - Capture échantillonnée du trafic /generate
+
+Enregistre une fraction des requêtes /generate dans un journal JSONL
+(une ligne par requête) pour les rejouer hors ligne avec
+`python -m tests.benchmarks.replay` : mix réel de tailles de prompts,
+modèles et modes, avec le rythme d'arrivée d'origine.
+
+Champs d'un enregistrement : `ts` (epoch), `mode`, `model`, `priority`,
+`prompt` (après rédaction, absent si CAPTURE_PROMPTS=0), `prompt_chars`,
+`prompt_tokens`, `status`, `latency_ms`, `response_chars`, `served_model`.
+
+L'écriture passe par une file vidée par un thread (comme les logs) :
+jamais d'I/O disque sur la boucle. Le fichier tourne au-delà de
+CAPTURE_MAX_BYTES ; les fichiers tournés sont compressés (gzip).
+
+Rédaction : par défaut, adresses e-mail, clés d'API (`sk-...`) et tokens
+`Bearer` sont masqués dans le prompt. CAPTURE_REDACT="module:fonction"
+remplace ce traitement par une fonction `str -> str`.
+
+Configuration (variables d'environnement) :
+- CAPTURE_PATH        : fichier de capture (vide = capture désactivée)
+- CAPTURE_SAMPLE_RATE : fraction des requêtes capturées (défaut 0.01)
+- CAPTURE_PROMPTS     : conserve le texte des prompts (défaut 1 ; 0 = tailles seules)
+- CAPTURE_REDACT      : fonction de rédaction alternative "module:fonction"
+- CAPTURE_MAX_BYTES   : taille d'un fichier avant rotation (défaut 50 Mo)
+- CAPTURE_BACKUPS     : fichiers tournés conservés (défaut 5)
+"""
+import atexit
+import gzip
+import importlib
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import shutil
+import time
+from typing import Callable, Dict, Iterator, Optional
+
+from src.api.metrics import registry
+from src.api.tokens import estimate_tokens
+
+SECRET_PATTERNS = (
+    (re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+"), "<email>"),
+    (re.compile(r"\bsk-[A-Za-z0-9_-]{16,}"), "<api-key>"),
+    (re.compile(r"(?i)\bbearer\s+[A-Za-z0-9._~+/=-]{16,}"), "Bearer <token>"),
+)
+
+CAPTURED = registry.counter(
+    "prompt2prod_capture_records_total", "Requêtes /generate enregistrées dans la capture de trafic",
+)
+
+
+def redact_secrets(text: str) -> str:
+    """Rédaction par défaut : e-mails, clés d'API et tokens Bearer masqués"""
+    for pattern, replacement in SECRET_PATTERNS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _gzip_rotator(source: str, dest: str) -> None:
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+def read_capture(path: str) -> Iterator[Dict]:
+    """Enregistrements d'un fichier de capture (.jsonl ou .jsonl.N.gz)"""
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+class TrafficCapture:
+    """Journal JSONL échantillonné et tournant des requêtes /generate"""
+
+    def __init__(self, path: str = "", sample_rate: float = 0.01, include_prompts: bool = True,
+                 redact: Callable[[str], str] = redact_secrets, max_bytes: int = 50 * 1024 * 1024,
+                 backups: int = 5):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.include_prompts = include_prompts
+        self.redact = redact
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._logger: Optional[logging.Logger] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and self.sample_rate > 0
+
+    def sampled(self) -> bool:
+        """La requête doit-elle être capturée ?"""
+        return self.enabled and random.random() < self.sample_rate  # nosec B311
+
+    def _writer(self) -> logging.Logger:
+        """Logger dédié branché (au premier usage) sur un fichier tournant via une file"""
+        if self._logger is None:
+            handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8", delay=True,
+            )
+            handler.namer = lambda name: name + ".gz"
+            handler.rotator = _gzip_rotator
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            records: queue.SimpleQueue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(records, handler)
+            self._listener.start()
+            atexit.register(self.close)
+            logger = logging.getLogger(f"prompt2prod.capture.{id(self)}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.handlers = [logging.handlers.QueueHandler(records)]
+            self._logger = logger
+        return self._logger
+
+    def record(self, *, mode: str, model: Optional[str], priority: str, prompt: str, status: int,
+               latency: float, response_chars: int = 0, served_model: Optional[str] = None,
+               started_at: Optional[float] = None) -> None:
+        entry = {
+            "ts": round(started_at if started_at is not None else time.time() - latency, 3),
+            "mode": mode,
+            "model": model,
+            "priority": priority,
+            "prompt_chars": len(prompt),
+            "prompt_tokens": estimate_tokens(prompt),
+            "status": status,
+            "latency_ms": round(latency * 1000, 1),
+            "response_chars": response_chars,
+        }
+        if served_model is not None and served_model != model:
+            entry["served_model"] = served_model
+        if self.include_prompts:
+            entry["prompt"] = self.redact(prompt)
+        self._writer().info(json.dumps(entry, ensure_ascii=False, separators=(",", ":")))
+        CAPTURED.inc()
+
+    def close(self) -> None:
+        """Vide la file et ferme le fichier"""
+        if self._listener is not None:
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+            self._logger = None
+
+
+def _redact_from_env() -> Callable[[str], str]:
+    path = os.getenv("CAPTURE_REDACT")
+    if path:
+        module_name, _, function_name = path.partition(":")
+        return getattr(importlib.import_module(module_name), function_name)
+    return redact_secrets
+
+
+capture = TrafficCapture(
+    path=os.getenv("CAPTURE_PATH", ""),
+    sample_rate=float(os.getenv("CAPTURE_SAMPLE_RATE", "0.01")),
+    include_prompts=os.getenv("CAPTURE_PROMPTS", "1").lower() in ("1", "true", "yes"),
+    redact=_redact_from_env(),
+    max_bytes=int(os.getenv("CAPTURE_MAX_BYTES", str(50 * 1024 * 1024))),
+    backups=int(os.getenv("CAPTURE_BACKUPS", "5")),
+)
@@ -0,0 +1,134 @@
+"""
+Prompt2Prod - Deadline de bout en bout
+
+Le client annonce combien de temps il est prêt à attendre (header
+`X-Request-Timeout` ou champ `timeout`), borné par la configuration
+serveur. Cette deadline pilote ensuite toute la chaîne :
+- l'attente dans la file de l'ordonnanceur
+- les timeouts httpx (connexion, lecture) de l'appel upstream
+- les re-prompts de réparation (pas de nouvel essai sans budget)
+- le budget restant transmis à l'upstream (KGateway/Envoy)
+
+Une requête qui ne peut manifestement pas aboutir à temps (file trop
+longue au vu des durées observées) est refusée d'emblée.
+
+Configuration (variables d'environnement) :
+- REQUEST_TIMEOUT_DEFAULT_SECONDS : deadline sans indication du client (défaut 180)
+- REQUEST_TIMEOUT_MAX_SECONDS     : deadline maximale acceptée (défaut 600)
+- REQUEST_TIMEOUT_MIN_SECONDS     : deadline minimale acceptée (défaut 1)
+- UPSTREAM_CONNECT_TIMEOUT_SECONDS : plafond du timeout de connexion (défaut 10)
+"""
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional, Union
+
+import httpx
+from fastapi import HTTPException
+
+DEFAULT_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_DEFAULT_SECONDS", "180"))
+MAX_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_MAX_SECONDS", "600"))
+MIN_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_MIN_SECONDS", "1"))
+CONNECT_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "10"))
+
+# Marge gardée par l'API pour construire sa réponse après l'appel upstream
+UPSTREAM_MARGIN_SECONDS = 0.25
+
+
+class DeadlineUnreachable(Exception):
+    """La requête ne peut pas aboutir avant sa deadline"""
+
+    def __init__(self, remaining: float, estimate: float):
+        super().__init__(
+            f"Deadline cannot be met: {remaining:.1f}s left, ~{estimate:.1f}s expected"
+        )
+        self.remaining = remaining
+        self.estimate = estimate
+
+
+class Deadline:
+    """Instant limite d'une requête (horloge monotone)"""
+
+    __slots__ = ("seconds", "expires_at")
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def upstream_budget(self) -> float:
+        return max(0.001, self.remaining() - UPSTREAM_MARGIN_SECONDS)
+
+    def upstream_timeout(self, profile: Optional[httpx.Timeout] = None) -> httpx.Timeout:
+        """Timeouts httpx dérivés du budget restant (et du profil du backend, s'il est plus court)"""
+        budget = self.upstream_budget()
+        if profile is None:
+            return httpx.Timeout(budget, connect=min(budget, CONNECT_TIMEOUT_SECONDS))
+
+        def bounded(value: Optional[float]) -> float:
+            return budget if value is None else min(budget, value)
+
+        return httpx.Timeout(
+            connect=min(bounded(profile.connect), CONNECT_TIMEOUT_SECONDS), read=bounded(profile.read),
+            write=bounded(profile.write), pool=bounded(profile.pool),
+        )
+
+    def upstream_headers(self) -> Dict[str, str]:
+        """Budget restant transmis à l'upstream (Envoy l'applique comme timeout de route)"""
+        budget = self.upstream_budget()
+        return {
+            "X-Request-Timeout": f"{budget:.3f}",
+            "x-envoy-upstream-rq-timeout-ms": str(int(budget * 1000)),
+        }
+
+    def ensure_reachable(self, estimate: float) -> None:
+        """Refus anticipé si l'estimation (attente + appel) dépasse le budget"""
+        remaining = self.remaining()
+        if remaining <= 0.0 or estimate > remaining:
+            raise DeadlineUnreachable(remaining, estimate)
+
+
+def parse_timeout(value: Union[str, float]) -> float:
+    """Durée en secondes : `30`, `2.5`, `30s` ou `500ms`"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = value.strip().lower()
+    if text.endswith("ms"):
+        return float(text[:-2]) / 1000
+    if text.endswith("s"):
+        return float(text[:-1])
+    return float(text)
+
+
+def request_deadline(field: Optional[float] = None, header: Optional[str] = None) -> Deadline:
+    """Deadline d'une requête : champ, sinon header X-Request-Timeout, bornée par le serveur"""
+    raw = field if field is not None else header
+    if raw is None:
+        return Deadline(DEFAULT_TIMEOUT_SECONDS)
+    try:
+        seconds = parse_timeout(raw)
+    except ValueError:
+        raise HTTPException(status_code=422, detail=f"Invalid request timeout '{raw}'")
+    if seconds != seconds or seconds <= 0:
+        raise HTTPException(status_code=422, detail=f"Invalid request timeout '{raw}'")
+    return Deadline(min(max(seconds, MIN_TIMEOUT_SECONDS), MAX_TIMEOUT_SECONDS))
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("prompt2prod_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline):
+    """Rend la deadline visible des appels upstream du contexte courant"""
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
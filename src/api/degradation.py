@@ -0,0 +1,190 @@
+"""
+Prompt2Prod - Dégradation de modèle sous charge
+
+Une requête peut fixer un objectif de latence (`latency_slo`, secondes).
+Si le temps prévu pour le modèle demandé le dépasse, on descend une
+échelle configurée de modèles plus petits (ou vers le cloud), jusqu'au
+premier dont la prévision tient l'objectif ; à défaut, le plus rapide.
+
+Prévision pour (backend, modèle) :
+- attente en file : profondeur de file courante du backend (classes au
+  moins aussi prioritaires) x durée moyenne d'un appel / concurrence
+- génération : tokens générés attendus / débit observé (tokens/s), deux
+  moyennes mobiles par modèle alimentées par chaque appel terminé ; à
+  défaut de mesure pour le modèle, durée moyenne d'un appel du backend
+
+Sans aucune observation, la prévision est inconnue et le modèle demandé
+est conservé.
+
+Configuration (variables d'environnement) :
+- DEGRADATION_LADDERS : échelles séparées par `;`, barreaux séparés par `>`,
+  `modele@mode` pour changer de backend, ex.
+  "mistral:7b-instruct>phi3:mini>llama3.2:1b>gpt-4o-mini@cloud"
+"""
+import os
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from src.api.backends import UnknownBackend
+from src.api.metrics import registry
+
+# Poids d'une nouvelle mesure dans les moyennes mobiles
+EWMA_ALPHA = 0.2
+
+DEGRADATIONS = registry.counter(
+    "prompt2prod_degradations_total", "Requêtes servies par un modèle plus petit que demandé",
+    ["requested", "served"],
+)
+TOKENS_PER_SECOND = registry.gauge(
+    "prompt2prod_tokens_per_second", "Débit de génération observé (EWMA)", ["backend", "model"],
+)
+
+Rung = Tuple[str, Optional[str]]  # (modèle, mode ; None = même mode que la requête)
+
+
+class ThroughputTracker:
+    """Débit (tokens/s) et taille de réponse observés par backend et modèle"""
+
+    def __init__(self, alpha: float = EWMA_ALPHA):
+        self.alpha = alpha
+        self._rates: Dict[Tuple[str, str], float] = {}
+        self._tokens: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+
+    def _ewma(self, values: Dict, key, value: float) -> float:
+        previous = values.get(key)
+        values[key] = value if previous is None else (1 - self.alpha) * previous + self.alpha * value
+        return values[key]
+
+    def observe(self, backend: str, model: str, tokens: int, seconds: float) -> None:
+        if tokens <= 0 or seconds <= 0:
+            return
+        key = (backend, model)
+        with self._lock:
+            rate = self._ewma(self._rates, key, tokens / seconds)
+            self._ewma(self._tokens, key, float(tokens))
+        TOKENS_PER_SECOND.set(round(rate, 2), backend=backend, model=model)
+
+    def tokens_per_second(self, backend: str, model: str) -> Optional[float]:
+        return self._rates.get((backend, model))
+
+    def generation_seconds(self, backend: str, model: str) -> Optional[float]:
+        """Durée de génération attendue : tokens moyens / débit moyen"""
+        key = (backend, model)
+        rate, tokens = self._rates.get(key), self._tokens.get(key)
+        if not rate or tokens is None:
+            return None
+        return tokens / rate
+
+
+def parse_ladders(value: str) -> List[List[Rung]]:
+    ladders = []
+    for ladder in value.split(";"):
+        rungs = []
+        for rung in ladder.split(">"):
+            model, _, mode = rung.strip().partition("@")
+            if model:
+                rungs.append((model, mode or None))
+        if len(rungs) > 1:
+            ladders.append(rungs)
+    return ladders
+
+
+class Choice:
+    """Modèle retenu pour une requête, et rapport de dégradation éventuel"""
+
+    __slots__ = ("model", "mode", "report")
+
+    def __init__(self, model: Optional[str], mode: str, report: Optional[Dict] = None):
+        self.model = model
+        self.mode = mode
+        self.report = report
+
+
+class DegradationLadder:
+    """Choix du modèle servi au vu de l'objectif de latence de la requête"""
+
+    def __init__(self, ladders: List[List[Rung]], tracker: ThroughputTracker):
+        self.ladders = ladders
+        self.tracker = tracker
+
+    def rungs_below(self, model: Optional[str]) -> List[Rung]:
+        """Barreaux sous `model` dans la première échelle qui le contient"""
+        for ladder in self.ladders:
+            for index, (name, _) in enumerate(ladder):
+                if name == model:
+                    return ladder[index + 1:]
+        return []
+
+    def predict(self, backend, model: Optional[str], priority: str,
+                measured_only: bool = False) -> Optional[float]:
+        """
+        Attente en file + génération prévues (s), None sans aucune observation.
+        `measured_only` : sans débit observé pour ce modèle, pas de repli sur
+        la durée moyenne d'un appel du backend (tous modèles confondus).
+        """
+        scheduler = backend.scheduler
+        generation = self.tracker.generation_seconds(backend.name, model)
+        if generation is None and not measured_only:
+            generation = scheduler.service_time
+        if not generation:
+            return None
+        return scheduler.estimated_wait(priority) + generation
+
+    def choose(self, mode: str, model: Optional[str], priority: str, slo: Optional[float],
+               resolve: Callable) -> Choice:
+        """
+        Modèle demandé si sa prévision tient `slo`, sinon premier barreau qui
+        la tient, sinon barreau le plus rapide. `resolve(mode, model)` donne
+        le backend d'un barreau.
+        """
+        if slo is None:
+            return Choice(model, mode)
+        requested = self.predict(resolve(mode, model), model, priority)
+        if requested is None or requested <= slo:
+            return Choice(model, mode)
+
+        predictions = {model: round(requested, 2)}
+        best: Tuple[float, Optional[str], str] = (requested, model, mode)
+        chosen = None
+        for rung_model, rung_mode in self.rungs_below(model):
+            rung_mode = rung_mode or mode
+            try:
+                backend = resolve(rung_mode, rung_model)
+            except UnknownBackend:
+                continue
+            # Un barreau jamais mesuré est inconnu : la moyenne du backend ne dit
+            # rien de sa vitesse, il n'est pas choisi sur cette base
+            predicted = self.predict(backend, rung_model, priority, measured_only=True)
+            if predicted is None:
+                continue
+            predictions[rung_model] = round(predicted, 2)
+            if predicted <= slo:
+                chosen = (predicted, rung_model, rung_mode)
+                break
+            if predicted < best[0]:
+                best = (predicted, rung_model, rung_mode)
+        predicted, served_model, served_mode = chosen or best
+        if served_model == model and served_mode == mode:
+            return Choice(model, mode, {
+                "requested_model": model,
+                "requested_mode": mode,
+                "reason": f"predicted {requested:.1f}s exceeds latency SLO {slo:g}s, no faster model in ladder",
+                "predicted_seconds": predictions,
+            })
+
+        DEGRADATIONS.inc(requested=str(model), served=str(served_model))
+        reason = f"predicted {requested:.1f}s for {model} exceeds latency SLO {slo:g}s"
+        if chosen is None:
+            reason += f"; {served_model} is the fastest option ({predicted:.1f}s)"
+        return Choice(served_model, served_mode, {
+            "requested_model": model,
+            "requested_mode": mode,
+            "reason": reason,
+            "predicted_seconds": predictions,
+        })
+
+
+throughput = ThroughputTracker()
+
+ladder = DegradationLadder(parse_ladders(os.getenv("DEGRADATION_LADDERS", "")), throughput)
@@ -0,0 +1,185 @@
+"""
+Prompt2Prod - Arrêt progressif (drainage) pendant les déploiements
+
+Une génération peut durer plusieurs minutes : tuer le pod au SIGTERM
+gaspille le travail en cours, que les clients relancent ailleurs depuis le
+début. Au SIGTERM :
+1. `/ready` passe à 503 : le pod sort des endpoints du Service
+2. plus aucun nouveau travail n'est admis : /generate, fan-out, tours de
+   session et nouveaux flux WebSocket répondent 503 (`Retry-After`,
+   `Connection: close`) pour être relancés sur un autre pod
+3. le travail en cours dispose de DRAIN_GRACE_SECONDS pour se terminer
+4. au-delà, il est annulé : l'annulation ferme les connexions upstream
+   (la génération s'arrête côté modèle). Une requête HTTP interrompue
+   répond 503 ; un flux WebSocket reçoit un message `interrupted` avec le
+   texte déjà généré (point de reprise pour continuer sur un autre pod)
+5. le signal est rendu au serveur (uvicorn), qui s'arrête normalement
+
+Un second SIGTERM pendant le drainage arrête le serveur sans attendre.
+Le délai de grâce doit rester inférieur à `terminationGracePeriodSeconds`
+du Deployment.
+
+Configuration (variables d'environnement) :
+- DRAIN_GRACE_SECONDS : temps laissé au travail en cours (défaut 300)
+"""
+import asyncio
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Awaitable, Dict, Optional, Set, TypeVar
+
+from src.api.metrics import registry
+
+T = TypeVar("T")
+
+logger = logging.getLogger("prompt2prod.draining")
+
+DRAINING = registry.gauge(
+    "prompt2prod_draining", "1 pendant l'arrêt progressif du pod",
+)
+INTERRUPTED = registry.counter(
+    "prompt2prod_drain_interrupted_total", "Travaux annulés faute de temps pendant l'arrêt", ["kind"],
+)
+REJECTED = registry.counter(
+    "prompt2prod_drain_rejected_total", "Requêtes refusées pendant l'arrêt", ["kind"],
+)
+
+
+class ServerDraining(Exception):
+    """Le pod s'arrête : travail refusé, ou interrompu à la fin du délai de grâce"""
+
+    def __init__(self, interrupted: bool = False):
+        self.interrupted = interrupted
+        super().__init__("Server shutting down, retry on another instance")
+
+
+class Drainer:
+    """Admission et suivi du travail en cours, drainage borné au SIGTERM"""
+
+    def __init__(self, grace_seconds: float = 300.0):
+        self.grace_seconds = grace_seconds
+        self.draining = False
+        self.started_at: Optional[float] = None
+        self._work: Dict[asyncio.Task, str] = {}
+        self._interrupted: Set[asyncio.Task] = set()
+        self._drain_task: Optional[asyncio.Task] = None
+        self._handed_over = False
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._work)
+
+    def admit(self, kind: str = "generate") -> None:
+        """Lève ServerDraining si le pod ne prend plus de nouveau travail"""
+        if self.draining:
+            REJECTED.inc(kind=kind)
+            raise ServerDraining()
+
+    def register(self, task: asyncio.Task, kind: str = "generate") -> None:
+        self._work[task] = kind
+
+    def release(self, task: asyncio.Task) -> None:
+        self._work.pop(task, None)
+        self._interrupted.discard(task)
+
+    def interrupted(self, task: Optional[asyncio.Task]) -> bool:
+        """`task` a-t-elle été annulée par le drainage ?"""
+        return task in self._interrupted
+
+    async def run(self, work: Awaitable[T], kind: str = "generate") -> T:
+        """
+        Exécute `work` comme travail en cours : refusé pendant le drainage,
+        attendu jusqu'à la fin du délai de grâce, sinon annulé (ServerDraining).
+        """
+        try:
+            self.admit(kind)
+        except ServerDraining:
+            if asyncio.iscoroutine(work):
+                work.close()
+            raise
+        task = asyncio.ensure_future(work)
+        self.register(task, kind)
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if self.interrupted(task):
+                raise ServerDraining(interrupted=True)
+            raise
+        finally:
+            self.release(task)
+
+    def begin(self) -> None:
+        """Passe en drainage : readiness à faux, plus d'admission"""
+        if not self.draining:
+            self.draining = True
+            self.started_at = time.monotonic()
+            DRAINING.set(1)
+            logger.warning("Draining: %d requests in flight, grace %.0fs", self.in_flight, self.grace_seconds)
+
+    async def drain(self) -> int:
+        """Attend le travail en cours dans le délai de grâce, annule le reste ; retourne le nombre annulé"""
+        self.begin()
+        remaining = self.grace_seconds - (time.monotonic() - self.started_at)
+        pending = set(self._work)
+        if pending and remaining > 0:
+            _, pending = await asyncio.wait(pending, timeout=remaining)
+        pending = {task for task in pending if not task.done()}
+        for task in pending:
+            kind = self._work.get(task, "generate")
+            INTERRUPTED.inc(kind=kind)
+            self._interrupted.add(task)
+            task.cancel()
+        if pending:
+            logger.warning("Grace period over: cancelled %d requests", len(pending))
+            await asyncio.gather(*pending, return_exceptions=True)
+        return len(pending)
+
+    # ------------------------------------------------------------------
+    # Signal
+    # ------------------------------------------------------------------
+
+    def install_signal_handler(self) -> bool:
+        """
+        Intercepte SIGTERM (thread principal seulement) : drainage, puis
+        signal rendu au handler précédent (arrêt normal du serveur).
+        """
+        if threading.current_thread() is not threading.main_thread():
+            return False
+        loop = asyncio.get_running_loop()
+        previous = signal.getsignal(signal.SIGTERM)
+
+        def on_sigterm(signum, frame):
+            loop.call_soon_threadsafe(self._on_sigterm, previous)
+
+        signal.signal(signal.SIGTERM, on_sigterm)
+        return True
+
+    def _on_sigterm(self, previous) -> None:
+        if self._drain_task is not None:
+            logger.warning("Second SIGTERM: cancelling %d requests and stopping", self.in_flight)
+            self._drain_task.cancel()
+            for task in list(self._work):
+                self._interrupted.add(task)
+                task.cancel()
+            self._hand_over(previous)
+            return
+        self._drain_task = asyncio.get_running_loop().create_task(self._drain_then_stop(previous))
+
+    async def _drain_then_stop(self, previous) -> None:
+        try:
+            await self.drain()
+        finally:
+            self._hand_over(previous)
+
+    def _hand_over(self, previous) -> None:
+        """Rend SIGTERM au handler précédent (uvicorn : arrêt du serveur), une seule fois"""
+        if self._handed_over:
+            return
+        self._handed_over = True
+        signal.signal(signal.SIGTERM, previous)
+        signal.raise_signal(signal.SIGTERM)
+
+
+drainer = Drainer(grace_seconds=float(os.getenv("DRAIN_GRACE_SECONDS", "300")))
@@ -0,0 +1,117 @@
+"""
+Prompt2Prod - Fan-out multi-modèles
+
+Exécute le même prompt sur plusieurs couples (modèle, mode) en parallèle,
+avec un plafond de concurrence et une deadline globale.
+
+- `first` : renvoie la première réponse réussie et annule les autres appels
+- `all`   : produit chaque résultat dès qu'il est disponible
+"""
+import asyncio
+import time
+from dataclasses import asdict, dataclass
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple
+
+# call(index) -> (texte, provider)
+FanoutCall = Callable[[int], Awaitable[Tuple[str, str]]]
+
+
+@dataclass
+class FanoutResult:
+    """Résultat d'un appel du fan-out"""
+    index: int
+    model: Optional[str]
+    mode: str
+    ok: bool
+    response: Optional[str] = None
+    provider: Optional[str] = None
+    latency_ms: float = 0.0
+    elapsed_ms: float = 0.0
+    error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class Fanout:
+    """Orchestration d'un fan-out : cibles, plafond de concurrence, deadline"""
+
+    def __init__(self, targets: List[Tuple[Optional[str], str]], call: FanoutCall,
+                 max_concurrency: int, deadline_seconds: float):
+        self.targets = targets
+        self.call = call
+        self.semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.deadline_seconds = deadline_seconds
+        self.started = time.perf_counter()
+
+    def elapsed_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    async def _run_one(self, index: int) -> FanoutResult:
+        model, mode = self.targets[index]
+        async with self.semaphore:
+            t0 = time.perf_counter()
+            try:
+                text, provider = await self.call(index)
+                ok, error = True, None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                text, provider, ok = None, None, False
+                error = f"{type(e).__name__}: {getattr(e, 'detail', None) or e}"
+            latency = round((time.perf_counter() - t0) * 1000, 1)
+        return FanoutResult(index, model, mode, ok, text, provider, latency, self.elapsed_ms(), error)
+
+    def _timeout_result(self, index: int) -> FanoutResult:
+        model, mode = self.targets[index]
+        return FanoutResult(index, model, mode, False, elapsed_ms=self.elapsed_ms(),
+                            error="Deadline exceeded")
+
+    async def first(self) -> Tuple[Optional[FanoutResult], List[FanoutResult]]:
+        """
+        Attend la première réponse réussie puis annule les appels restants.
+
+        Retourne (gagnant ou None, échecs observés avant la fin).
+        """
+        tasks = {asyncio.create_task(self._run_one(i)): i for i in range(len(self.targets))}
+        failures: List[FanoutResult] = []
+        deadline = self.started + self.deadline_seconds
+        try:
+            pending = set(tasks)
+            while pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    result = task.result()
+                    if result.ok:
+                        return result, failures
+                    failures.append(result)
+            failures.extend(self._timeout_result(tasks[t]) for t in pending)
+            return None, failures
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def all(self) -> AsyncIterator[FanoutResult]:
+        """Produit chaque résultat dans l'ordre de complétion, jusqu'à la deadline"""
+        tasks = {asyncio.create_task(self._run_one(i)): i for i in range(len(self.targets))}
+        deadline = self.started + self.deadline_seconds
+        try:
+            pending = set(tasks)
+            while pending:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+            for task in pending:
+                yield self._timeout_result(tasks[task])
+        finally:
+            # Également atteint si le client se déconnecte en cours de stream
+            for task in tasks:
+                task.cancel()
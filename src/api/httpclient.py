@@ -0,0 +1,66 @@
+"""
+Prompt2Prod - Clients httpx réutilisés
+
+Construire un `httpx.AsyncClient` charge les certificats du système dans
+un contexte SSL : ~50 ms de CPU synchrone. Fait sur la boucle (première
+requête, sonde, rafraîchissement périodique), cela retarde toutes les
+requêtes du pod. D'où :
+- un contexte SSL unique, construit à l'import (avant que la boucle ne
+  tourne) et partagé par tous les clients
+- `LoopClient` : un client long, ouvert au démarrage (lifespan) et
+  réutilisé ensuite ; un pool httpx est lié à sa boucle, il est donc
+  reconstruit (sans coût SSL) si une autre boucle s'en sert, et l'ancien
+  pool est fermé
+"""
+import asyncio
+import logging
+from typing import Any, Optional, Set
+
+import httpx
+
+logger = logging.getLogger("prompt2prod.httpclient")
+
+SSL_CONTEXT = httpx.create_ssl_context()
+
+
+async def _aclose_quietly(client: httpx.AsyncClient) -> None:
+    try:
+        await client.aclose()
+    except Exception as e:
+        logger.debug("Closing stale HTTP pool failed: %s", e)
+
+
+class LoopClient:
+    """Client httpx réutilisé, lié à la boucle qui s'en sert"""
+
+    def __init__(self, **options: Any):
+        self.options = options
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._closing: Set[asyncio.Task] = set()
+
+    def get(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                self._close_stale(self._client, self._loop, loop)
+            self._client = httpx.AsyncClient(verify=SSL_CONTEXT, **self.options)
+            self._loop = loop
+        return self._client
+
+    def _close_stale(self, client: httpx.AsyncClient, old_loop: asyncio.AbstractEventLoop,
+                     loop: asyncio.AbstractEventLoop) -> None:
+        """Ferme le pool d'une boucle précédente : sur celle-ci si elle tourne encore, sinon ici"""
+        if old_loop.is_running():
+            asyncio.run_coroutine_threadsafe(_aclose_quietly(client), old_loop)
+            return
+        task = loop.create_task(_aclose_quietly(client))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    async def aclose(self) -> None:
+        if self._closing:
+            await asyncio.gather(*self._closing)
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = self._loop = None
@@ -0,0 +1,181 @@
+"""
+Prompt2Prod - Clés d'idempotence pour /generate
+
+Un client qui ré-essaie après un timeout envoie le même header
+`Idempotency-Key` : la génération n'est faite qu'une fois.
+- première requête avec la clé : elle fait le travail, la réponse est conservée
+- doublons concurrents : ils attendent la première et reçoivent sa réponse
+- ré-essais ultérieurs (dans IDEMPOTENCY_TTL_SECONDS) : réponse conservée,
+  sans appel upstream
+- même clé avec un corps différent : refus (IdempotencyConflict)
+
+L'empreinte couvre aussi ce qui, hors du corps, change le traitement ou la
+réponse (priorité, timeout, format négocié) : une clé rejouée avec d'autres
+headers est un conflit, pas un rejeu. La réponse est conservée telle
+qu'envoyée à la première requête, avec son type de contenu (JSON ou
+MessagePack), et rejouée sans re-sérialisation.
+
+Seules les réponses réussies sont conservées : si la première requête
+échoue (erreur upstream, déconnexion du client...), la clé est libérée et
+un doublon en attente reprend le travail. Les clés sont propres à chaque
+client (clé API, sinon IP). Les réponses sont conservées compressées et
+évincées par ancienneté au-delà de IDEMPOTENCY_MAX_BYTES.
+
+Configuration (variables d'environnement) :
+- IDEMPOTENCY_TTL_SECONDS   : durée de conservation d'une réponse (défaut 3600)
+- IDEMPOTENCY_MAX_BYTES     : budget mémoire des réponses conservées (défaut 64 Mo)
+- IDEMPOTENCY_MAX_KEY_LENGTH : longueur maximale d'une clé (défaut 255)
+"""
+import asyncio
+import hashlib
+import os
+import time
+import zlib
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from src.api.metrics import registry
+
+# Au-delà de cette taille, la réponse est conservée compressée
+COMPRESS_THRESHOLD = 1024
+# Coût fixe estimé d'un enregistrement (clés, objets Python)
+RECORD_OVERHEAD = 256
+
+REQUESTS = registry.counter(
+    "prompt2prod_idempotency_requests_total", "Requêtes portant une clé d'idempotence",
+    ["outcome"],  # executed, replayed, joined, conflict
+)
+STORED_BYTES = registry.gauge(
+    "prompt2prod_idempotency_stored_bytes", "Mémoire occupée par les réponses conservées",
+)
+
+Scope = Tuple[str, str]  # (client, clé)
+Payload = Tuple[bytes, str]  # (corps, type de contenu)
+
+
+class IdempotencyConflict(Exception):
+    """Clé déjà utilisée par ce client pour un autre corps de requête"""
+
+
+def fingerprint(body: str, *context: Optional[str]) -> str:
+    """Empreinte du corps et du contexte de la requête (headers, format négocié)"""
+    digest = hashlib.sha256(body.encode("utf-8"))
+    for value in context:
+        digest.update(b"\0" + (value or "").encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _Record:
+    """Réponse conservée (compressée au-delà de COMPRESS_THRESHOLD)"""
+
+    __slots__ = ("fingerprint", "media_type", "_data", "compressed", "size", "stored_at")
+
+    def __init__(self, fingerprint: str, body: bytes, media_type: str, stored_at: float):
+        self.fingerprint = fingerprint
+        self.media_type = media_type
+        self.compressed = len(body) > COMPRESS_THRESHOLD
+        self._data = zlib.compress(body) if self.compressed else body
+        self.size = len(self._data) + RECORD_OVERHEAD
+        self.stored_at = stored_at
+
+    @property
+    def payload(self) -> Payload:
+        return zlib.decompress(self._data) if self.compressed else self._data, self.media_type
+
+
+class _Pending:
+    """Exécution en cours : les doublons attendent `done` (corps et type, ou None si échec)"""
+
+    __slots__ = ("fingerprint", "done")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class IdempotencyStore:
+    """Réponses par (client, clé), évincées par ancienneté et par budget mémoire"""
+
+    def __init__(self, ttl_seconds: float = 3600.0, max_bytes: int = 64 * 1024 * 1024,
+                 max_key_length: int = 255):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_key_length = max_key_length
+        self._records: "OrderedDict[Scope, _Record]" = OrderedDict()
+        self._pending: Dict[Scope, _Pending] = {}
+        self.stored_bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def valid_key(self, key: str) -> bool:
+        return 0 < len(key) <= self.max_key_length and key.isprintable()
+
+    def _evict(self, now: float) -> None:
+        records = self._records
+        while records:
+            oldest = next(iter(records.values()))
+            if self.stored_bytes > self.max_bytes or now - oldest.stored_at > self.ttl_seconds:
+                records.popitem(last=False)
+                self.stored_bytes -= oldest.size
+            else:
+                break
+        STORED_BYTES.set(self.stored_bytes)
+
+    def _store(self, scope: Scope, record: _Record) -> None:
+        if record.size > self.max_bytes:
+            return
+        self._records[scope] = record
+        self.stored_bytes += record.size
+        self._evict(record.stored_at)
+
+    async def execute(self, client: str, key: str, body_fingerprint: str,
+                      work: Callable[[], Awaitable[Payload]]) -> Tuple[Payload, bool]:
+        """
+        Corps et type de contenu de la réponse pour (client, clé), et True
+        s'ils sont rejoués.
+
+        `work()` n'est appelée que si aucune réponse n'est conservée ni en
+        cours pour la clé. Lève IdempotencyConflict si la clé a été utilisée
+        avec une autre empreinte de corps.
+        """
+        scope = (client, key)
+        while True:
+            self._evict(time.monotonic())
+            record = self._records.get(scope)
+            pending = self._pending.get(scope)
+            current = record or pending
+            if current is not None and current.fingerprint != body_fingerprint:
+                REQUESTS.inc(outcome="conflict")
+                raise IdempotencyConflict(
+                    "Idempotency-Key already used with a different request body or headers"
+                )
+            if record is not None:
+                REQUESTS.inc(outcome="replayed")
+                return record.payload, True
+            if pending is None:
+                break
+            # Doublon concurrent : l'annulation de l'attente n'annule pas l'exécution
+            payload = await asyncio.shield(pending.done)
+            if payload is not None:
+                REQUESTS.inc(outcome="joined")
+                return payload, True
+            # Échec de la première exécution : on reprend la main
+
+        pending = self._pending[scope] = _Pending(body_fingerprint)
+        payload = None
+        try:
+            payload = await work()
+            REQUESTS.inc(outcome="executed")
+            self._store(scope, _Record(body_fingerprint, *payload, time.monotonic()))
+            return payload, False
+        finally:
+            del self._pending[scope]
+            pending.done.set_result(payload)
+
+
+idempotency = IdempotencyStore(
+    ttl_seconds=float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "3600")),
+    max_bytes=int(os.getenv("IDEMPOTENCY_MAX_BYTES", str(64 * 1024 * 1024))),
+    max_key_length=int(os.getenv("IDEMPOTENCY_MAX_KEY_LENGTH", "255")),
+)
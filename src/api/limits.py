@@ -0,0 +1,141 @@
+"""
+Prompt2Prod - Limites de taille des corps HTTP
+
+Mémoire bornée de bout en bout (pod limité à 512Mi) :
+- réponses upstream lues en streaming avec un plafond : la lecture est
+  interrompue (connexion fermée) dès qu'il est dépassé
+- corps des requêtes entrantes plafonnés par un middleware ASGI : refus
+  immédiat sur Content-Length, sinon dès que les octets reçus dépassent
+  la limite, avant validation
+
+Configuration (variables d'environnement) :
+- MAX_UPSTREAM_BODY_BYTES : taille maximale d'une réponse upstream (défaut 8 Mio)
+- MAX_REQUEST_BODY_BYTES  : taille maximale d'un corps de requête (défaut 1 Mio)
+"""
+import json
+import os
+from typing import Optional
+
+import httpx
+from fastapi import HTTPException
+
+MAX_UPSTREAM_BODY_BYTES = int(os.getenv("MAX_UPSTREAM_BODY_BYTES", str(8 * 1024 * 1024)))
+MAX_REQUEST_BODY_BYTES = int(os.getenv("MAX_REQUEST_BODY_BYTES", str(1024 * 1024)))
+
+
+class UpstreamBodyTooLarge(Exception):
+    """La réponse upstream dépasse MAX_UPSTREAM_BODY_BYTES"""
+
+    def __init__(self, limit: int):
+        super().__init__(f"Upstream response exceeds {limit} bytes")
+        self.limit = limit
+
+
+class RequestBodyTooLarge(HTTPException):
+    """Corps de requête au-delà de la limite (HTTPException : FastAPI la relaie telle quelle)"""
+
+    def __init__(self, limit: int):
+        super().__init__(status_code=413, detail=f"Request body exceeds {limit} bytes")
+
+
+def _check_declared_length(headers, limit: int) -> None:
+    declared = headers.get("content-length")
+    if declared is not None and declared.isdigit() and int(declared) > limit:
+        raise UpstreamBodyTooLarge(limit)
+
+
+async def read_bounded(response: httpx.Response, limit: Optional[int] = None) -> bytes:
+    """Lit le corps d'une réponse en streaming, en s'arrêtant au-delà de `limit` octets"""
+    limit = limit or MAX_UPSTREAM_BODY_BYTES
+    _check_declared_length(response.headers, limit)
+    buffer = bytearray()
+    async for chunk in response.aiter_bytes():
+        buffer += chunk
+        if len(buffer) > limit:
+            raise UpstreamBodyTooLarge(limit)
+    return bytes(buffer)
+
+
+async def read_json_bounded(response: httpx.Response, limit: Optional[int] = None):
+    """
+    Corps JSON d'une réponse upstream, lu avec plafond.
+
+    Une réponse en erreur lève httpx.HTTPStatusError avec le corps (borné)
+    attaché, comme `raise_for_status` après une lecture complète.
+    """
+    body = await read_bounded(response, limit)
+    if response.status_code >= 400:
+        error_response = httpx.Response(
+            response.status_code, headers=response.headers, content=body, request=response.request,
+        )
+        raise httpx.HTTPStatusError(
+            f"Upstream returned {response.status_code}", request=response.request, response=error_response,
+        )
+    return json.loads(body)
+
+
+async def iter_lines_bounded(response: httpx.Response, limit: Optional[int] = None):
+    """Lignes d'une réponse streaming, avec plafond sur le volume total reçu"""
+    limit = limit or MAX_UPSTREAM_BODY_BYTES
+    received = 0
+    async for line in response.aiter_lines():
+        received += len(line) + 1
+        if received > limit:
+            raise UpstreamBodyTooLarge(limit)
+        yield line
+
+
+class BodySizeLimitMiddleware:
+    """Middleware ASGI : 413 pour les corps de requête au-delà de `max_bytes`"""
+
+    def __init__(self, app, max_bytes: int = MAX_REQUEST_BODY_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def _reject(self, send) -> None:
+        body = json.dumps({"detail": f"Request body exceeds {self.max_bytes} bytes"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json"),
+                        (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            await self.app(scope, receive, send)
+            return
+
+        for name, value in scope.get("headers", []):
+            if name == b"content-length":
+                if value.isdigit() and int(value) > self.max_bytes:
+                    await self._reject(send)
+                    return
+                break
+
+        received = 0
+        response_started = False
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    raise RequestBodyTooLarge(self.max_bytes)
+            return message
+
+        async def tracking_send(message):
+            nonlocal response_started
+            if message["type"] == "http.response.start":
+                response_started = True
+            await send(message)
+
+        try:
+            await self.app(scope, limited_receive, tracking_send)
+        except RequestBodyTooLarge:
+            # Corps lu hors du parsing FastAPI (qui convertit déjà l'exception en 413)
+            if response_started:
+                raise
+            await self._reject(send)
@@ -0,0 +1,38 @@
+"""
+Prompt2Prod - Journalisation hors de la boucle d'événements
+
+Les handlers n'écrivent pas directement sur stderr : les enregistrements
+passent par une file (QueueHandler) et un thread (QueueListener) se charge
+du formatage et de l'écriture. Un terminal ou un collecteur de logs lent
+ne bloque donc pas la boucle asyncio.
+
+Configuration (variables d'environnement) :
+- LOG_LEVEL : niveau des logs `prompt2prod.*` (défaut INFO ; DEBUG pour le détail des appels upstream)
+"""
+import atexit
+import logging
+import logging.handlers
+import os
+import queue
+from typing import Optional
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def setup_logging(level: Optional[str] = None) -> None:
+    """Branche le logger `prompt2prod` sur une file vidée par un thread (idempotent)"""
+    global _listener
+    logger = logging.getLogger("prompt2prod")
+    logger.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    if _listener is not None:
+        return
+    records: queue.SimpleQueue = queue.SimpleQueue()
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    _listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    _listener.start()
+    logger.addHandler(logging.handlers.QueueHandler(records))
+    logger.propagate = False
+    atexit.register(_listener.stop)
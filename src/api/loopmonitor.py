@@ -0,0 +1,246 @@
+"""
+Prompt2Prod - Surveillance de la boucle d'événements
+
+Tout appel synchrone long (CPU, I/O bloquante, `print` sur un terminal
+lent...) sur la boucle asyncio retarde toutes les requêtes du pod. Ce
+module le rend visible :
+- latence d'ordonnancement : une sonde se réveille à intervalle fixe et
+  mesure son retard, exporté en histogramme
+- détection des blocages : un thread chien de garde repère une boucle qui
+  ne répond plus au-delà du seuil et relève la pile du thread de la boucle
+  (l'endroit exact du blocage)
+- rapports limités : un même emplacement n'est journalisé qu'une fois par
+  LOOP_MONITOR_REPORT_SECONDS
+
+Mode strict (dev/tests, LOOP_MONITOR_STRICT=1) : chaque callback de la
+boucle est chronométré et tout dépassement est enregistré ; la suite de
+tests échoue si un test en a provoqué (voir tests/conftest.py). Les pauses
+du ramasse-miettes (collectes de génération 2 : plusieurs dizaines de ms)
+sont déduites de la durée du callback qu'elles interrompent : elles ne
+disent rien du code exécuté.
+
+Configuration (variables d'environnement) :
+- LOOP_MONITOR_INTERVAL_MS   : période de la sonde de latence (défaut 100)
+- LOOP_BLOCK_THRESHOLD_MS    : durée au-delà de laquelle un callback bloque (défaut 100)
+- LOOP_MONITOR_REPORT_SECONDS : intervalle minimal entre deux rapports d'un même emplacement (défaut 60)
+- LOOP_MONITOR_STRICT        : chronométrage de chaque callback (défaut 0)
+"""
+import asyncio
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from src.api.metrics import registry
+
+logger = logging.getLogger("prompt2prod.loop")
+
+# Latences attendues bien plus courtes que celles des appels upstream
+LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+LOOP_LAG = registry.histogram(
+    "prompt2prod_event_loop_lag_seconds", "Retard d'ordonnancement de la boucle d'événements",
+    buckets=LAG_BUCKETS,
+)
+LOOP_BLOCKED = registry.counter(
+    "prompt2prod_event_loop_blocked_total", "Callbacks ayant bloqué la boucle au-delà du seuil",
+)
+
+
+class BlockedCall:
+    """Blocage détecté : durée (connue à la fin), emplacement et pile"""
+
+    __slots__ = ("location", "duration", "stack", "detected_at")
+
+    def __init__(self, location: str, duration: float, stack: List[str]):
+        self.location = location
+        self.duration = duration
+        self.stack = stack
+        self.detected_at = time.time()
+
+    def to_dict(self) -> Dict:
+        return {
+            "location": self.location,
+            "duration_ms": round(self.duration * 1000, 1),
+            "stack": self.stack,
+            "detected_at": self.detected_at,
+        }
+
+
+def _describe_callback(handle: asyncio.Handle) -> str:
+    """Emplacement lisible d'un callback : coroutine de la tâche, sinon fonction"""
+    callback = handle._callback
+    task = getattr(callback, "__self__", None)
+    if isinstance(task, asyncio.Task):
+        coro = task.get_coro()
+        frame = getattr(coro, "cr_frame", None)
+        code = getattr(coro, "cr_code", None)
+        if frame is not None:
+            return f"{coro.__qualname__} ({frame.f_code.co_filename}:{frame.f_lineno})"
+        if code is not None:
+            return f"{coro.__qualname__} ({code.co_filename}:{code.co_firstlineno})"
+        return repr(task)
+    return getattr(callback, "__qualname__", repr(callback))
+
+
+class LoopMonitor:
+    """Sonde de latence, chien de garde et registre des blocages"""
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1,
+                 report_interval: float = 60.0, capacity: int = 100):
+        self.interval = interval
+        self.threshold = threshold
+        self.report_interval = report_interval
+        self.blocked: Deque[BlockedCall] = deque(maxlen=capacity)
+        self._last_report: Dict[str, float] = {}
+        self._suppressed: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._probe_task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._beat = 0.0
+        self._loop_thread = 0
+        self._stall: Optional[BlockedCall] = None
+        self._original_run = None
+        self._gc_started = 0.0
+        self._gc_time = 0.0
+
+    # ------------------------------------------------------------------
+    # Enregistrement et rapports
+    # ------------------------------------------------------------------
+
+    def record(self, location: str, duration: float, stack: Optional[List[str]] = None) -> BlockedCall:
+        call = BlockedCall(location, duration, stack or [])
+        with self._lock:
+            self.blocked.append(call)
+        LOOP_BLOCKED.inc()
+        self._report(call)
+        return call
+
+    def _report(self, call: BlockedCall) -> None:
+        now = time.monotonic()
+        with self._lock:
+            last = self._last_report.get(call.location)
+            if last is not None and now - last < self.report_interval:
+                self._suppressed[call.location] = self._suppressed.get(call.location, 0) + 1
+                return
+            self._last_report[call.location] = now
+            suppressed = self._suppressed.pop(call.location, 0)
+        logger.warning(
+            "Event loop blocked for %.0f ms at %s%s", call.duration * 1000, call.location,
+            f" ({suppressed} similar reports suppressed)" if suppressed else "",
+        )
+
+    def clear(self) -> None:
+        with self._lock:
+            self.blocked.clear()
+            self._last_report.clear()
+            self._suppressed.clear()
+
+    # ------------------------------------------------------------------
+    # Sonde de latence + chien de garde (production)
+    # ------------------------------------------------------------------
+
+    async def _probe(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            self._beat = time.monotonic()
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            LOOP_LAG.observe(lag)
+            stall = self._stall
+            if stall is not None:
+                # Fin du blocage : durée réelle connue
+                stall.duration = lag
+                self._stall = None
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.threshold / 2):
+            beat = self._beat
+            if not beat or self._stall is not None:
+                continue
+            stalled = time.monotonic() - beat - self.interval
+            if stalled < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.format_list(traceback.extract_stack(frame))
+            summary = traceback.extract_stack(frame, limit=1)
+            location = f"{summary[-1].filename}:{summary[-1].lineno} in {summary[-1].name}" if summary else "?"
+            self._stall = self.record(location, stalled, [line.rstrip() for line in stack[-15:]])
+
+    def start(self) -> None:
+        """Démarre la sonde sur la boucle courante et le chien de garde"""
+        if self._probe_task is not None and not self._probe_task.done():
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._probe_task = asyncio.get_running_loop().create_task(self._probe())
+        self._watchdog = threading.Thread(target=self._watch, name="prompt2prod-loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        self._stop.set()
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            await asyncio.gather(self._probe_task, return_exceptions=True)
+            self._probe_task = None
+
+    # ------------------------------------------------------------------
+    # Mode strict : chronométrage de chaque callback (dev/tests)
+    # ------------------------------------------------------------------
+
+    def _on_gc(self, phase: str, info: Dict) -> None:
+        """Cumule le temps passé dans le ramasse-miettes (gc.callbacks)"""
+        if phase == "start":
+            self._gc_started = time.perf_counter()
+        elif self._gc_started:
+            self._gc_time += time.perf_counter() - self._gc_started
+            self._gc_started = 0.0
+
+    def install_callback_timer(self) -> None:
+        """Chronomètre chaque callback de toutes les boucles (coût : deux lectures d'horloge)"""
+        if self._original_run is not None:
+            return
+        original = self._original_run = asyncio.Handle._run
+        monitor = self
+
+        def _run(handle):
+            started = time.perf_counter()
+            gc_before = monitor._gc_time
+            try:
+                return original(handle)
+            finally:
+                elapsed = time.perf_counter() - started - (monitor._gc_time - gc_before)
+                if elapsed >= monitor.threshold:
+                    monitor.record(_describe_callback(handle), elapsed)
+
+        asyncio.Handle._run = _run
+        gc.callbacks.append(self._on_gc)
+
+    def uninstall_callback_timer(self) -> None:
+        if self._original_run is not None:
+            asyncio.Handle._run = self._original_run
+            self._original_run = None
+            gc.callbacks.remove(self._on_gc)
+
+
+def _flag(name: str) -> bool:
+    return os.getenv(name, "0").lower() in ("1", "true", "yes")
+
+
+STRICT = _flag("LOOP_MONITOR_STRICT")
+
+monitor = LoopMonitor(
+    interval=float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100")) / 1000,
+    threshold=float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000,
+    report_interval=float(os.getenv("LOOP_MONITOR_REPORT_SECONDS", "60")),
+)
@@ -1,12 +1,79 @@
 """
 Prompt2Prod - API principale
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import BackgroundTasks, Depends, FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
+import asyncio
+import contextlib
 import httpx
+import json
+import logging
 import os
-from typing import Optional
+import time
+from typing import List, Literal, Optional, Tuple
+
+from src.api.backends import BACKEND_TYPES, Backend, UnknownBackend, load_backends
+from src.api.balancer import NoReplicaAvailable, balancer
+from src.api.capture import capture
+from src.api.cancellation import CLIENT_CLOSED_REQUEST, ClientDisconnected, cancel_on_disconnect
+from src.api.draining import ServerDraining, drainer
+from src.api.deadline import DeadlineUnreachable, current_deadline, deadline_scope, request_deadline
+from src.api.degradation import ladder, throughput
+from src.api.fanout import Fanout
+from src.api.idempotency import IdempotencyConflict, fingerprint, idempotency
+from src.api.limits import BodySizeLimitMiddleware, UpstreamBodyTooLarge, iter_lines_bounded, read_json_bounded
+from src.api.logs import setup_logging
+from src.api.loopmonitor import STRICT as LOOP_MONITOR_STRICT, monitor as loop_monitor
+from src.api.mapreduce import TooManyChunks, mapreducer
+from src.api.metrics import registry
+from src.api.multiplex import StreamMultiplexer
+from src.api.preprocess import preprocessor
+from src.api.profiling import profiler
+from src.api.ratelimit import enforce_rate_limit, limiter
+from src.api.readiness import readiness
+from src.api.scheduler import DEFAULT_PRIORITY, PRIORITIES
+from src.api.sessions import sessions
+from src.api.shadow import ShadowRule, shadow
+from src.api.tokens import completion_tokens, estimate_tokens, usage_tokens
+from src.api.tracing import TracingMiddleware, tracer
+from src.api.validation import MAX_REPAIRS, repair_prompt, validator
+from src.api import wire
+
+# Logs écrits par un thread dédié : jamais d'I/O bloquante sur la boucle
+setup_logging()
+logger = logging.getLogger("prompt2prod.api")
+
+if LOOP_MONITOR_STRICT:
+    # Dev/tests : chaque callback de la boucle est chronométré
+    loop_monitor.install_callback_timer()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Démarrage/arrêt : sonde de latence et chien de garde de la boucle,
+    drainage au SIGTERM, trafic miroir, pools upstream, capture, traces, pool de validation
+    """
+    loop_monitor.start()
+    drainer.install_signal_handler()
+    backends.open()
+    balancer.open()
+    readiness.open()
+    try:
+        yield
+    finally:
+        await loop_monitor.stop()
+        await shadow.drain(timeout=shadow.drain_seconds)
+        await shadow.aclose()
+        await backends.aclose()
+        await balancer.aclose()
+        await readiness.aclose()
+        capture.close()
+        tracer.shutdown()
+        validator.shutdown()
+
 
 app = FastAPI(
     title="Prompt2Prod API",
@@ -20,8 +87,16 @@ app = FastAPI(
         "name": "MIT License",
         "url": "https://github.com/ClementV78/prompt2prod/blob/main/LICENSE",
     },
+    lifespan=lifespan,
 )
 
+# Corps et réponses MessagePack négociés par Content-Type / Accept (clients internes)
+app.router.route_class = wire.WireRoute
+
+# Taille maximale des corps de requête (413 avant lecture complète) ; ajouté avant CORS
+# pour que les refus portent aussi les headers CORS
+app.add_middleware(BodySizeLimitMiddleware)
+
 # CORS pour development
 app.add_middleware(
     CORSMiddleware,
@@ -30,15 +105,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Tracing distribué : span racine par requête + propagation traceparent
+app.add_middleware(TracingMiddleware)
+
 # Configuration  
 OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434")
-OPENAI_ENDPOINT = "https://api.openai.com/v1/chat/completions"
 KGATEWAY_ENDPOINT = os.getenv("KGATEWAY_ENDPOINT", "http://kgateway:80")
 
+# Backends de génération (routes KGateway par défaut, ou fichier BACKENDS_CONFIG)
+backends = load_backends(os.getenv("BACKENDS_CONFIG"), KGATEWAY_ENDPOINT, OLLAMA_HOST)
+
+# Fenêtre de contexte des sessions : modèles locaux, et plafond global
+SESSION_LOCAL_CONTEXT_TOKENS = int(os.getenv("SESSION_LOCAL_CONTEXT_TOKENS", "4096"))
+SESSION_MAX_CONTEXT_TOKENS = int(os.getenv("SESSION_MAX_CONTEXT_TOKENS", "16000"))
+SESSION_RESPONSE_TOKENS = int(os.getenv("SESSION_RESPONSE_TOKENS", "1024"))
+
+# Limites serveur du fan-out multi-modèles
+FANOUT_MAX_TARGETS = int(os.getenv("FANOUT_MAX_TARGETS", "8"))
+FANOUT_MAX_CONCURRENCY = int(os.getenv("FANOUT_MAX_CONCURRENCY", "4"))
+FANOUT_MAX_DEADLINE_SECONDS = float(os.getenv("FANOUT_MAX_DEADLINE_SECONDS", "180"))
+
+# WebSocket de streaming multiplexé
+WS_MAX_STREAMS = int(os.getenv("WS_MAX_STREAMS", "8"))
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "256"))
+
 class PromptRequest(BaseModel):
     prompt: str = "Create a Python hello world script"
     model: Optional[str] = "gpt-4o-mini"
     mode: Optional[str] = "cloud"  # local (ollama) ou cloud (openai)
+    priority: Optional[str] = None  # interactive ou batch (sinon header X-Priority)
+    validate_code: bool = False  # vérification syntaxique des blocs de code
+    max_repairs: int = Field(0, ge=0)  # re-prompts automatiques si la validation échoue
+    timeout: Optional[float] = Field(None, gt=0)  # deadline en secondes (sinon header X-Request-Timeout)
+    preprocess: Optional[bool] = None  # réduction des tokens du prompt (sinon PREPROCESS_ENABLED)
+    latency_slo: Optional[float] = Field(None, gt=0)  # objectif de latence (s) : modèle plus petit si besoin
+    map_reduce: bool = False  # découpage des prompts surdimensionnés en appels parallèles + fusion
     
     class Config:
         schema_extra = {
@@ -67,6 +168,10 @@ class PromptResponse(BaseModel):
     model: str
     provider: str
     mode: str
+    validation: Optional[dict] = None
+    preprocessing: Optional[dict] = None
+    degradation: Optional[dict] = None
+    map_reduce: Optional[dict] = None
     
     class Config:
         schema_extra = {
@@ -78,6 +183,47 @@ class PromptResponse(BaseModel):
             }
         }
 
+class SessionCreateRequest(BaseModel):
+    model: Optional[str] = "llama3.2:1b"
+    mode: Optional[str] = "local"
+    system: Optional[str] = None
+
+class SessionMessageRequest(BaseModel):
+    prompt: str
+
+class SessionTurnResponse(PromptResponse):
+    session_id: str
+    context_tokens: int
+    history_messages: int
+    dropped_messages: int
+    truncated_prompt: bool = False
+
+class FanoutTarget(BaseModel):
+    model: str
+    mode: Optional[str] = "cloud"
+
+class FanoutRequest(BaseModel):
+    prompt: str
+    targets: List[FanoutTarget] = Field(..., min_length=1)
+    strategy: Literal["first", "all"] = "first"
+    max_concurrency: int = Field(3, ge=1)
+    deadline_seconds: float = Field(60.0, gt=0)
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "prompt": "Create a Python function to parse CSV",
+                "targets": [
+                    {"model": "llama3.2:1b", "mode": "local"},
+                    {"model": "phi3:mini", "mode": "local"},
+                    {"model": "gpt-4o-mini", "mode": "cloud"}
+                ],
+                "strategy": "first",
+                "max_concurrency": 3,
+                "deadline_seconds": 60
+            }
+        }
+
 @app.get("/", tags=["Status"])
 async def root():
     """
@@ -92,12 +238,333 @@ async def health():
     """
     ❤️ **Vérification de santé**
     
-    Endpoint pour les health checks Kubernetes
+    Endpoint pour les health checks Kubernetes (liveness : le process répond)
     """
     return {"status": "healthy"}
 
-@app.post("/generate", response_model=PromptResponse, tags=["Code Generation"])
-async def generate(request: PromptRequest):
+def require_profile_token(x_profile_token: Optional[str]) -> None:
+    """Accès aux profils : jamais sans PROFILING_TOKEN (les piles exposent le code et les prompts)"""
+    if not profiler.enabled or not profiler.token:
+        raise HTTPException(status_code=404, detail="Profiling disabled")
+    if not profiler.authorized(x_profile_token):
+        raise HTTPException(status_code=403, detail="Invalid profile token")
+
+@app.get("/debug/profiles", tags=["Status"], response_class=PlainTextResponse)
+async def debug_profiles(format: Literal["collapsed", "json"] = "collapsed",
+                         x_profile_token: Optional[str] = Header(None)):
+    """
+    🔬 **Profils des requêtes échantillonnées**
+    
+    Format « collapsed stacks » (flamegraph.pl, speedscope), ou résumé
+    JSON avec `?format=json`. Exige `X-Profile-Token` ; indisponible (404)
+    tant que PROFILING_TOKEN n'est pas défini.
+    """
+    require_profile_token(x_profile_token)
+    if format == "json":
+        return JSONResponse([p.summary() for p in profiler.profiles])
+    return PlainTextResponse(profiler.collapsed())
+
+@app.get("/debug/profiles/{profile_id}", tags=["Status"], response_class=PlainTextResponse)
+async def debug_profile(profile_id: int, x_profile_token: Optional[str] = Header(None)):
+    """
+    🔬 **Profil d'une requête** (collapsed stacks)
+    """
+    require_profile_token(x_profile_token)
+    profile = profiler.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profiler.collapsed([profile]))
+
+@app.get("/debug/shadow", tags=["Status"])
+async def debug_shadow():
+    """
+    🪞 **Trafic miroir**
+    
+    Par paire source -> candidat (SHADOW_RULES) : appels rejoués, erreurs,
+    requêtes non rejouées faute de place, latences (moyenne, p50, p95) et
+    tailles de réponse de l'appel principal et du candidat, et ratios
+    candidat / principal.
+    """
+    return shadow.report()
+
+@app.get("/ready", tags=["Status"])
+async def ready():
+    """
+    🚦 **Readiness**
+    
+    503 quand le pod est saturé (appels en cours ou en file au-delà des
+    seuils), quand tous les upstreams sondés sont injoignables, ou pendant
+    l'arrêt progressif du pod (SIGTERM). Les sondes tournent en
+    arrière-plan : cet endpoint ne fait aucun appel réseau.
+    """
+    is_ready, report = readiness.check(backends.schedulers())
+    if drainer.draining:
+        is_ready = False
+        report["status"] = "not_ready"
+        report["reasons"].append(f"shutting down ({drainer.in_flight} requests in flight)")
+    return JSONResponse(report, status_code=200 if is_ready else 503)
+
+@app.get("/metrics", tags=["Status"], response_class=PlainTextResponse)
+async def metrics():
+    """
+    📈 **Métriques Prometheus**
+    
+    Attente en file par backend et classe de priorité, profondeur de file,
+    appels upstream en cours.
+    """
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+def upstream_call_settings(backend: Backend, headers: dict):
+    """Timeouts httpx et headers d'un appel : profil du backend, borné par la deadline courante"""
+    deadline = current_deadline()
+    if deadline is None:
+        return backend.timeout, headers
+    return deadline.upstream_timeout(backend.timeout), {**headers, **deadline.upstream_headers()}
+
+def deadline_guard(backend: Backend, priority: str):
+    """
+    Refus anticipé si la deadline courante ne peut pas être tenue (file et
+    durées observées), puis borne l'attente en file et l'appel à la deadline.
+    """
+    deadline = current_deadline()
+    if deadline is None:
+        return contextlib.nullcontext()
+    deadline.ensure_reachable(backend.scheduler.estimated_latency(priority))
+    return asyncio.timeout(deadline.remaining())
+
+async def _post_upstream(backend: Backend, endpoint: str, payload: dict, headers: dict,
+                         model: Optional[str], mode: str) -> dict:
+    """
+    POST JSON vers l'upstream, avec span de tentative et propagation traceparent.
+    
+    Le corps est lu en streaming avec un plafond (MAX_UPSTREAM_BODY_BYTES) :
+    une réponse démesurée est abandonnée sans être chargée en mémoire.
+    """
+    logger.debug("Making HTTP request to: %s", endpoint)
+    
+    timeout, headers = upstream_call_settings(backend, headers)
+    client = backend.client()
+    try:
+        span_attributes = {
+            "upstream.endpoint": endpoint,
+            "upstream.backend": backend.name,
+            "llm.model": model,
+            "llm.mode": mode,
+        }
+        with tracer.start_span("upstream.attempt", span_attributes) as span:
+            async with client.stream("POST", endpoint, json=payload,
+                                     headers=tracer.inject(headers), timeout=timeout) as response:
+                span.set_attribute("http.status_code", response.status_code)
+                logger.debug("Response received - Status: %s", response.status_code)
+                data = await read_json_bounded(response)
+    except httpx.HTTPStatusError as e:
+        logger.debug("HTTP error %s: %s", e.response.status_code, e.response.text[:500])
+        raise
+    except Exception as e:
+        logger.debug("Request exception: %s: %s", type(e).__name__, e)
+        raise
+    return data
+
+async def call_llm(mode: str, model: Optional[str], messages: list,
+                   extra_payload: Optional[dict] = None, affinity_key: Optional[str] = None,
+                   tenant: str = "", priority: str = DEFAULT_PRIORITY):
+    """
+    Appel upstream, partagé par /generate et les sessions.
+    
+    `mode` désigne le backend (nom, ou type local/cloud, voir
+    `BackendRegistry.resolve`) : son adaptateur construit le payload et lit
+    la réponse, son pool de connexions et ses timeouts servent à l'appel.
+    
+    Pour un backend `balanced` avec plusieurs réplicas Ollama configurés,
+    l'appel va directement au réplica choisi par le load balancer
+    (`affinity_key` garde une session sur le même réplica pour son cache KV).
+    
+    L'appel attend son tour dans l'ordonnanceur du backend (priorité
+    `priority`, équité entre clients `tenant`). La deadline courante (voir
+    `deadline_scope`) borne l'attente et l'appel, et peut refuser d'emblée.
+    
+    Retourne (texte, provider, données brutes). Les erreurs httpx sont
+    propagées telles quelles et converties par `upstream_http_exception`.
+    """
+    backend = backends.resolve(mode, model)
+    endpoint, payload, headers = backend.build_request(model, messages, extra_payload)
+    logger.debug("Backend %s - endpoint: %s", backend.name, endpoint)
+    
+    async with deadline_guard(backend, priority), backend.scheduler.slot(tenant, priority):
+        started = time.monotonic()
+        if backend.balanced and balancer.enabled:
+            async with balancer.acquire(model, affinity_key) as replica:
+                endpoint = backend.replica_endpoint(replica.url)
+                logger.debug("Ollama replica - endpoint: %s", endpoint)
+                data = await _post_upstream(backend, endpoint, payload, headers, model, mode)
+        else:
+            data = await _post_upstream(backend, endpoint, payload, headers, model, mode)
+        elapsed = time.monotonic() - started
+    
+    response_text, provider = backend.parse_response(data)
+    logger.debug("Response format: %s, content length: %s", provider, len(response_text))
+    # Débit observé (prévisions de la dégradation sous charge)
+    generated = completion_tokens(data) or estimate_tokens(response_text)
+    throughput.observe(backend.name, str(model), generated, elapsed)
+    return response_text, provider, data
+
+
+async def _stream_upstream(backend: Backend, endpoint: str, payload: dict, headers: dict,
+                           model: Optional[str], mode: str):
+    """POST en streaming vers l'upstream : produit les fragments au fil de l'eau"""
+    timeout, headers = upstream_call_settings(backend, headers)
+    client = backend.client()
+    span_attributes = {
+        "upstream.endpoint": endpoint,
+        "upstream.backend": backend.name,
+        "llm.model": model,
+        "llm.mode": mode,
+        "llm.stream": True,
+    }
+    with tracer.start_span("upstream.attempt", span_attributes) as span:
+        async with client.stream("POST", endpoint, json=payload,
+                                 headers=tracer.inject(headers), timeout=timeout) as response:
+            span.set_attribute("http.status_code", response.status_code)
+            if response.status_code >= 400:
+                await read_json_bounded(response)
+            async for line in iter_lines_bounded(response):
+                fragment = backend.stream_fragment(line)
+                if fragment:
+                    yield fragment
+
+
+async def stream_llm(mode: str, model: Optional[str], messages: list,
+                     tenant: str = "", priority: str = DEFAULT_PRIORITY,
+                     affinity_key: Optional[str] = None):
+    """
+    Variante streaming de `call_llm` : mêmes ordonnancement et load balancing.
+    
+    Fermer le générateur (annulation) ferme la connexion upstream, ce qui
+    interrompt la génération côté modèle.
+    """
+    backend = backends.resolve(mode, model)
+    endpoint, payload, headers = backend.build_request(model, messages, {"stream": True})
+    
+    async with deadline_guard(backend, priority), backend.scheduler.slot(tenant, priority):
+        if backend.balanced and balancer.enabled:
+            async with balancer.acquire(model, affinity_key) as replica:
+                endpoint = backend.replica_endpoint(replica.url)
+                async for fragment in _stream_upstream(backend, endpoint, payload, headers, model, mode):
+                    yield fragment
+        else:
+            async for fragment in _stream_upstream(backend, endpoint, payload, headers, model, mode):
+                yield fragment
+
+
+def http_exception(e: BaseException) -> HTTPException:
+    """Réponse HTTP correspondant à une erreur d'appel upstream (sans journaliser)"""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, ServerDraining):
+        return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1", "Connection": "close"})
+    if isinstance(e, (ClientDisconnected, asyncio.CancelledError)):
+        return HTTPException(status_code=CLIENT_CLOSED_REQUEST, detail="Client closed request")
+    if isinstance(e, UnknownBackend):
+        return HTTPException(status_code=422, detail=str(e))
+    if isinstance(e, TooManyChunks):
+        return HTTPException(status_code=413, detail=str(e))
+    if isinstance(e, NoReplicaAvailable):
+        return HTTPException(status_code=503, detail="No healthy Ollama replica")
+    if isinstance(e, UpstreamBodyTooLarge):
+        return HTTPException(status_code=502, detail=str(e))
+    if isinstance(e, DeadlineUnreachable):
+        return HTTPException(status_code=503, detail=str(e))
+    if isinstance(e, TimeoutError):
+        return HTTPException(status_code=504, detail="Request deadline exceeded")
+    if isinstance(e, httpx.TimeoutException):
+        return HTTPException(status_code=504, detail="LLM timeout")
+    if isinstance(e, httpx.HTTPStatusError):
+        return HTTPException(status_code=e.response.status_code, detail=f"LLM error: {e.response.text}")
+    return HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+
+
+def upstream_http_exception(e: Exception) -> HTTPException:
+    """Convertit une erreur d'appel upstream en réponse HTTP"""
+    if isinstance(e, httpx.TimeoutException):
+        logger.warning("Upstream timeout: %s", e)
+    elif isinstance(e, httpx.HTTPStatusError):
+        logger.warning("Upstream HTTP error %s: %s", e.response.status_code, e.response.text[:500])
+    exception = http_exception(e)
+    if exception.status_code == 500 and not isinstance(e, (HTTPException, httpx.HTTPStatusError)):
+        logger.error("Unexpected error: %s", e, exc_info=e)
+    return exception
+
+
+async def captured(work, request: PromptRequest, priority: str):
+    """Exécute la génération `work` et l'enregistre dans la capture de trafic"""
+    started_at, started = time.time(), time.perf_counter()
+    status, response = 200, None
+    try:
+        response = await work
+        return response
+    except BaseException as e:
+        status = http_exception(e).status_code
+        raise
+    finally:
+        capture.record(
+            mode=request.mode or "cloud", model=request.model, priority=priority, prompt=request.prompt,
+            status=status, latency=time.perf_counter() - started, started_at=started_at,
+            response_chars=len(response.response) if response is not None else 0,
+            served_model=response.model if response is not None else None,
+        )
+
+
+def shadow_call(rule: ShadowRule, mode: str, messages: list):
+    """Appel miroir vers le candidat de `rule` : priorité batch, tenant `shadow`, réponse jetée"""
+    async def call() -> str:
+        response_text, _, _ = await call_llm(rule.candidate_mode or mode, rule.candidate_model, messages,
+                                             tenant="shadow", priority="batch")
+        return response_text
+    return call
+
+
+async def start_shadows(rules: List[ShadowRule], mode: str, messages: list,
+                        primary_latency: float, primary_chars: int) -> None:
+    """Tâche de fond, après l'envoi de la réponse : lance les appels miroir si le candidat est libre"""
+    for rule in rules:
+        try:
+            scheduler = backends.resolve(rule.candidate_mode or mode, rule.candidate_model).scheduler
+        except UnknownBackend:
+            logger.warning("Shadow rule %s targets unknown mode '%s'", rule.pair, rule.candidate_mode)
+            continue
+        shadow.submit(rule, shadow_call(rule, mode, messages), primary_latency, primary_chars, scheduler)
+
+
+def request_tenant(request: Request) -> str:
+    """Dépendance FastAPI : identifiant du client pour l'équité d'ordonnancement"""
+    return limiter.client_key(request)
+
+
+def resolve_priority(value: Optional[str], header: Optional[str]) -> str:
+    """Classe de priorité : champ de la requête, sinon header X-Priority"""
+    priority = (value or header or DEFAULT_PRIORITY).strip().lower()
+    if priority not in PRIORITIES:
+        expected = ", ".join(PRIORITIES)
+        raise HTTPException(status_code=422, detail=f"Unknown priority '{priority}' (expected one of {expected})")
+    return priority
+
+
+def record_token_usage(client_key: Optional[str], data: dict, prompt_text: str, response_text: str) -> None:
+    """Débite le bucket de tokens du client (usage upstream, sinon estimation)"""
+    if client_key is None:
+        return
+    tokens = usage_tokens(data)
+    if tokens is None:
+        tokens = estimate_tokens(prompt_text) + estimate_tokens(response_text)
+    limiter.record_tokens(client_key, tokens)
+
+@app.post("/generate", response_model=PromptResponse, response_model_exclude_none=True, tags=["Code Generation"])
+async def generate(request: PromptRequest, http_request: Request, background_tasks: BackgroundTasks,
+                   client_key: Optional[str] = Depends(enforce_rate_limit),
+                   tenant: str = Depends(request_tenant), x_priority: Optional[str] = Header(None),
+                   x_request_timeout: Optional[str] = Header(None),
+                   x_profile_token: Optional[str] = Header(None),
+                   idempotency_key: Optional[str] = Header(None)):
     """
     🚀 **Génération de code via IA**
     
@@ -108,6 +575,41 @@ async def generate(request: PromptRequest):
     - `prompt` : Votre demande en langage naturel
     - `model` : Modèle à utiliser (optionnel)
     - `mode` : "local" (Ollama) ou "cloud" (OpenAI)
+    - `priority` : "interactive" (défaut) ou "batch" (ou header `X-Priority`)
+    - `validate_code` : vérifie la syntaxe des blocs de code de la réponse
+    - `max_repairs` : nombre de re-prompts si la validation échoue
+    - `timeout` : deadline en secondes (ou header `X-Request-Timeout`) ; pilote
+      l'attente en file et les timeouts upstream, 503 d'emblée si la file
+      ne permet pas de la tenir, 504 si elle expire
+    - `preprocess` : réduit les tokens du prompt (espaces, blocs dupliqués)
+      avant l'appel ; tokens avant/après dans `preprocessing`
+    - `latency_slo` : objectif de latence (s) ; si le temps prévu (file +
+      débit observé) le dépasse, un modèle plus petit de l'échelle
+      DEGRADATION_LADDERS est servi (`model`, `mode` et `degradation`)
+    - `map_reduce` : un prompt trop long pour le modèle est découpé (par
+      fichier, classe, fonction) en morceaux traités en parallèle, puis
+      fusionnés par un dernier appel (rapport dans `map_reduce`) ; avec
+      `Accept: application/x-ndjson`, l'avancement est streamé
+    
+    Header `X-Profile-Token` : profile la requête (voir `/debug/profiles`).
+    Une fraction des requêtes peut être enregistrée pour rejeu hors ligne
+    (CAPTURE_PATH, CAPTURE_SAMPLE_RATE), ou rejouée vers un modèle
+    candidat après l'envoi de la réponse (SHADOW_RULES, `/debug/shadow`).
+    
+    Header `Idempotency-Key` : un ré-essai avec la même clé (et le même
+    corps) rejoue la réponse de la première requête sans nouvel appel
+    upstream (header `Idempotent-Replayed: true`) ; un doublon concurrent
+    attend la première ; même clé avec un autre corps, une autre priorité,
+    un autre timeout ou un autre format de réponse → 422.
+    
+    Format binaire : corps `Content-Type: application/msgpack` et/ou
+    réponse `Accept: application/msgpack`, même schéma qu'en JSON.
+    
+    Quotas par client (header `X-API-Key`, sinon IP) : requêtes et tokens
+    par minute, refus en 429 avec headers `RateLimit-*` et `Retry-After`.
+    
+    Si le client se déconnecte, l'appel upstream est annulé (la génération
+    s'arrête côté modèle) et son slot est libéré.
     
     **Modes disponibles :**
     - `local` → Ollama via KGateway → llama3.2:1b, mistral:7b-instruct
@@ -119,179 +621,447 @@ async def generate(request: PromptRequest):
     {"prompt": "Explain async/await", "mode": "cloud", "model": "gpt-4o-mini"}
     ```
     """
-    try:
-        mode = request.mode or "cloud"
-        print(f"[DEBUG] Starting generate request - mode: {mode}, model: {request.model}")
+    priority = resolve_priority(request.priority, x_priority)
+    deadline = request_deadline(request.timeout, x_request_timeout)
+    # Avancement map-reduce streamé en NDJSON si le client l'accepte
+    stream_progress = request.map_reduce and "application/x-ndjson" in (http_request.headers.get("accept") or "")
+    events: asyncio.Queue = asyncio.Queue()
+    progress = events.put_nowait if stream_progress else None
+    
+    async def run():
+        choice = ladder.choose(request.mode or "cloud", request.model, priority,
+                               request.latency_slo, backends.resolve)
+        mode, model = choice.mode, choice.model
+        logger.debug("Starting generate request - mode: %s, model: %s", mode, model)
         
-        # Tout passe par KGateway
-        headers = {"Content-Type": "application/json"}
+        prompt, preprocessing = request.prompt, None
+        if preprocessor.active(request.preprocess):
+            result = preprocessor.process(prompt)
+            prompt, preprocessing = result.text, result.to_dict()
         
-        if mode == "local":
-            # KGateway Ollama route: /ollama (format OpenAI)
-            payload = {
-                "model": request.model,
-                "messages": [{"role": "user", "content": request.prompt}],
-                "max_tokens": 4000,
-                "temperature": 0.7,
-                "stream": False
-            }
-            endpoint = f"{KGATEWAY_ENDPOINT}/ollama"
-            print(f"[DEBUG] KGateway Ollama - endpoint: {endpoint}")
+        messages = [{"role": "user", "content": prompt}]
+        plan = None
+        if request.map_reduce:
+            plan = mapreducer.plan(prompt, backends.resolve(mode, model).context_length(model))
+        
+        async def map_call(map_messages: list):
+            text, provider, data = await call_llm(
+                mode, model, map_messages, extra_payload={"max_tokens": mapreducer.response_tokens},
+                tenant=tenant, priority=priority,
+            )
+            record_token_usage(client_key, data, map_messages[-1]["content"], text)
+            return text, provider, data
+        
+        started = time.perf_counter()
+        map_report = None
+        if plan is not None:
+            response_text, provider, map_report = await mapreducer.run(plan, map_call, progress)
         else:
-            # KGateway OpenAI route: /openai
-            payload = {
-                "messages": [{"role": "user", "content": request.prompt}],
-                "model": request.model,
-                "max_tokens": 4000,
-                "temperature": 0.7,
-                "stream": False
-            }
-            endpoint = f"{KGATEWAY_ENDPOINT}/openai"
-            print(f"[DEBUG] KGateway OpenAI - endpoint: {endpoint}")
+            response_text, provider, data = await call_llm(
+                mode, model, messages, tenant=tenant, priority=priority
+            )
+            record_token_usage(client_key, data, prompt, response_text)
+        shadow_rules = shadow.select(model, mode) if plan is None else []
+        if shadow_rules:
+            background_tasks.add_task(start_shadows, shadow_rules, mode, messages,
+                                      time.perf_counter() - started, len(response_text))
         
-        print(f"[DEBUG] Making HTTP request to: {endpoint}")
-        print(f"[DEBUG] Headers: {headers}")
-        print(f"[DEBUG] Payload: {payload}")
+        validation = None
+        if request.validate_code:
+            validation = await validator.validate(response_text)
+            repairs = 0
+            # Map-reduce : pas de re-prompt (il renverrait tout le prompt en un appel)
+            max_repairs = 0 if plan is not None else min(request.max_repairs, MAX_REPAIRS)
+            while not validation["valid"] and repairs < max_repairs:
+                if deadline.remaining() < backends.resolve(mode, model).scheduler.estimated_latency(priority):
+                    # Pas le temps d'un re-prompt : on rend la dernière réponse
+                    validation["deadline_exceeded"] = True
+                    break
+                repairs += 1
+                messages = messages + [
+                    {"role": "assistant", "content": response_text},
+                    {"role": "user", "content": repair_prompt(validation)},
+                ]
+                response_text, provider, data = await call_llm(
+                    mode, model, messages, tenant=tenant, priority=priority
+                )
+                record_token_usage(client_key, data, messages[-1]["content"], response_text)
+                validation = await validator.validate(response_text)
+            validation["repairs"] = repairs
         
-        async with httpx.AsyncClient(timeout=180.0) as client:
-            print(f"[DEBUG] HTTP client created, sending POST request...")
+        logger.debug("Returning response - provider: %s, mode: %s", provider, mode)
+        
+        return PromptResponse(
+            response=response_text,
+            model=model,
+            provider=provider,
+            mode=mode,
+            validation=validation,
+            preprocessing=preprocessing,
+            degradation=choice.report,
+            map_reduce=map_report,
+        )
+    
+    async def execute():
+        work = run()
+        if profiler.sampled(x_profile_token):
+            work = profiler.profiled(work, {"model": request.model, "mode": request.mode or "cloud",
+                                            "prompt_chars": len(request.prompt)})
+        if capture.sampled():
+            work = captured(work, request, priority)
+        return await work
+    
+    as_msgpack = wire.wants_msgpack(http_request)
+    
+    async def execute_serialized() -> Tuple[bytes, str]:
+        # Sérialisé une fois, dans le format négocié, puis conservé tel quel
+        response = await execute()
+        if as_msgpack:
+            return wire.packb(response.model_dump(mode="json", exclude_none=True)), wire.MSGPACK
+        return response.model_dump_json(exclude_none=True).encode(), "application/json"
+    
+    async def progress_stream():
+        with deadline_scope(deadline):
+            task = asyncio.ensure_future(drainer.run(execute()))
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while (event := await events.get()) is not None:
+                yield json.dumps(event) + "\n"
             try:
-                response = await client.post(
-                    endpoint,
-                    json=payload,
-                    headers=headers
-                )
-                print(f"[DEBUG] Response received - Status: {response.status_code}")
-                print(f"[DEBUG] Response headers: {dict(response.headers)}")
-                print(f"[DEBUG] Raw response text: {response.text}")
-                
-                response.raise_for_status()
-                data = response.json()
-                print(f"[DEBUG] Response JSON parsed successfully")
-            except httpx.HTTPStatusError as e:
-                print(f"[DEBUG] HTTP error details:")
-                print(f"[DEBUG]   Status: {e.response.status_code}")
-                print(f"[DEBUG]   Headers: {dict(e.response.headers)}")
-                print(f"[DEBUG]   Body: {e.response.text}")
-                raise
+                response = task.result()
             except Exception as e:
-                print(f"[DEBUG] Request exception: {type(e).__name__}: {e}")
-                raise
-            
-            # Extraction de la réponse (support format Ollama et OpenAI/OpenRouter)
-            print(f"[DEBUG] Response data keys: {list(data.keys())}")
-            
-            if "response" in data:
-                # Format Ollama
-                response_text = data["response"]
-                provider = "ollama"
-                print(f"[DEBUG] Ollama format detected")
-            elif "choices" in data and len(data["choices"]) > 0:
-                # Format OpenAI/OpenRouter
-                choice = data["choices"][0]
-                if "message" in choice:
-                    response_text = choice["message"]["content"]
-                else:
-                    response_text = choice.get("text", "")
-                provider = "openai"
-                print(f"[DEBUG] OpenRouter format detected, content length: {len(response_text)}")
+                error = upstream_http_exception(e)
+                yield json.dumps({"event": "error", "status_code": error.status_code, "detail": error.detail}) + "\n"
             else:
-                response_text = str(data)
-                provider = "unknown"
-                print(f"[DEBUG] Unknown format, data: {data}")
-            
-            print(f"[DEBUG] Returning response - provider: {provider}, mode: {mode}")
-            
-            return PromptResponse(
-                response=response_text,
-                model=request.model,
-                provider=provider,
-                mode=mode
-            )
-            
-    except httpx.TimeoutException as e:
-        print(f"Timeout error: {e}")
-        raise HTTPException(status_code=504, detail="LLM timeout")
-    except httpx.HTTPStatusError as e:
-        print(f"HTTP error: {e.response.status_code} - {e.response.text}")
-        raise HTTPException(status_code=e.response.status_code, detail=f"LLM error: {e.response.text}")
+                yield json.dumps({"event": "result", **response.model_dump(exclude_none=True)}) + "\n"
+        finally:
+            # Déconnexion du client : les appels map/reduce en cours sont annulés
+            task.cancel()
+    
+    if stream_progress:
+        if idempotency_key is not None:
+            raise HTTPException(status_code=422, detail="Idempotency-Key is not supported with streamed progress")
+        try:
+            drainer.admit()
+        except ServerDraining as e:
+            raise upstream_http_exception(e)
+        return StreamingResponse(progress_stream(), media_type="application/x-ndjson")
+    
+    if idempotency_key is not None and not idempotency.valid_key(idempotency_key):
+        raise HTTPException(status_code=422, detail="Invalid Idempotency-Key header")
+    
+    try:
+        with deadline_scope(deadline):
+            if idempotency_key is None:
+                return await cancel_on_disconnect(http_request, drainer.run(execute()))
+            payload, replayed = await cancel_on_disconnect(http_request, drainer.run(idempotency.execute(
+                tenant, idempotency_key,
+                fingerprint(request.model_dump_json(), priority, x_request_timeout,
+                            wire.MSGPACK if as_msgpack else "application/json"),
+                execute_serialized
+            )))
+    except IdempotencyConflict as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
-        print(f"Unexpected error: {str(e)}")
-        import traceback
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Unexpected error: {str(e)}")
+        raise upstream_http_exception(e)
+    headers = {"Idempotent-Replayed": "true"} if replayed else None
+    body, media_type = payload
+    return Response(content=body, media_type=media_type, headers=headers)
+
+@app.post("/generate/fanout", tags=["Code Generation"])
+async def generate_fanout(request: FanoutRequest, http_request: Request,
+                          client_key: Optional[str] = Depends(enforce_rate_limit),
+                          tenant: str = Depends(request_tenant), x_priority: Optional[str] = Header(None),
+                          x_request_timeout: Optional[str] = Header(None)):
+    """
+    🔀 **Fan-out multi-modèles**
+    
+    Exécute le même prompt sur plusieurs modèles en parallèle.
+    
+    **Stratégies :**
+    - `first` : renvoie la réponse réussie la plus rapide et annule les autres
+    - `all` : stream NDJSON, une ligne par modèle dès qu'il a répondu (avec sa
+      latence), puis une ligne finale `{"done": true, ...}` ; avec
+      `Accept: application/msgpack`, objets MessagePack concaténés
+    
+    `max_concurrency` et `deadline_seconds` sont plafonnés par la configuration serveur ;
+    le header `X-Request-Timeout`, s'il est plus court, l'emporte sur `deadline_seconds`.
+    """
+    if len(request.targets) > FANOUT_MAX_TARGETS:
+        raise HTTPException(status_code=422, detail=f"Too many targets (max {FANOUT_MAX_TARGETS})")
+    
+    priority = resolve_priority(None, x_priority)
+    deadline = request_deadline(min(request.deadline_seconds, FANOUT_MAX_DEADLINE_SECONDS))
+    if x_request_timeout is not None:
+        deadline = min(deadline, request_deadline(None, x_request_timeout), key=lambda d: d.seconds)
+    try:
+        drainer.admit("fanout")
+    except ServerDraining as e:
+        raise upstream_http_exception(e)
+    targets = [(t.model, t.mode or "cloud") for t in request.targets]
+    messages = [{"role": "user", "content": request.prompt}]
+    
+    async def call(index: int):
+        model, mode = targets[index]
+        with deadline_scope(deadline):
+            response_text, provider, data = await call_llm(
+                mode, model, messages, tenant=tenant, priority=priority
+            )
+        record_token_usage(client_key, data, request.prompt, response_text)
+        return response_text, provider
+    
+    fanout = Fanout(
+        targets, call,
+        max_concurrency=min(request.max_concurrency, FANOUT_MAX_CONCURRENCY),
+        deadline_seconds=deadline.seconds,
+    )
+    
+    if request.strategy == "first":
+        try:
+            winner, failures = await cancel_on_disconnect(http_request, drainer.run(fanout.first(), "fanout"))
+        except (ClientDisconnected, ServerDraining) as e:
+            raise upstream_http_exception(e)
+        if winner is None:
+            timed_out = any(f.error == "Deadline exceeded" for f in failures)
+            raise HTTPException(
+                status_code=504 if timed_out else 502,
+                detail={"message": "No target succeeded", "failures": [f.to_dict() for f in failures]},
+            )
+        return {**winner.to_dict(), "failures": [f.to_dict() for f in failures]}
+    
+    if wire.wants_msgpack(http_request):
+        encode, media_type = wire.packb, wire.MSGPACK
+    else:
+        encode, media_type = (lambda obj: json.dumps(obj) + "\n"), "application/x-ndjson"
+    
+    async def stream():
+        # Suivi par le drainage : interrompu à la fin du délai de grâce, le flux se termine proprement
+        task = asyncio.current_task()
+        drainer.register(task, "fanout")
+        succeeded = 0
+        try:
+            async for result in fanout.all():
+                succeeded += result.ok
+                yield encode(result.to_dict())
+            yield encode({"done": True, "succeeded": succeeded, "total": len(targets),
+                          "elapsed_ms": fanout.elapsed_ms()})
+        except asyncio.CancelledError:
+            if not drainer.interrupted(task):
+                raise
+            yield encode({"done": True, "interrupted": True, "reason": "server_shutdown",
+                          "succeeded": succeeded, "total": len(targets),
+                          "elapsed_ms": fanout.elapsed_ms()})
+        finally:
+            drainer.release(task)
+    
+    return StreamingResponse(stream(), media_type=media_type)
+
+@app.websocket("/ws/generate")
+async def ws_generate(websocket: WebSocket):
+    """
+    🔌 **Streaming multiplexé (WebSocket)**
+    
+    Plusieurs générations par connexion, identifiées par `id` ; leurs tokens
+    reviennent entrelacés. Annulation par requête (`{"type": "cancel", "id": ...}`)
+    et file d'envoi bornée (un client lent ralentit ses flux au lieu de faire
+    grossir la mémoire du serveur).
+    
+    Sous-protocole `msgpack` : messages MessagePack en trames binaires,
+    même schéma qu'en JSON.
+    """
+    binary = wire.available() and wire.WS_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+    await websocket.accept(subprotocol=wire.WS_SUBPROTOCOL if binary else None)
+    tenant = limiter.client_key(websocket)
+    
+    async def stream(params: dict):
+        priority = resolve_priority(params.get("priority"), None)
+        if limiter.enabled:
+            result = limiter.check(tenant)
+            if result is not None and not result.allowed:
+                raise HTTPException(status_code=429, detail="Rate limit exceeded")
+        prompt = str(params.get("prompt") or "")
+        messages = [{"role": "user", "content": prompt}]
+        mode = params.get("mode") or "cloud"
+        model = params.get("model") or ("llama3.2:1b" if mode == "local" else "gpt-4o-mini")
+        deadline = request_deadline(params.get("timeout"))
+        generated = []
+        try:
+            with deadline_scope(deadline):
+                async for fragment in stream_llm(mode, model, messages, tenant=tenant, priority=priority):
+                    generated.append(fragment)
+                    yield fragment
+        finally:
+            limiter.record_tokens(tenant, estimate_tokens(prompt) + estimate_tokens("".join(generated)))
+    
+    if binary:
+        async def send(message: dict):
+            await websocket.send_bytes(wire.packb(message))
+        
+        async def receive():
+            return wire.unpackb(await websocket.receive_bytes())
+    else:
+        send, receive = websocket.send_json, websocket.receive_json
+    
+    mux = StreamMultiplexer(send, stream, WS_MAX_STREAMS, WS_SEND_QUEUE_SIZE, drainer=drainer)
+    sender = asyncio.create_task(mux.sender())
+    try:
+        while True:
+            try:
+                message = await receive()
+            except (ValueError, KeyError, HTTPException):
+                await mux.emit({"type": "error", "id": None,
+                                "error": "Invalid MessagePack message" if binary else "Invalid JSON message"})
+                continue
+            if not isinstance(message, dict):
+                await mux.emit({"type": "error", "id": None, "error": "Message must be a JSON object"})
+                continue
+            await mux.handle(message)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await mux.close(sender)
+
+def session_context_budget(mode: str, model: Optional[str]) -> int:
+    """Budget de tokens d'entrée pour un tour de session (fenêtre - réponse)"""
+    window = backends.resolve(mode, model).context_length(model) or SESSION_LOCAL_CONTEXT_TOKENS
+    return max(256, min(window, SESSION_MAX_CONTEXT_TOKENS) - SESSION_RESPONSE_TOKENS)
+
+@app.post("/sessions", tags=["Sessions"])
+async def create_session(request: SessionCreateRequest, tenant: str = Depends(request_tenant)):
+    """
+    💬 **Création d'une session de conversation**
+    
+    L'historique est conservé côté serveur : chaque tour n'envoie que le
+    nouveau prompt via `POST /sessions/{session_id}/messages`. La session
+    n'est accessible qu'au client qui l'a créée (404 pour les autres).
+    """
+    try:
+        backends.resolve(request.mode or "local", request.model)
+    except UnknownBackend as e:
+        raise upstream_http_exception(e)
+    session = sessions.create(request.model, request.mode or "local", request.system, owner=tenant)
+    return {"session_id": session.id, "model": session.model, "mode": session.mode}
+
+@app.post("/sessions/{session_id}/messages", response_model=SessionTurnResponse, tags=["Sessions"])
+async def session_message(session_id: str, request: SessionMessageRequest, http_request: Request,
+                          client_key: Optional[str] = Depends(enforce_rate_limit),
+                          tenant: str = Depends(request_tenant), x_priority: Optional[str] = Header(None),
+                          x_request_timeout: Optional[str] = Header(None)):
+    """
+    💬 **Nouveau tour de conversation**
+    
+    Le contexte envoyé au modèle est reconstruit à partir de l'historique,
+    tronqué pour tenir dans la fenêtre du modèle. La fenêtre ne recule que
+    par paliers : les tours successifs partagent le même préfixe, ce qui
+    permet à Ollama de réutiliser son cache KV.
+    """
+    session = sessions.get(session_id, owner=tenant)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    priority = resolve_priority(None, x_priority)
+    deadline = request_deadline(None, x_request_timeout)
+    
+    async with session.lock:
+        messages, stats = session.pack(
+            request.prompt, session_context_budget(session.mode, session.model)
+        )
+        try:
+            with deadline_scope(deadline):
+                response_text, provider, data = await cancel_on_disconnect(http_request, drainer.run(call_llm(
+                    session.mode, session.model, messages,
+                    extra_payload={"max_tokens": SESSION_RESPONSE_TOKENS},
+                    affinity_key=session.id,
+                    tenant=tenant,
+                    priority=priority,
+                ), "session"))
+        except Exception as e:
+            raise upstream_http_exception(e)
+        session.append("user", request.prompt, sessions.max_messages)
+        session.append("assistant", response_text, sessions.max_messages)
+    
+    record_token_usage(client_key, data, request.prompt, response_text)
+    return SessionTurnResponse(
+        response=response_text,
+        model=session.model,
+        provider=provider,
+        mode=session.mode,
+        session_id=session.id,
+        context_tokens=stats["context_tokens"],
+        history_messages=stats["history_messages"],
+        dropped_messages=stats["dropped_messages"],
+        truncated_prompt=bool(stats["truncated_prompt"]),
+    )
+
+@app.get("/sessions/{session_id}", tags=["Sessions"])
+async def get_session(session_id: str, tenant: str = Depends(request_tenant)):
+    """
+    💬 **Historique d'une session**
+    """
+    session = sessions.get(session_id, owner=tenant)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {
+        "session_id": session.id,
+        "model": session.model,
+        "mode": session.mode,
+        "messages": [m.as_dict() for m in session.messages],
+        "window_start": session.window_start,
+    }
+
+@app.delete("/sessions/{session_id}", tags=["Sessions"])
+async def delete_session(session_id: str, tenant: str = Depends(request_tenant)):
+    """
+    💬 **Suppression d'une session**
+    """
+    if not sessions.delete(session_id, owner=tenant):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"deleted": session_id}
 
 @app.get("/models", tags=["Models"])
 async def list_models():
     """
     📋 **Modèles disponibles**
     
-    Liste tous les modèles IA disponibles dans l'application :
+    Liste tous les modèles IA disponibles dans l'application, à partir du
+    registre des backends (modèles déclarés + découverts) :
     - **Local** : Modèles Ollama hébergés localement
     - **Cloud** : Modèles OpenAI via API
     
     Format unifié avec informations pratiques pour chaque modèle.
     """
     
-    # Modèles cloud supportés (OpenAI)
-    cloud_models = [
-        {
-            "id": "gpt-4o-mini",
-            "name": "GPT-4o Mini",
-            "provider": "openai",
-            "type": "cloud",
-            "description": "Modèle rapide et économique d'OpenAI",
-            "context_length": 128000,
-            "pricing": {"input": 0.15, "output": 0.60, "unit": "$/1M tokens"}
-        },
-        {
-            "id": "gpt-3.5-turbo",
-            "name": "GPT-3.5 Turbo", 
-            "provider": "openai",
-            "type": "cloud",
-            "description": "Modèle conversationnel rapide d'OpenAI",
-            "context_length": 16385,
-            "pricing": {"input": 0.50, "output": 1.50, "unit": "$/1M tokens"}
-        }
-    ]
+    async def backend_models(backend: Backend):
+        if backend.balanced and balancer.enabled and backend.models_url:
+            # Plusieurs réplicas : n'importe quel réplica sain connaît les modèles installés
+            try:
+                await balancer.maybe_refresh()
+                replica = balancer.pick()
+            except NoReplicaAvailable as e:
+                return list(backend.models), {"status": "unreachable", "error": str(e)}
+            return await backend.list_models(f"{replica.url}{backend.models_adapter.models_path}")
+        return await backend.list_models()
     
-    # Récupération des modèles Ollama locaux
-    local_models = []
-    ollama_status = {"status": "checking"}
+    # Découverte en parallèle : la liste ne coûte que le backend le plus lent
+    results = await asyncio.gather(*(backend_models(b) for b in backends))
+    models = {backend_type: [] for backend_type in BACKEND_TYPES}
+    statuses = {}
+    for backend, (found, status) in zip(backends, results):
+        models[backend.type].extend(found)
+        statuses[backend.name] = status
     
-    try:
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.get(f"{OLLAMA_HOST}/api/tags")
-            if response.status_code == 200:
-                ollama_data = response.json()
-                for model in ollama_data.get("models", []):
-                    local_models.append({
-                        "id": model["name"],
-                        "name": model["name"].replace(":", " "),
-                        "provider": "ollama",
-                        "type": "local",
-                        "description": f"Modèle local {model['name']}",
-                        "size_gb": round(model["size"] / (1024**3), 1),
-                        "modified": model["modified_at"],
-                        "family": model.get("details", {}).get("family", "unknown"),
-                        "parameters": model.get("details", {}).get("parameter_size", "unknown")
-                    })
-                ollama_status = {"status": "available", "count": len(local_models)}
-            else:
-                ollama_status = {"status": "error", "error": f"HTTP {response.status_code}"}
-    except Exception as e:
-        ollama_status = {"status": "unreachable", "error": str(e)}
+    # Statut historique : premier backend local
+    local = next((b for b in backends if b.type == "local"), None)
+    ollama_status = statuses[local.name] if local is not None else {"status": "not_configured"}
     
     return {
-        "models": {
-            "local": local_models,
-            "cloud": cloud_models
-        },
+        "models": models,
         "summary": {
-            "total": len(local_models) + len(cloud_models),
-            "local_count": len(local_models),
-            "cloud_count": len(cloud_models),
-            "ollama_status": ollama_status
+            "total": sum(len(m) for m in models.values()),
+            "local_count": len(models["local"]),
+            "cloud_count": len(models["cloud"]),
+            "ollama_status": ollama_status,
+            "ollama_replicas": balancer.status() if balancer.enabled else [],
+            "backends": {b.name: {**b.to_dict(), "models": statuses[b.name]} for b in backends},
         },
         "usage": {
             "local": "Set mode='local' and model='model_id'",
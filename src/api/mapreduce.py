@@ -0,0 +1,318 @@
+"""
+Prompt2Prod - Génération map-reduce des prompts surdimensionnés
+
+Un prompt du type « refactorise tout ce module » avec de longues sources
+collées dépasse la fenêtre des petits modèles locaux, et un seul appel
+séquentiel est lent. En mode map-reduce (opt-in, `map_reduce` sur
+/generate) :
+1. découpage : les sources (blocs ```...```, sinon le texte après le
+   premier paragraphe) sont coupées aux frontières de structure (fichier,
+   puis classes et fonctions de premier niveau), puis regroupées en
+   morceaux d'au plus `chunk_tokens` tokens ; une définition trop longue
+   est coupée par lignes
+2. map : chaque morceau est traité avec la consigne, en parallèle sous
+   MAPREDUCE_MAX_CONCURRENCY (les appels passent par l'ordonnanceur du
+   backend et, en local, par le load balancer des réplicas Ollama)
+3. reduce : les résultats partiels sont fusionnés en une réponse ; s'ils
+   ne tiennent pas dans un seul appel, la fusion se fait par étages
+
+Un prompt qui tient dans le budget suit le chemin normal (un seul appel).
+
+Configuration (variables d'environnement) :
+- MAPREDUCE_CHUNK_TOKENS    : budget d'un morceau, plafonné par la fenêtre du modèle (défaut 2048)
+- MAPREDUCE_MAX_CHUNKS      : morceaux au plus par requête (défaut 32)
+- MAPREDUCE_MAX_CONCURRENCY : appels map simultanés (défaut 4)
+- MAPREDUCE_RESPONSE_TOKENS : `max_tokens` d'un appel map ou reduce (défaut 1024)
+"""
+import asyncio
+import os
+import re
+import time
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from src.api.metrics import registry
+from src.api.tokens import estimate_tokens
+
+FENCE_RE = re.compile(r"^```[ \t]*([\w+#.-]*)[ \t]*([^\n]*)\n(.*?)^```[ \t]*$", re.DOTALL | re.MULTILINE)
+PATH_RE = re.compile(r"[\w./-]+\.\w{1,8}")
+# Début d'une définition de premier niveau (Python, JS/TS, Go, Rust, Java...)
+DEFINITION_RE = re.compile(
+    r"^(?:@|(?:async\s+)?def\s|class\s|(?:export\s+)?(?:default\s+)?(?:async\s+)?function\s|"
+    r"export\s|func\s|fn\s|pub\s|impl\s|struct\s|interface\s|type\s|public\s|private\s|protected\s)"
+)
+
+MAPREDUCE_REQUESTS = registry.counter(
+    "prompt2prod_mapreduce_requests_total", "Requêtes /generate en mode map-reduce", ["outcome"],
+)
+MAPREDUCE_CHUNKS = registry.histogram(
+    "prompt2prod_mapreduce_chunks", "Morceaux par requête map-reduce",
+    buckets=(1, 2, 4, 8, 16, 32, 64),
+)
+
+# call(messages) -> (texte, provider, données upstream)
+LLMCall = Callable[[List[Dict]], Awaitable[Tuple[str, str, Dict]]]
+# on_progress(événement) : avancement (plan, morceau terminé, étage de reduce)
+ProgressFn = Callable[[Dict], None]
+
+
+class TooManyChunks(Exception):
+    """Le découpage dépasse MAPREDUCE_MAX_CHUNKS"""
+
+
+class Source(NamedTuple):
+    label: str
+    language: str
+    code: str
+
+
+class Chunk(NamedTuple):
+    index: int
+    labels: Tuple[str, ...]
+    text: str
+    tokens: int
+
+
+class Plan(NamedTuple):
+    instruction: str
+    chunks: List[Chunk]
+    budget: int
+
+
+def split_sources(prompt: str) -> Tuple[str, List[Source]]:
+    """
+    Sépare la consigne des sources : blocs clôturés (étiquette = chemin de
+    l'en-tête du bloc ou de la ligne qui le précède), sinon tout ce qui
+    suit le premier paragraphe.
+    """
+    sources, instruction, last = [], [], 0
+    for i, match in enumerate(FENCE_RE.finditer(prompt)):
+        before = prompt[last:match.start()]
+        path = PATH_RE.search(match.group(2))
+        lines = before.rstrip().splitlines()
+        if path is None and lines:
+            path = PATH_RE.search(lines[-1])
+            if path and len(lines[-1].strip()) <= len(path.group(0)) + 12:
+                # Ligne d'en-tête du fichier (« utils.py », « # File: utils.py ») : étiquette, pas consigne
+                before = "\n".join(lines[:-1])
+        instruction.append(before)
+        label = path.group(0) if path else f"part {i + 1}"
+        sources.append(Source(label, match.group(1).lower(), match.group(3)))
+        last = match.end()
+    if sources:
+        instruction.append(prompt[last:])
+        return "\n".join(part.strip() for part in instruction if part.strip()), sources
+    head, _, rest = prompt.strip().partition("\n\n")
+    return head.strip(), [Source("input", "", rest)] if rest.strip() else []
+
+
+def split_units(code: str) -> List[str]:
+    """Coupe une source aux définitions de premier niveau (décorateurs rattachés à la suivante)"""
+    units: List[List[str]] = [[]]
+    previous = ""
+    for line in code.splitlines(keepends=True):
+        if DEFINITION_RE.match(line) and not previous.startswith("@") and units[-1]:
+            units.append([])
+        units[-1].append(line)
+        if line.strip():
+            previous = line
+    return ["".join(unit) for unit in units if "".join(unit).strip()]
+
+
+def _split_lines(text: str, budget: int) -> List[str]:
+    pieces, current, tokens = [], [], 0
+    for line in text.splitlines(keepends=True):
+        cost = estimate_tokens(line)
+        if current and tokens + cost > budget:
+            pieces.append("".join(current))
+            current, tokens = [], 0
+        current.append(line)
+        tokens += cost
+    if current:
+        pieces.append("".join(current))
+    return pieces
+
+
+def pack_chunks(sources: List[Source], budget: int) -> List[Chunk]:
+    """Regroupe les unités, dans l'ordre, en morceaux d'au plus `budget` tokens"""
+    chunks: List[Chunk] = []
+    parts: List[Tuple[str, str, str]] = []  # (étiquette, langage, code)
+    tokens = 0
+
+    def flush():
+        nonlocal parts, tokens
+        if parts:
+            labels = tuple(dict.fromkeys(label for label, _, _ in parts))
+            text = "".join(f"{label}\n```{language}\n{code.rstrip()}\n```\n" for label, language, code in parts)
+            chunks.append(Chunk(len(chunks), labels, text, tokens))
+        parts, tokens = [], 0
+
+    for source in sources:
+        for unit in split_units(source.code):
+            for piece in (_split_lines(unit, budget) if estimate_tokens(unit) > budget else [unit]):
+                cost = estimate_tokens(piece)
+                if parts and tokens + cost > budget:
+                    flush()
+                if parts and parts[-1][0] == source.label:
+                    parts[-1] = (source.label, source.language, parts[-1][2] + piece)
+                else:
+                    parts.append((source.label, source.language, piece))
+                tokens += cost
+    flush()
+    return chunks
+
+
+def map_messages(instruction: str, chunk: Chunk, total: int) -> List[Dict]:
+    return [{"role": "user", "content": (
+        f"{instruction}\n\n"
+        f"The input is too large for a single pass and was split into {total} parts. "
+        f"Apply the request to part {chunk.index + 1}/{total} ({', '.join(chunk.labels)}) only. "
+        f"Keep the file names and return only your result for this part.\n\n{chunk.text}"
+    )}]
+
+
+def reduce_messages(instruction: str, partials: List[str]) -> List[Dict]:
+    parts = "\n\n".join(f"--- Part {i + 1}/{len(partials)} ---\n{text}" for i, text in enumerate(partials))
+    return [{"role": "user", "content": (
+        f"{instruction}\n\n"
+        f"The request was applied to {len(partials)} consecutive parts of the input. "
+        f"Merge the partial results below into a single coherent answer: keep every file and "
+        f"definition, remove duplicates, and make cross-part references consistent.\n\n{parts}"
+    )}]
+
+
+class MapReducer:
+    """Découpage, appels map parallèles bornés, reduce (par étages si besoin)"""
+
+    def __init__(self, chunk_tokens: int = 2048, max_chunks: int = 32, max_concurrency: int = 4,
+                 response_tokens: int = 1024):
+        self.chunk_tokens = chunk_tokens
+        self.max_chunks = max_chunks
+        self.max_concurrency = max(1, max_concurrency)
+        self.response_tokens = response_tokens
+
+    def plan(self, prompt: str, context_tokens: Optional[int] = None) -> Optional[Plan]:
+        """Plan de découpage, ou None si le prompt tient en un seul appel"""
+        budget = self.chunk_tokens
+        if context_tokens:
+            budget = min(budget, context_tokens - self.response_tokens)
+        budget = max(256, budget)
+        if estimate_tokens(prompt) <= budget:
+            return None
+        instruction, sources = split_sources(prompt)
+        if not sources:
+            return None
+        # La consigne accompagne chaque morceau : elle est retirée du budget des sources
+        source_budget = max(128, budget - estimate_tokens(instruction) - 64)
+        chunks = pack_chunks(sources, source_budget)
+        if len(chunks) > self.max_chunks:
+            MAPREDUCE_REQUESTS.inc(outcome="too_many_chunks")
+            raise TooManyChunks(f"Input splits into {len(chunks)} chunks (max {self.max_chunks})")
+        if len(chunks) < 2:
+            return None
+        return Plan(instruction, chunks, budget)
+
+    async def run(self, plan: Plan, call: LLMCall,
+                  on_progress: Optional[ProgressFn] = None) -> Tuple[str, str, Dict]:
+        """Exécute le plan ; retourne (texte fusionné, provider, rapport)"""
+        progress = on_progress or (lambda event: None)
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        total = len(plan.chunks)
+        results: List[Optional[str]] = [None] * total
+        latencies: List[float] = []
+        provider = ""
+        progress({"event": "plan", "chunks": total, "max_concurrency": self.max_concurrency,
+                  "chunk_tokens": [c.tokens for c in plan.chunks]})
+        MAPREDUCE_CHUNKS.observe(total)
+
+        async def timed(messages: List[Dict]) -> Tuple[str, float]:
+            nonlocal provider
+            async with semaphore:
+                t0 = time.perf_counter()
+                text, provider, _ = await call(messages)
+            latencies.append(time.perf_counter() - t0)
+            return text, latencies[-1]
+
+        async def run_chunk(chunk: Chunk) -> None:
+            text, latency = await timed(map_messages(plan.instruction, chunk, total))
+            results[chunk.index] = text
+            progress({"event": "chunk", "index": chunk.index, "labels": list(chunk.labels),
+                      "latency_ms": round(latency * 1000, 1),
+                      "done": sum(r is not None for r in results), "total": total})
+
+        try:
+            await self._gather([run_chunk(chunk) for chunk in plan.chunks])
+            map_ms = (time.perf_counter() - started) * 1000
+
+            partials, rounds = [r or "" for r in results], 0
+            while True:
+                rounds += 1
+                groups = self._reduce_groups(plan, partials)
+                progress({"event": "reduce", "round": rounds, "inputs": len(partials), "calls": len(groups)})
+                outputs: List[Optional[str]] = [None] * len(groups)
+
+                async def run_group(index: int, group: List[str]) -> None:
+                    outputs[index], _ = await timed(reduce_messages(plan.instruction, group))
+
+                await self._gather([run_group(i, group) for i, group in enumerate(groups)])
+                partials = [o or "" for o in outputs]
+                if len(partials) == 1:
+                    break
+        except BaseException:
+            MAPREDUCE_REQUESTS.inc(outcome="error")
+            raise
+
+        MAPREDUCE_REQUESTS.inc(outcome="ok")
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        sequential_ms = sum(latencies) * 1000
+        report = {
+            "chunks": total,
+            "max_concurrency": self.max_concurrency,
+            "reduce_rounds": rounds,
+            "calls": len(latencies),
+            "map_ms": round(map_ms, 1),
+            "elapsed_ms": round(elapsed_ms, 1),
+            # Somme des latences d'appel : durée d'une exécution des mêmes appels un par un
+            "sequential_ms": round(sequential_ms, 1),
+            "speedup": round(sequential_ms / elapsed_ms, 2) if elapsed_ms else None,
+        }
+        return partials[0], provider, report
+
+    def _reduce_groups(self, plan: Plan, partials: List[str]) -> List[List[str]]:
+        """Résultats partiels regroupés pour tenir dans le budget d'un appel reduce"""
+        budget = max(1, plan.budget - estimate_tokens(plan.instruction) - 64)
+        groups: List[List[str]] = [[]]
+        tokens = 0
+        for text in partials:
+            cost = estimate_tokens(text)
+            if groups[-1] and tokens + cost > budget:
+                groups.append([])
+                tokens = 0
+            groups[-1].append(text)
+            tokens += cost
+        if len(groups) == len(partials) > 1:
+            # Résultats trop longs pour être regroupés : fusion par paires, pour converger
+            groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+        return groups
+
+    @staticmethod
+    async def _gather(coroutines: List[Awaitable[None]]) -> None:
+        """Attend tous les appels ; au premier échec, annule les autres et relève l'erreur"""
+        tasks = [asyncio.ensure_future(c) for c in coroutines]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_EXCEPTION)
+            for task in done:
+                if task.exception() is not None:
+                    raise task.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+mapreducer = MapReducer(
+    chunk_tokens=int(os.getenv("MAPREDUCE_CHUNK_TOKENS", "2048")),
+    max_chunks=int(os.getenv("MAPREDUCE_MAX_CHUNKS", "32")),
+    max_concurrency=int(os.getenv("MAPREDUCE_MAX_CONCURRENCY", "4")),
+    response_tokens=int(os.getenv("MAPREDUCE_RESPONSE_TOKENS", "1024")),
+)
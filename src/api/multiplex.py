@@ -0,0 +1,126 @@
+"""
+Prompt2Prod - Multiplexage de flux de génération sur une WebSocket
+
+Une connexion porte plusieurs générations identifiées par `id`. Leurs
+tokens sont renvoyés entrelacés sur la même connexion.
+
+Protocole (messages JSON) :
+- client -> {"type": "generate", "id": "r1", "prompt": "...", "model": "...", "mode": "local"}
+- client -> {"type": "cancel", "id": "r1"}
+- serveur -> {"type": "token", "id": "r1", "data": "..."}
+- serveur -> {"type": "done", "id": "r1", "chunks": 12, "latency_ms": 830.2}
+- serveur -> {"type": "error", "id": "r1", "error": "..."}
+- serveur -> {"type": "cancelled", "id": "r1"}
+- serveur -> {"type": "interrupted", "id": "r1", "reason": "server_shutdown", "partial": "..."}
+
+Arrêt du pod (`drainer`) : les nouveaux flux sont refusés (`error` avec
+`"retry": true`) ; un flux encore en cours à la fin du délai de grâce est
+interrompu et reçoit le texte déjà généré, pour reprendre ailleurs.
+
+Contre-pression : la file d'envoi est bornée. Quand le client lit trop
+lentement, les flux se bloquent sur `put` et cessent de lire l'upstream,
+la mémoire côté serveur reste donc bornée.
+"""
+import asyncio
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from src.api.draining import Drainer
+
+# stream(params) -> itérateur asynchrone de fragments de texte
+StreamFn = Callable[[dict], AsyncIterator[str]]
+SendFn = Callable[[dict], Awaitable[None]]
+
+
+class StreamMultiplexer:
+    """Gestion des flux d'une connexion : démarrage, annulation, envoi borné"""
+
+    def __init__(self, send: SendFn, stream: StreamFn, max_streams: int = 8, queue_size: int = 256,
+                 drainer: Optional[Drainer] = None):
+        self.send = send
+        self.drainer = drainer
+        self.stream = stream
+        self.max_streams = max_streams
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.tasks: Dict[str, asyncio.Task] = {}
+        self.closing = False
+
+    async def emit(self, message: dict) -> None:
+        if not self.closing:
+            await self.queue.put(message)
+
+    async def sender(self) -> None:
+        """Seul écrivain de la WebSocket : vide la file d'envoi"""
+        while True:
+            message = await self.queue.get()
+            if message is None:
+                return
+            await self.send(message)
+
+    async def handle(self, message: dict) -> None:
+        kind = message.get("type")
+        request_id = message.get("id")
+        if not isinstance(request_id, str) or not request_id:
+            await self.emit({"type": "error", "id": None, "error": "Missing request id"})
+            return
+        if kind == "cancel":
+            task = self.tasks.get(request_id)
+            if task is not None:
+                task.cancel()
+            return
+        if kind != "generate":
+            await self.emit({"type": "error", "id": request_id, "error": f"Unknown message type '{kind}'"})
+            return
+        if request_id in self.tasks:
+            await self.emit({"type": "error", "id": request_id, "error": "Duplicate request id"})
+            return
+        if self.drainer is not None and self.drainer.draining:
+            await self.emit({"type": "error", "id": request_id, "error": "Server shutting down",
+                              "retry": True})
+            return
+        if len(self.tasks) >= self.max_streams:
+            await self.emit({"type": "error", "id": request_id,
+                              "error": f"Too many concurrent streams (max {self.max_streams})"})
+            return
+        task = self.tasks[request_id] = asyncio.create_task(self._run(request_id, message))
+        if self.drainer is not None:
+            self.drainer.register(task, "stream")
+
+    async def _run(self, request_id: str, params: dict) -> None:
+        started = time.perf_counter()
+        generated: List[str] = []
+        try:
+            # aclosing : une annulation ferme aussitôt le flux (et la connexion upstream)
+            async with aclosing(self.stream(params)) as fragments:
+                async for fragment in fragments:
+                    generated.append(fragment)
+                    await self.emit({"type": "token", "id": request_id, "data": fragment})
+            await self.emit({"type": "done", "id": request_id, "chunks": len(generated),
+                              "latency_ms": round((time.perf_counter() - started) * 1000, 1)})
+        except asyncio.CancelledError:
+            task = asyncio.current_task()
+            if self.drainer is not None and self.drainer.interrupted(task):
+                # Point de reprise : le client peut continuer la génération sur un autre pod
+                await self.emit({"type": "interrupted", "id": request_id, "reason": "server_shutdown",
+                                  "partial": "".join(generated)})
+            else:
+                await self.emit({"type": "cancelled", "id": request_id})
+        except Exception as e:
+            await self.emit({"type": "error", "id": request_id,
+                              "error": str(getattr(e, "detail", None) or e)})
+        finally:
+            self.tasks.pop(request_id, None)
+            if self.drainer is not None:
+                self.drainer.release(asyncio.current_task())
+
+    async def close(self, sender: Optional[asyncio.Task] = None) -> None:
+        """Annule les flux en cours et arrête l'envoi (déconnexion)"""
+        self.closing = True
+        tasks = list(self.tasks.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if sender is not None:
+            sender.cancel()
+            await asyncio.gather(sender, return_exceptions=True)
@@ -0,0 +1,186 @@
+"""
+Prompt2Prod - Pré-traitement des prompts avant l'appel upstream
+
+Réduit le nombre de tokens envoyés au modèle sans changer le sens du
+prompt. Règles déterministes, en temps linéaire sur la taille du texte :
+- `whitespace` : sur les lignes de texte courant seulement, espaces de fin
+  de ligne supprimés et espaces multiples réduits à un ; lignes vides
+  consécutives réduites à une entre deux paragraphes de texte ou blocs
+  clôturés. Une ligne indentée ou contenant des caractères de code (`=`,
+  parenthèses, guillemets, `#`...) est laissée telle quelle : du code collé
+  sans clôture garde son sens (chaînes, commentaires). L'intérieur des
+  blocs de code clôturés (```) n'est jamais modifié, octet pour octet.
+- `dedupe` : un bloc (paragraphe ou bloc de code clôturé) identique à un
+  bloc précédent est remplacé par une courte mention, s'il dépasse
+  PREPROCESS_DEDUP_MIN_TOKENS (fichiers joints plusieurs fois, boilerplate
+  répété...).
+
+Configuration (variables d'environnement) :
+- PREPROCESS_ENABLED         : pré-traitement par défaut des requêtes (défaut 0)
+- PREPROCESS_RULES           : règles appliquées, dans l'ordre (défaut "whitespace,dedupe")
+- PREPROCESS_DEDUP_MIN_TOKENS : taille minimale d'un bloc dédupliqué (défaut 16)
+"""
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from src.api.metrics import registry
+from src.api.tokens import estimate_tokens
+
+RULES = ("whitespace", "dedupe")
+
+FENCE_RE = re.compile(r"^[ \t]*(```|~~~)")
+INNER_SPACES_RE = re.compile(r"(?<=\S)[ \t]{2,}(?=\S)")
+# Caractères qui signalent une ligne de code (chaînes, commentaires, opérateurs)
+CODE_CHARS_RE = re.compile(r"[=(){}\[\];#\"'`<>|\\$]")
+
+TOKENS_SAVED = registry.counter(
+    "prompt2prod_preprocess_tokens_saved_total", "Tokens estimés retirés des prompts par le pré-traitement",
+)
+
+# Bloc : (est un bloc de code, lignes, lignes vides qui le précèdent)
+Block = Tuple[bool, List[str], int]
+
+
+def split_blocks(text: str) -> Tuple[List[Block], int]:
+    """Découpe en paragraphes et blocs de code clôturés ; retourne (blocs, lignes vides finales)"""
+    blocks: List[Block] = []
+    current: List[str] = []
+    blank = 0
+    fence: Optional[str] = None
+    for line in text.split("\n"):
+        if fence is not None:
+            current.append(line)
+            match = FENCE_RE.match(line)
+            if match and match.group(1) == fence:
+                current, fence = [], None
+            continue
+        match = FENCE_RE.match(line)
+        if match:
+            current, fence = [line], match.group(1)
+            blocks.append((True, current, blank))
+            blank = 0
+        elif not line:
+            current = []
+            blank += 1
+        else:
+            if not current:
+                blocks.append((False, current, blank))
+                blank = 0
+            current.append(line)
+    return blocks, blank
+
+
+def join_blocks(blocks: List[Block], trailing_blank: int = 0) -> str:
+    parts: List[str] = []
+    for index, (_, lines, blank) in enumerate(blocks):
+        separator = blank + 1 if index else blank
+        parts.append("\n" * separator + "\n".join(lines))
+    return "".join(parts) + "\n" * trailing_blank
+
+
+def is_prose(line: str) -> bool:
+    """Ligne de texte courant : ni indentée, ni caractère de code"""
+    return not line[:1].isspace() and not CODE_CHARS_RE.search(line)
+
+
+def _is_prose_block(block: Block) -> bool:
+    is_code, lines, _ = block
+    return not is_code and all(is_prose(line) or not line.strip() for line in lines)
+
+
+def normalize_whitespace(text: str) -> str:
+    blocks, trailing = split_blocks(text)
+    # Bloc sûr : bloc clôturé (contenu intact) ou paragraphe de texte courant.
+    # Les lignes vides ne sont réduites qu'entre deux blocs sûrs (sinon elles
+    # peuvent appartenir à une chaîne multiligne de code non clôturé).
+    safe = [block[0] or _is_prose_block(block) for block in blocks]
+    normalized: List[Block] = []
+    for index, (is_code, lines, blank) in enumerate(blocks):
+        if not is_code and safe[index]:
+            lines = [INNER_SPACES_RE.sub(" ", line.rstrip()) for line in lines]
+        if safe[index] and (index == 0 or safe[index - 1]):
+            blank = min(blank, 1) if index else 0
+        normalized.append((is_code, lines, blank))
+    if blocks and safe[-1]:
+        trailing = 0
+    return join_blocks(normalized, trailing)
+
+
+def deduplicate(text: str, min_tokens: int) -> str:
+    blocks, trailing = split_blocks(text)
+    seen = set()
+    deduplicated = []
+    for is_code, lines, blank in blocks:
+        content = "\n".join(lines)
+        if estimate_tokens(content) >= min_tokens:
+            if content in seen:
+                first = next((" ".join(line.split()) for line in lines[is_code:] if line.strip()), "")
+                lines = [f"[omitted: identical to an earlier block starting with {first[:60]!r}]"]
+                is_code = False
+            else:
+                seen.add(content)
+        deduplicated.append((is_code, lines, blank))
+    return join_blocks(deduplicated, trailing)
+
+
+class PreprocessResult:
+    """Prompt pré-traité et tokens estimés avant/après"""
+
+    __slots__ = ("text", "tokens_before", "tokens_after", "applied")
+
+    def __init__(self, text: str, tokens_before: int, tokens_after: int, applied: List[str]):
+        self.text = text
+        self.tokens_before = tokens_before
+        self.tokens_after = tokens_after
+        self.applied = applied
+
+    def to_dict(self) -> Dict:
+        return {
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+            "rules": self.applied,
+        }
+
+
+class PromptPreprocessor:
+    """Pipeline de règles appliquées au prompt avant la construction du payload"""
+
+    def __init__(self, rules: List[str] = RULES, enabled: bool = False, dedup_min_tokens: int = 16):
+        unknown = [r for r in rules if r not in RULES]
+        if unknown:
+            raise ValueError(f"Unknown preprocessing rules: {', '.join(unknown)}")
+        self.rules = list(rules)
+        self.enabled = enabled
+        self.dedup_min_tokens = dedup_min_tokens
+
+    def active(self, requested: Optional[bool] = None) -> bool:
+        """Pré-traitement demandé par la requête, sinon valeur serveur"""
+        return bool(self.rules) and (self.enabled if requested is None else requested)
+
+    def process(self, text: str) -> PreprocessResult:
+        tokens_before = estimate_tokens(text)
+        processed = text
+        applied = []
+        for rule in self.rules:
+            if rule == "whitespace":
+                output = normalize_whitespace(processed)
+            else:
+                output = deduplicate(processed, self.dedup_min_tokens)
+            if output != processed:
+                applied.append(rule)
+                processed = output
+        result = PreprocessResult(processed, tokens_before, estimate_tokens(processed), applied)
+        TOKENS_SAVED.inc(max(0, result.tokens_before - result.tokens_after))
+        return result
+
+
+def _rules_from_env() -> List[str]:
+    return [r.strip() for r in os.getenv("PREPROCESS_RULES", ",".join(RULES)).split(",") if r.strip()]
+
+
+preprocessor = PromptPreprocessor(
+    rules=_rules_from_env(),
+    enabled=os.getenv("PREPROCESS_ENABLED", "0").lower() in ("1", "true", "yes"),
+    dedup_min_tokens=int(os.getenv("PREPROCESS_DEDUP_MIN_TOKENS", "16")),
+)
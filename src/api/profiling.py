@@ -0,0 +1,211 @@
+"""
+Prompt2Prod - Profilage à la demande des requêtes /generate
+
+Profileur par échantillonnage, activé requête par requête :
+- header `X-Profile-Token` égal à PROFILING_TOKEN, ou
+- tirage aléatoire selon PROFILING_SAMPLE_RATE
+
+Un thread échantillonne à intervalle fixe (temps réel, « wall-clock ») la
+pile asynchrone de la tâche profilée : la chaîne des coroutines en attente
+(`cr_await`), complétée par la pile synchrone du thread de la boucle quand
+la tâche est en train de s'exécuter. On voit donc aussi bien le temps passé
+à attendre l'upstream que le CPU consommé dans le process.
+
+Les profils terminés sont conservés dans un tampon circulaire borné et
+servis par `/debug/profiles` au format « collapsed stacks » (une ligne
+`frame;frame;frame N` par pile), lisible par flamegraph.pl ou speedscope.
+
+Sans requête profilée, le thread dort : le coût se limite au test
+d'activation.
+
+Configuration (variables d'environnement) :
+- PROFILING_TOKEN       : jeton du header X-Profile-Token (vide = ni profilage à la demande, ni accès à /debug/profiles)
+- PROFILING_SAMPLE_RATE : fraction de requêtes profilées d'office (défaut 0)
+- PROFILING_INTERVAL_MS : période d'échantillonnage (défaut 5 ms)
+- PROFILING_BUFFER_SIZE : profils conservés (défaut 32)
+- PROFILING_MAX_ACTIVE  : profils simultanés au plus (défaut 4)
+"""
+import asyncio
+import hmac
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Awaitable, Deque, Dict, List, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_qualname}"
+
+
+def _await_chain(task: asyncio.Task):
+    """Frames de la chaîne de coroutines d'une tâche (extérieur -> intérieur) et objet attendu"""
+    frames = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = (getattr(awaitable, "cr_frame", None) or getattr(awaitable, "gi_frame", None)
+                 or getattr(awaitable, "ag_frame", None))
+        if frame is None:
+            break
+        frames.append(frame)
+        awaitable = (getattr(awaitable, "cr_await", None) or getattr(awaitable, "gi_yieldfrom", None)
+                     or getattr(awaitable, "ag_await", None))
+    return frames, awaitable
+
+
+class Profile:
+    """Échantillons d'une requête profilée"""
+
+    __slots__ = ("id", "attributes", "started_at", "duration", "samples", "stacks",
+                 "task", "thread_id")
+
+    def __init__(self, profile_id: int, attributes: Dict, task: asyncio.Task, thread_id: int):
+        self.id = profile_id
+        self.attributes = attributes
+        self.started_at = time.time()
+        self.duration = 0.0
+        self.samples = 0
+        self.stacks: Counter = Counter()
+        self.task = task
+        self.thread_id = thread_id
+
+    def collapsed(self) -> List[str]:
+        root = f"profile {self.id}"
+        if self.attributes.get("model"):
+            root += f" {self.attributes['model']}"
+        return [f"{root};{stack} {count}" for stack, count in self.stacks.most_common()]
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "started_at": self.started_at,
+            "duration_ms": round(self.duration * 1000, 1),
+            "samples": self.samples,
+            **self.attributes,
+        }
+
+
+class SamplingProfiler:
+    """Déclenchement, échantillonnage et conservation des profils"""
+
+    def __init__(self, token: str = "", sample_rate: float = 0.0, interval: float = 0.005,
+                 capacity: int = 32, max_active: int = 4):
+        self.token = token
+        self.sample_rate = sample_rate
+        self.interval = interval
+        self.max_active = max_active
+        self.profiles: Deque[Profile] = deque(maxlen=capacity)
+        self._active: Dict[int, Profile] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.token) or self.sample_rate > 0
+
+    def authorized(self, header_token: Optional[str]) -> bool:
+        return bool(self.token) and header_token is not None and hmac.compare_digest(
+            header_token.encode(), self.token.encode())
+
+    def sampled(self, header_token: Optional[str] = None) -> bool:
+        """La requête doit-elle être profilée ?"""
+        if not self.enabled:
+            return False
+        if header_token is not None:
+            return self.authorized(header_token)
+        return self.sample_rate > 0 and random.random() < self.sample_rate  # nosec B311
+
+    # ------------------------------------------------------------------
+    # Capture
+    # ------------------------------------------------------------------
+
+    async def profiled(self, work: Awaitable[T], attributes: Optional[Dict] = None) -> T:
+        """Exécute `work` en échantillonnant la tâche courante"""
+        if len(self._active) >= self.max_active:
+            return await work
+        profile = Profile(next(self._ids), attributes or {}, asyncio.current_task(), threading.get_ident())
+        started = time.perf_counter()
+        with self._lock:
+            self._active[profile.id] = profile
+        self._ensure_thread()
+        self._wakeup.set()
+        try:
+            return await work
+        finally:
+            with self._lock:
+                del self._active[profile.id]
+            profile.duration = time.perf_counter() - started
+            profile.task = None
+            self.profiles.append(profile)
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="prompt2prod-profiler", daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                active = list(self._active.values())
+                if not active:
+                    self._wakeup.clear()
+                    continue
+            frames = sys._current_frames()
+            for profile in active:
+                self._sample(profile, frames.get(profile.thread_id))
+            time.sleep(self.interval)
+
+    @staticmethod
+    def _sample(profile: Profile, loop_frame) -> None:
+        task = profile.task
+        if task is None or task.done():
+            return
+        chain, awaited = _await_chain(task)
+        if not chain:
+            return
+        names = [_frame_name(f) for f in chain]
+        # La tâche s'exécute-t-elle ? Sa frame la plus profonde est alors sur la pile du thread
+        innermost = chain[-1]
+        running = []
+        frame = loop_frame
+        while frame is not None and frame is not innermost:
+            running.append(frame)
+            frame = frame.f_back
+        if frame is innermost:
+            names.extend(_frame_name(f) for f in reversed(running))
+        else:
+            names.append(f"[await {type(awaited).__name__}]" if awaited is not None else "[await]")
+        profile.stacks[";".join(names)] += 1
+        profile.samples += 1
+
+    # ------------------------------------------------------------------
+    # Consultation
+    # ------------------------------------------------------------------
+
+    def get(self, profile_id: int) -> Optional[Profile]:
+        return next((p for p in self.profiles if p.id == profile_id), None)
+
+    def collapsed(self, profiles: Optional[List[Profile]] = None) -> str:
+        lines: List[str] = []
+        for profile in profiles if profiles is not None else list(self.profiles):
+            lines.extend(profile.collapsed())
+        return "\n".join(lines) + ("\n" if lines else "")
+
+
+profiler = SamplingProfiler(
+    token=os.getenv("PROFILING_TOKEN", ""),
+    sample_rate=float(os.getenv("PROFILING_SAMPLE_RATE", "0")),
+    interval=float(os.getenv("PROFILING_INTERVAL_MS", "5")) / 1000,
+    capacity=int(os.getenv("PROFILING_BUFFER_SIZE", "32")),
+    max_active=int(os.getenv("PROFILING_MAX_ACTIVE", "4")),
+)
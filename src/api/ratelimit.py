@@ -0,0 +1,252 @@
+"""
+Prompt2Prod - Rate limiting par client (token bucket)
+
+Deux buckets par client : débit de requêtes et tokens générés par minute.
+Le client est identifié par le header X-API-Key, sinon par son IP.
+
+La clé X-API-Key n'est pas authentifiée par l'API : un client peut en
+changer pour obtenir un nouveau quota. Elle ne sert de quota fiable que
+derrière une passerelle qui la vérifie.
+
+L'IP retenue est celle du pair TCP, sauf si RATE_LIMIT_TRUSTED_HOPS
+proxies de confiance (ingress, load balancer) sont déclarés : c'est alors
+l'adresse ajoutée à X-Forwarded-For par le plus externe d'entre eux. Les
+entrées plus à gauche, fournies par le client, sont ignorées.
+
+Configuration (variables d'environnement), désactivé par défaut :
+- RATE_LIMIT_REQUESTS_PER_MINUTE : requêtes/minute par client (défaut 0 = désactivé)
+- RATE_LIMIT_TOKENS_PER_MINUTE   : tokens/minute par client (défaut 0 = désactivé)
+- RATE_LIMIT_TRUSTED_HOPS        : proxies de confiance devant l'API (défaut 0 : X-Forwarded-For ignoré)
+- RATE_LIMIT_IDLE_SECONDS        : éviction des clients inactifs
+- RATE_LIMIT_MAX_KEYS            : nombre maximum de buckets en mémoire
+- RATE_LIMIT_STORE               : store alternatif "module:Classe" (état partagé entre réplicas)
+"""
+import hashlib
+import importlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request, Response
+from starlette.requests import HTTPConnection
+
+API_KEY_HEADER = "x-api-key"
+FORWARDED_FOR_HEADER = "x-forwarded-for"
+
+
+@dataclass
+class BucketResult:
+    """Résultat d'une opération sur un bucket"""
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_seconds: float
+
+
+class RateLimitStore:
+    """
+    Interface de stockage des buckets.
+
+    `take` vérifie qu'il reste au moins max(cost, 1) unités et consomme
+    atomiquement `cost` ; `debit` retire des unités sans vérification (le
+    solde peut devenir négatif, ce qui bloque le client jusqu'au
+    remplissage). Une implémentation
+    partagée (type Redis) permet de cumuler les quotas entre réplicas.
+    """
+
+    def take(self, key: str, capacity: int, refill_per_sec: float, cost: float = 1.0) -> BucketResult:
+        raise NotImplementedError
+
+    def debit(self, key: str, capacity: int, refill_per_sec: float, cost: float) -> BucketResult:
+        raise NotImplementedError
+
+
+class InMemoryStore(RateLimitStore):
+    """
+    Buckets en mémoire locale, O(1) par opération.
+
+    Les clés sont gardées dans un OrderedDict par ordre d'utilisation :
+    les clés inactives depuis `idle_seconds` (ou au-delà de `max_keys`)
+    sont évincées par le début de la file, sans balayage complet.
+    """
+
+    def __init__(self, idle_seconds: float = 600.0, max_keys: int = 10000):
+        self.idle_seconds = idle_seconds
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        while buckets:
+            key, state = next(iter(buckets.items()))
+            if len(buckets) > self.max_keys or now - state[1] > self.idle_seconds:
+                buckets.popitem(last=False)
+            else:
+                break
+
+    def _refill(self, key: str, capacity: int, refill_per_sec: float, now: float) -> list:
+        state = self._buckets.get(key)
+        if state is None:
+            state = [float(capacity), now]
+            self._buckets[key] = state
+        else:
+            state[0] = min(float(capacity), state[0] + (now - state[1]) * refill_per_sec)
+            state[1] = now
+            self._buckets.move_to_end(key)
+        return state
+
+    @staticmethod
+    def _result(allowed: bool, state: list, capacity: int, refill_per_sec: float, cost: float) -> BucketResult:
+        tokens = state[0]
+        if allowed:
+            # Délai avant que le bucket soit de nouveau plein
+            reset = (capacity - tokens) / refill_per_sec
+        else:
+            # Délai avant de pouvoir payer `cost`
+            reset = (max(cost, 1.0) - tokens) / refill_per_sec
+        return BucketResult(allowed, capacity, max(0, int(tokens)), max(0.0, reset))
+
+    def take(self, key: str, capacity: int, refill_per_sec: float, cost: float = 1.0) -> BucketResult:
+        now = time.monotonic()
+        with self._lock:
+            state = self._refill(key, capacity, refill_per_sec, now)
+            allowed = state[0] >= max(cost, 1.0)
+            if allowed:
+                state[0] -= cost
+            self._evict(now)
+            return self._result(allowed, state, capacity, refill_per_sec, cost)
+
+    def debit(self, key: str, capacity: int, refill_per_sec: float, cost: float) -> BucketResult:
+        now = time.monotonic()
+        with self._lock:
+            state = self._refill(key, capacity, refill_per_sec, now)
+            state[0] -= cost
+            self._evict(now)
+            return self._result(True, state, capacity, refill_per_sec, cost)
+
+
+def client_address(request: HTTPConnection, trusted_hops: int = 0) -> str:
+    """
+    IP du client : pair TCP, ou entrée de X-Forwarded-For ajoutée par le
+    plus externe des `trusted_hops` proxies de confiance.
+    """
+    host = request.client.host if request.client else "unknown"
+    if trusted_hops <= 0:
+        return host
+    forwarded = [h.strip() for h in request.headers.get(FORWARDED_FOR_HEADER, "").split(",") if h.strip()]
+    if len(forwarded) < trusted_hops:
+        # Chaîne plus courte que prévu : requête arrivée sans passer par tous les proxies
+        return host
+    return forwarded[-trusted_hops]
+
+
+class RateLimiter:
+    """Limiteur requêtes + tokens par client"""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int,
+                 store: Optional[RateLimitStore] = None, trusted_hops: int = 0):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.store = store or InMemoryStore()
+        self.trusted_hops = trusted_hops
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests_per_minute > 0 or self.tokens_per_minute > 0
+
+    def client_key(self, request: HTTPConnection) -> str:
+        """Identifiant du client : empreinte de la clé API (non authentifiée), sinon IP"""
+        api_key = request.headers.get(API_KEY_HEADER)
+        if api_key:
+            return "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+        return "ip:" + client_address(request, self.trusted_hops)
+
+    def check(self, key: str) -> Optional[BucketResult]:
+        """
+        Vérifie les deux buckets avant l'appel upstream.
+
+        Retourne le résultat le plus contraignant, avec `allowed=False`
+        si l'une des limites est atteinte.
+        """
+        results = []
+        if self.requests_per_minute > 0:
+            results.append(self.store.take(
+                f"{key}:req", self.requests_per_minute, self.requests_per_minute / 60.0, 1.0
+            ))
+        if self.tokens_per_minute > 0:
+            # Le coût en tokens n'est connu qu'après génération : on vérifie
+            # seulement qu'il reste du crédit, le débit réel se fait ensuite.
+            results.append(self.store.take(
+                f"{key}:tok", self.tokens_per_minute, self.tokens_per_minute / 60.0, 0.0
+            ))
+        if not results:
+            return None
+        denied = [r for r in results if not r.allowed]
+        if denied:
+            return max(denied, key=lambda r: r.reset_seconds)
+        return min(results, key=lambda r: r.remaining)
+
+    def record_tokens(self, key: str, tokens: int) -> Optional[BucketResult]:
+        """Débite les tokens réellement consommés par une génération"""
+        if self.tokens_per_minute <= 0 or tokens <= 0:
+            return None
+        return self.store.debit(
+            f"{key}:tok", self.tokens_per_minute, self.tokens_per_minute / 60.0, float(tokens)
+        )
+
+
+def rate_limit_headers(result: BucketResult) -> Dict[str, str]:
+    """Headers standards (draft IETF RateLimit + Retry-After en cas de refus)"""
+    headers = {
+        "RateLimit-Limit": str(result.limit),
+        "RateLimit-Remaining": str(result.remaining),
+        "RateLimit-Reset": str(math.ceil(result.reset_seconds)),
+    }
+    if not result.allowed:
+        headers["Retry-After"] = str(max(1, math.ceil(result.reset_seconds)))
+    return headers
+
+
+def _store_from_env() -> RateLimitStore:
+    path = os.getenv("RATE_LIMIT_STORE")
+    if path:
+        module_name, _, class_name = path.partition(":")
+        return getattr(importlib.import_module(module_name), class_name)()
+    return InMemoryStore(
+        idle_seconds=float(os.getenv("RATE_LIMIT_IDLE_SECONDS", "600")),
+        max_keys=int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000")),
+    )
+
+
+limiter = RateLimiter(
+    requests_per_minute=int(os.getenv("RATE_LIMIT_REQUESTS_PER_MINUTE", "0")),
+    tokens_per_minute=int(os.getenv("RATE_LIMIT_TOKENS_PER_MINUTE", "0")),
+    store=_store_from_env(),
+    trusted_hops=int(os.getenv("RATE_LIMIT_TRUSTED_HOPS", "0")),
+)
+
+
+async def enforce_rate_limit(request: Request, response: Response) -> Optional[str]:
+    """
+    Dépendance FastAPI : refuse en 429 si le client a dépassé ses quotas.
+
+    Retourne la clé client (pour débiter les tokens après génération).
+    """
+    if not limiter.enabled:
+        return None
+    key = limiter.client_key(request)
+    result = limiter.check(key)
+    if result is not None:
+        headers = rate_limit_headers(result)
+        if not result.allowed:
+            raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=headers)
+        response.headers.update(headers)
+    return key
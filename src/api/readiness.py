@@ -0,0 +1,164 @@
+"""
+Prompt2Prod - Readiness tenant compte de la charge
+
+`/health` reste un test de vie trivial (liveness). `/ready` retire le pod
+du Service quand il ne peut plus servir correctement :
+- saturation : trop d'appels en cours ou en file sur un backend
+- upstreams injoignables : tous les endpoints sondés sont en échec
+
+Les sondes upstream tournent en tâche de fond, à intervalle fixe ; `/ready`
+ne lit que leur dernier résultat (aucune sonde par requête). Un seuil de
+retour (hystérésis) évite que le pod oscille autour de la limite.
+
+Configuration (variables d'environnement) :
+- READY_MAX_QUEUE_DEPTH    : requêtes en file par backend (défaut 32)
+- READY_MAX_IN_FLIGHT      : requêtes en cours + en file, tous backends (défaut 128)
+- READY_RECOVERY_RATIO     : fraction des seuils sous laquelle le pod redevient prêt (défaut 0.75)
+- READINESS_PROBE_URLS     : URLs sondées, séparées par des virgules (défaut KGATEWAY_ENDPOINT)
+- READINESS_PROBE_INTERVAL : période des sondes (s, défaut 10)
+- READINESS_PROBE_TIMEOUT  : timeout d'une sonde (s, défaut 2)
+"""
+import asyncio
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from src.api.httpclient import LoopClient
+from src.api.scheduler import FairScheduler
+
+
+class UpstreamProbe:
+    """Dernier résultat connu de la sonde d'un upstream"""
+
+    __slots__ = ("url", "reachable", "checked_at", "error")
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.reachable: Optional[bool] = None
+        self.checked_at = 0.0
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "reachable": self.reachable,
+            "checked_seconds_ago": round(time.monotonic() - self.checked_at, 1) if self.checked_at else None,
+            "error": self.error,
+        }
+
+
+class ReadinessMonitor:
+    """Décision de readiness à partir de la charge et des sondes en cache"""
+
+    def __init__(self, probe_urls: Iterable[str], probe_interval: float = 10.0,
+                 probe_timeout: float = 2.0, max_queue_depth: int = 32,
+                 max_in_flight: int = 128, recovery_ratio: float = 0.75):
+        self.probes = [UpstreamProbe(url) for url in probe_urls]
+        self.probe_interval = probe_interval
+        self.probe_timeout = probe_timeout
+        self.max_queue_depth = max_queue_depth
+        self.max_in_flight = max_in_flight
+        self.recovery_ratio = recovery_ratio
+        self.saturated = False
+        self._last_refresh = 0.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        # Client des sondes, ouvert au démarrage et réutilisé à chaque passage
+        self._client = LoopClient(timeout=probe_timeout)
+
+    # ------------------------------------------------------------------
+    # Sondes upstream (tâche de fond)
+    # ------------------------------------------------------------------
+
+    async def _probe(self, probe: UpstreamProbe) -> None:
+        try:
+            await self._client.get().get(probe.url)
+            # Toute réponse HTTP, même une erreur, prouve que l'upstream répond
+            probe.reachable, probe.error = True, None
+        except Exception as e:
+            probe.reachable, probe.error = False, f"{type(e).__name__}: {e}"
+        probe.checked_at = time.monotonic()
+
+    async def refresh(self) -> None:
+        self._last_refresh = time.monotonic()
+        await asyncio.gather(*(self._probe(p) for p in self.probes))
+
+    def maybe_refresh(self) -> None:
+        """Relance les sondes en tâche de fond si le dernier passage est trop ancien"""
+        if time.monotonic() - self._last_refresh < self.probe_interval:
+            return
+        if self._refresh_task is None or self._refresh_task.done():
+            self._last_refresh = time.monotonic()
+            self._refresh_task = asyncio.create_task(self.refresh())
+
+    def open(self) -> None:
+        self._client.get()
+
+    async def aclose(self) -> None:
+        if self._refresh_task is not None and not self._refresh_task.done():
+            self._refresh_task.cancel()
+        await self._client.aclose()
+
+    def upstreams_reachable(self) -> bool:
+        """Faux seulement si toutes les sondes ont échoué (inconnu = joignable)"""
+        known = [p.reachable for p in self.probes if p.reachable is not None]
+        return not known or any(known)
+
+    # ------------------------------------------------------------------
+    # Décision
+    # ------------------------------------------------------------------
+
+    def _over_limits(self, schedulers: List[FairScheduler], ratio: float) -> List[str]:
+        reasons = []
+        for scheduler in schedulers:
+            if scheduler.queued > self.max_queue_depth * ratio:
+                reasons.append(f"queue depth {scheduler.queued} on {scheduler.name}")
+        in_flight = sum(s.active + s.queued for s in schedulers)
+        if in_flight > self.max_in_flight * ratio:
+            reasons.append(f"{in_flight} requests in flight")
+        return reasons
+
+    def check(self, schedulers: Iterable[FairScheduler]) -> Tuple[bool, Dict]:
+        """Retourne (prêt, rapport) ; les sondes sont rafraîchies en arrière-plan"""
+        schedulers = list(schedulers)
+        self.maybe_refresh()
+
+        # Hystérésis : une fois saturé, il faut redescendre sous ratio * seuil
+        reasons = self._over_limits(schedulers, 1.0)
+        if not reasons and self.saturated:
+            reasons = self._over_limits(schedulers, self.recovery_ratio)
+        self.saturated = bool(reasons)
+
+        if not self.upstreams_reachable():
+            reasons.append("all upstreams unreachable")
+
+        report = {
+            "status": "not_ready" if reasons else "ready",
+            "reasons": reasons,
+            "saturation": round(max((s.saturation for s in schedulers), default=0.0), 3),
+            "backends": {
+                s.name: {
+                    "in_flight": s.active,
+                    "queued": s.queued,
+                    "concurrency": s.concurrency,
+                    "saturation": round(s.saturation, 3),
+                }
+                for s in schedulers
+            },
+            "upstreams": [p.to_dict() for p in self.probes],
+        }
+        return not reasons, report
+
+
+def _probe_urls_from_env() -> List[str]:
+    urls = os.getenv("READINESS_PROBE_URLS") or os.getenv("KGATEWAY_ENDPOINT", "http://kgateway:80")
+    return [u.strip() for u in urls.split(",") if u.strip()]
+
+
+readiness = ReadinessMonitor(
+    probe_urls=_probe_urls_from_env(),
+    probe_interval=float(os.getenv("READINESS_PROBE_INTERVAL", "10")),
+    probe_timeout=float(os.getenv("READINESS_PROBE_TIMEOUT", "2")),
+    max_queue_depth=int(os.getenv("READY_MAX_QUEUE_DEPTH", "32")),
+    max_in_flight=int(os.getenv("READY_MAX_IN_FLIGHT", "128")),
+    recovery_ratio=float(os.getenv("READY_RECOVERY_RATIO", "0.75")),
+)
@@ -0,0 +1,257 @@
+"""
+Prompt2Prod - Ordonnancement des générations (priorités + WFQ)
+
+Un ordonnanceur par backend upstream limite la concurrence et choisit
+l'ordre de passage des requêtes en attente :
+- weighted fair queuing (start-time fair queuing) entre flux
+  (client, classe de priorité) : un client bavard ne monopolise pas la file
+- poids par classe : une requête `interactive` passe devant le `batch` déjà
+  en file
+- protection contre la famine : une requête qui attend plus de
+  SCHEDULER_STARVATION_SECONDS est servie en priorité
+- annulation : une requête annulée (client parti) libère sa place en file
+  ou son slot ; le temps de calcul économisé est estimé à partir de la
+  durée moyenne d'un appel sur le backend
+
+Configuration (variables d'environnement) :
+- SCHEDULER_LOCAL_CONCURRENCY  : appels simultanés vers Ollama (défaut 2)
+- SCHEDULER_CLOUD_CONCURRENCY  : appels simultanés vers OpenAI (défaut 16)
+- SCHEDULER_WEIGHTS            : poids des classes, ex. "interactive=8,batch=1" ; les
+  classes intégrées (interactive, batch) restent définies si elles sont omises
+- SCHEDULER_STARVATION_SECONDS : attente maximale avant promotion (défaut 30)
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+from src.api.metrics import registry
+from src.api.tracing import tracer
+
+DEFAULT_PRIORITY = "interactive"
+# Classes utilisées par l'API elle-même (défaut des requêtes, trafic miroir)
+BUILTIN_WEIGHTS = {"interactive": 8.0, "batch": 1.0}
+
+QUEUE_WAIT = registry.histogram(
+    "prompt2prod_queue_wait_seconds", "Temps d'attente en file avant l'appel upstream",
+    ["backend", "priority"],
+)
+QUEUE_DEPTH = registry.gauge(
+    "prompt2prod_queue_depth", "Requêtes en attente par backend et classe", ["backend", "priority"],
+)
+IN_FLIGHT = registry.gauge(
+    "prompt2prod_upstream_in_flight", "Appels upstream en cours par backend", ["backend"],
+)
+SATURATION = registry.gauge(
+    "prompt2prod_saturation", "Charge par slot du backend ((en cours + en file) / concurrence)",
+    ["backend"],
+)
+STARVATION_PROMOTIONS = registry.counter(
+    "prompt2prod_queue_starvation_promotions_total", "Requêtes promues par la protection anti-famine",
+    ["backend", "priority"],
+)
+CANCELLED = registry.counter(
+    "prompt2prod_cancelled_total", "Générations annulées avant la fin, en file ou pendant l'appel upstream",
+    ["backend", "stage"],
+)
+SECONDS_SAVED = registry.counter(
+    "prompt2prod_cancelled_seconds_saved_total",
+    "Estimation du temps de calcul upstream économisé par les annulations (s)", ["backend"],
+)
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    weights = {}
+    for item in value.split(","):
+        name, _, weight = item.partition("=")
+        if name.strip() and weight.strip():
+            weights[name.strip()] = float(weight)
+    return weights
+
+
+def class_weights(value: str) -> Dict[str, float]:
+    """Poids configurés, complétés par les classes intégrées omises"""
+    return {**BUILTIN_WEIGHTS, **parse_weights(value)}
+
+
+class _Waiter:
+    __slots__ = ("future", "tenant", "priority", "start_tag", "enqueued", "done")
+
+    def __init__(self, future: asyncio.Future, tenant: str, priority: str, start_tag: float):
+        self.future = future
+        self.tenant = tenant
+        self.priority = priority
+        self.start_tag = start_tag
+        self.enqueued = time.monotonic()
+        # Servi ou annulé : ignoré paresseusement dans le tas et la FIFO
+        self.done = False
+
+
+class FairScheduler:
+    """Sémaphore équitable pondéré pour un backend"""
+
+    def __init__(self, name: str, concurrency: int, weights: Dict[str, float],
+                 starvation_seconds: float = 30.0):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.weights = weights
+        self.starvation_seconds = starvation_seconds
+        self.active = 0
+        self._heap: List[Tuple[float, int, _Waiter]] = []
+        self._fifo: Deque[_Waiter] = deque()
+        self._flow_finish: Dict[Tuple[str, str], float] = {}
+        self._virtual_time = 0.0
+        self._seq = itertools.count()
+        self._depth: Dict[str, int] = {}
+        # Durée moyenne (EWMA) d'un appel terminé, en secondes
+        self.service_time = 0.0
+
+    @property
+    def queued(self) -> int:
+        return sum(self._depth.values())
+
+    @property
+    def saturation(self) -> float:
+        """1.0 : tous les slots occupés ; au-delà, une file se forme"""
+        return (self.active + self.queued) / self.concurrency
+
+    def _publish(self) -> None:
+        IN_FLIGHT.set(self.active, backend=self.name)
+        SATURATION.set(self.saturation, backend=self.name)
+
+    def depth(self, priority: Optional[str] = None) -> int:
+        if priority is None:
+            return self.queued
+        return self._depth.get(priority, 0)
+
+    def estimated_wait(self, priority: str = DEFAULT_PRIORITY) -> float:
+        """
+        Estimation (s) de l'attente en file d'un nouvel appel.
+
+        Seules les requêtes d'une classe au moins aussi prioritaire passent
+        devant ; 0 tant qu'aucune durée n'a été observée.
+        """
+        if self.active < self.concurrency and self.queued == 0:
+            return 0.0
+        weight = self.weights.get(priority, 1.0)
+        ahead = sum(d for p, d in self._depth.items() if self.weights.get(p, 1.0) >= weight)
+        return (ahead + 1) / self.concurrency * self.service_time
+
+    def estimated_latency(self, priority: str = DEFAULT_PRIORITY) -> float:
+        """Estimation (s) de l'attente en file + durée d'un nouvel appel (0 sans observation)"""
+        if self.service_time == 0.0:
+            return 0.0
+        return self.estimated_wait(priority) + self.service_time
+
+    def _set_depth(self, priority: str, delta: int) -> None:
+        self._depth[priority] = self._depth.get(priority, 0) + delta
+        QUEUE_DEPTH.set(self._depth[priority], backend=self.name, priority=priority)
+        SATURATION.set(self.saturation, backend=self.name)
+
+    def _enqueue(self, tenant: str, priority: str, cost: float) -> _Waiter:
+        flow = (tenant, priority)
+        start = max(self._virtual_time, self._flow_finish.get(flow, 0.0))
+        finish = start + cost / self.weights.get(priority, 1.0)
+        self._flow_finish[flow] = finish
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), tenant, priority, start)
+        heapq.heappush(self._heap, (finish, next(self._seq), waiter))
+        self._fifo.append(waiter)
+        self._set_depth(priority, 1)
+        return waiter
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        fifo = self._fifo
+        while fifo and fifo[0].done:
+            fifo.popleft()
+        if fifo and time.monotonic() - fifo[0].enqueued >= self.starvation_seconds:
+            waiter = fifo.popleft()
+            STARVATION_PROMOTIONS.inc(backend=self.name, priority=waiter.priority)
+            return waiter
+        while self._heap:
+            _, _, waiter = heapq.heappop(self._heap)
+            if not waiter.done:
+                return waiter
+        return None
+
+    def _dispatch(self) -> None:
+        while self.active < self.concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                break
+            waiter.done = True
+            self._set_depth(waiter.priority, -1)
+            self._virtual_time = max(self._virtual_time, waiter.start_tag)
+            self.active += 1
+            waiter.future.set_result(None)
+        if self.queued == 0:
+            # File vide : tous les flux sont inactifs, on repart de zéro
+            self._heap.clear()
+            self._fifo.clear()
+            self._flow_finish.clear()
+            self._virtual_time = 0.0
+        self._publish()
+
+    def _release(self) -> None:
+        self.active -= 1
+        self._dispatch()
+
+    def _observe_service(self, seconds: float) -> None:
+        if self.service_time == 0.0:
+            self.service_time = seconds
+        else:
+            self.service_time = 0.8 * self.service_time + 0.2 * seconds
+
+    def _record_cancel(self, stage: str, elapsed: float) -> None:
+        CANCELLED.inc(backend=self.name, stage=stage)
+        SECONDS_SAVED.inc(max(0.0, self.service_time - elapsed), backend=self.name)
+
+    @asynccontextmanager
+    async def slot(self, tenant: str = "", priority: str = DEFAULT_PRIORITY, cost: float = 1.0):
+        """Attend son tour puis occupe un slot du backend pendant l'appel"""
+        started = time.monotonic()
+        if self.active < self.concurrency and self.queued == 0:
+            self.active += 1
+            self._publish()
+        else:
+            waiter = self._enqueue(tenant, priority, cost)
+            with tracer.start_span("queue.wait", {"backend": self.name, "priority": priority}):
+                try:
+                    await waiter.future
+                except asyncio.CancelledError:
+                    if waiter.done and not waiter.future.cancelled():
+                        # Slot attribué au moment de l'annulation : on le rend
+                        self._release()
+                    elif not waiter.done:
+                        waiter.done = True
+                        self._set_depth(priority, -1)
+                        self._dispatch()
+                    self._record_cancel("queued", 0.0)
+                    raise
+        acquired = time.monotonic()
+        QUEUE_WAIT.observe(acquired - started, backend=self.name, priority=priority)
+        try:
+            yield
+        except (asyncio.CancelledError, GeneratorExit):
+            # GeneratorExit : flux streaming fermé par son consommateur
+            self._record_cancel("upstream", time.monotonic() - acquired)
+            raise
+        else:
+            self._observe_service(time.monotonic() - acquired)
+        finally:
+            self._release()
+
+
+WEIGHTS = class_weights(os.getenv("SCHEDULER_WEIGHTS", ""))
+PRIORITIES = tuple(WEIGHTS)
+STARVATION_SECONDS = float(os.getenv("SCHEDULER_STARVATION_SECONDS", "30"))
+
+schedulers: Dict[str, FairScheduler] = {
+    "local": FairScheduler("ollama", int(os.getenv("SCHEDULER_LOCAL_CONCURRENCY", "2")),
+                           WEIGHTS, STARVATION_SECONDS),
+    "cloud": FairScheduler("openai", int(os.getenv("SCHEDULER_CLOUD_CONCURRENCY", "16")),
+                           WEIGHTS, STARVATION_SECONDS),
+}
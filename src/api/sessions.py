@@ -0,0 +1,191 @@
+"""
+Prompt2Prod - Sessions de conversation
+
+Historique conservé côté serveur sous forme compacte, et empaquetage
+du contexte dans la fenêtre du modèle à chaque tour.
+
+L'empaquetage est « stable en préfixe » : la fenêtre envoyée ne recule
+que par paliers, quand le budget est dépassé. Entre deux paliers, chaque
+tour ré-envoie exactement le même préfixe, ce qui permet à Ollama
+(llama.cpp) de réutiliser son cache KV au lieu de ré-évaluer tout le prompt.
+
+Une session appartient au client qui l'a créée (clé API, sinon IP) : pour
+tout autre client, elle n'existe pas.
+
+Configuration (variables d'environnement) :
+- SESSION_MAX_SESSIONS : nombre maximum de sessions en mémoire (LRU)
+- SESSION_TTL_SECONDS  : expiration des sessions inactives
+- SESSION_MAX_MESSAGES : messages conservés par session
+"""
+import asyncio
+import os
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from src.api.tokens import CHARS_PER_TOKEN, estimate_tokens
+
+# Au-delà de cette taille, le contenu est stocké compressé
+COMPRESS_THRESHOLD = 2048
+# Après un recul de fenêtre, on vise ce ratio du budget pour laisser
+# de la marge aux tours suivants (et donc garder le préfixe stable)
+LOW_WATERMARK = 0.6
+
+_ROLES = ("system", "user", "assistant")
+
+
+class Message:
+    """Message compact : rôle codé sur un entier, contenu éventuellement compressé"""
+
+    __slots__ = ("role_code", "_data", "tokens")
+
+    def __init__(self, role: str, content: str):
+        self.role_code = _ROLES.index(role)
+        raw = content.encode("utf-8")
+        self._data = zlib.compress(raw) if len(raw) > COMPRESS_THRESHOLD else content
+        self.tokens = estimate_tokens(content)
+
+    @property
+    def role(self) -> str:
+        return _ROLES[self.role_code]
+
+    @property
+    def content(self) -> str:
+        if isinstance(self._data, bytes):
+            return zlib.decompress(self._data).decode("utf-8")
+        return self._data
+
+    def as_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+
+class Session:
+    """Conversation : prompt système, historique et début de la fenêtre de contexte"""
+
+    def __init__(self, model: Optional[str], mode: str, system: Optional[str] = None,
+                 owner: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.owner = owner
+        self.model = model
+        self.mode = mode
+        self.system = Message("system", system) if system else None
+        self.messages: List[Message] = []
+        self.window_start = 0
+        self.created_at = time.time()
+        self.last_used = time.monotonic()
+        # Sérialise les tours concurrents d'une même session
+        self.lock = asyncio.Lock()
+
+    def append(self, role: str, content: str, max_messages: int) -> None:
+        self.messages.append(Message(role, content))
+        overflow = len(self.messages) - max_messages
+        if overflow > 0:
+            # Les messages hors fenêtre ne sont plus jamais envoyés : on les oublie
+            del self.messages[:overflow]
+            self.window_start = max(0, self.window_start - overflow)
+
+    def pack(self, prompt: str, budget_tokens: int) -> Tuple[List[Dict[str, str]], Dict[str, int]]:
+        """
+        Construit la liste de messages pour un nouveau tour.
+
+        Garde le prompt système et les échanges les plus récents qui tiennent
+        dans `budget_tokens`. Le dernier prompt est tronqué (par la fin
+        conservée) s'il dépasse à lui seul le budget.
+        """
+        system_tokens = self.system.tokens if self.system else 0
+        prompt_tokens = estimate_tokens(prompt)
+        available = budget_tokens - system_tokens - prompt_tokens
+
+        truncated_prompt = False
+        if available < 0:
+            keep_chars = max(0, budget_tokens - system_tokens) * CHARS_PER_TOKEN
+            prompt = prompt[-keep_chars:] if keep_chars else ""
+            prompt_tokens = estimate_tokens(prompt)
+            truncated_prompt = True
+            available = 0
+
+        history = self.messages
+        window_tokens = sum(m.tokens for m in history[self.window_start:])
+        if window_tokens > available:
+            # Recul par palier jusqu'au low watermark, aligné sur un message utilisateur
+            target = int(available * LOW_WATERMARK)
+            start = self.window_start
+            while start < len(history) and window_tokens > target:
+                window_tokens -= history[start].tokens
+                start += 1
+            while start < len(history) and history[start].role != "user":
+                window_tokens -= history[start].tokens
+                start += 1
+            self.window_start = start
+
+        messages = [self.system.as_dict()] if self.system else []
+        messages.extend(m.as_dict() for m in history[self.window_start:])
+        messages.append({"role": "user", "content": prompt})
+        stats = {
+            "context_tokens": system_tokens + window_tokens + prompt_tokens,
+            "history_messages": len(history) - self.window_start,
+            "dropped_messages": self.window_start,
+            "truncated_prompt": int(truncated_prompt),
+        }
+        return messages, stats
+
+
+class SessionStore:
+    """Sessions en mémoire, évincées par LRU et par inactivité"""
+
+    def __init__(self, max_sessions: int = 1000, ttl_seconds: float = 3600.0, max_messages: int = 200):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_messages = max_messages
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _evict(self, now: float) -> None:
+        sessions = self._sessions
+        while sessions:
+            oldest = next(iter(sessions.values()))
+            if len(sessions) > self.max_sessions or now - oldest.last_used > self.ttl_seconds:
+                sessions.popitem(last=False)
+            else:
+                break
+
+    def create(self, model: Optional[str], mode: str, system: Optional[str] = None,
+               owner: Optional[str] = None) -> Session:
+        session = Session(model, mode, system, owner)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._evict(session.last_used)
+        return session
+
+    def get(self, session_id: str, owner: Optional[str] = None) -> Optional[Session]:
+        """Session du client `owner` (None si inconnue, expirée ou à un autre client)"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id)
+            if session is None or session.owner != owner:
+                return None
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def delete(self, session_id: str, owner: Optional[str] = None) -> bool:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.owner != owner:
+                return False
+            del self._sessions[session_id]
+            return True
+
+
+sessions = SessionStore(
+    max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", "1000")),
+    ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", "3600")),
+    max_messages=int(os.getenv("SESSION_MAX_MESSAGES", "200")),
+)
@@ -0,0 +1,255 @@
+"""
+Prompt2Prod - Trafic miroir vers des modèles candidats
+
+Avant de basculer du trafic vers un autre modèle (ex. de gpt-4o-mini vers
+un modèle local), une fraction des requêtes /generate servies par le
+modèle source est rejouée vers le candidat, une fois la réponse envoyée
+au client. La réponse du candidat est jetée : seules sa latence et sa
+taille sont comparées à celles de l'appel principal, par paire
+source -> candidat (`/debug/shadow`, métriques `prompt2prod_shadow_*`).
+
+Le trafic miroir ne doit jamais pénaliser le trafic réel :
+- au plus SHADOW_MAX_CONCURRENCY appels miroir simultanés ; au-delà, la
+  requête n'est pas rejouée (comptée `dropped`), rien n'est mis en file
+- capacité libre exigée sur le backend candidat : la requête n'est rejouée
+  que si son ordonnanceur a un slot inoccupé (`en cours + en file <
+  concurrence`), et les appels miroir y occupent au plus `concurrence - 1`
+  slots : un slot reste toujours disponible pour le trafic réel
+- appels en priorité `batch` sous le tenant `shadow` : l'ordonnanceur du
+  backend candidat sert d'abord les requêtes interactives
+- deadline propre (SHADOW_TIMEOUT_SECONDS), erreurs comptées et jamais
+  remontées au client
+
+Configuration (variables d'environnement) :
+- SHADOW_RULES           : paires séparées par `;`, `source>candidat`, `modele@mode`
+  pour préciser le mode, ex. "gpt-4o-mini@cloud>llama3.2:1b@local"
+- SHADOW_SAMPLE_RATE     : fraction des requêtes source rejouées (défaut 0.05)
+- SHADOW_MAX_CONCURRENCY : appels miroir simultanés au plus (défaut 2)
+- SHADOW_TIMEOUT_SECONDS : deadline d'un appel miroir (défaut 120)
+- SHADOW_WINDOW          : dernières mesures conservées par paire (défaut 1000)
+- SHADOW_DRAIN_SECONDS   : à l'arrêt, attente des appels miroir en cours avant
+  abandon (défaut 5)
+"""
+import asyncio
+import logging
+import os
+import random
+import statistics
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from src.api.deadline import Deadline, deadline_scope
+from src.api.metrics import registry
+from src.api.scheduler import FairScheduler
+
+logger = logging.getLogger("prompt2prod.shadow")
+
+SHADOW_REQUESTS = registry.counter(
+    "prompt2prod_shadow_requests_total", "Appels miroir vers les modèles candidats",
+    ["candidate", "outcome"],  # ok, error, dropped, busy
+)
+SHADOW_LATENCY = registry.histogram(
+    "prompt2prod_shadow_latency_seconds", "Latence des appels comparés (principal et miroir)",
+    ["pair", "role"],  # role : primary, candidate
+)
+SHADOW_ACTIVE = registry.gauge(
+    "prompt2prod_shadow_active", "Appels miroir en cours",
+)
+
+
+class ShadowRule(NamedTuple):
+    """Paire source -> candidat ; mode None = tout mode (source) ou même mode (candidat)"""
+    model: str
+    mode: Optional[str]
+    candidate_model: str
+    candidate_mode: Optional[str]
+
+    @property
+    def pair(self) -> str:
+        return f"{self.model}>{self.candidate_model}"
+
+
+def parse_rules(value: str) -> List[ShadowRule]:
+    rules = []
+    for rule in value.split(";"):
+        source, _, candidate = rule.partition(">")
+        model, _, mode = source.strip().partition("@")
+        candidate_model, _, candidate_mode = candidate.strip().partition("@")
+        if model and candidate_model:
+            rules.append(ShadowRule(model, mode or None, candidate_model, candidate_mode or None))
+    return rules
+
+
+def _summary(values: deque) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return {
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": round(ordered[len(ordered) // 2], 3),
+        "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 3),
+    }
+
+
+class PairStats:
+    """Dernières mesures d'une paire : latences (s) et tailles de réponse (caractères)"""
+
+    def __init__(self, window: int):
+        self.mirrored = 0
+        self.errors = 0
+        self.dropped = 0
+        self.latency = {"primary": deque(maxlen=window), "candidate": deque(maxlen=window)}
+        self.chars = {"primary": deque(maxlen=window), "candidate": deque(maxlen=window)}
+
+    def to_dict(self) -> Dict:
+        latency = {role: _summary(values) for role, values in self.latency.items()}
+        chars = {role: _summary(values) for role, values in self.chars.items()}
+        report = {
+            "mirrored": self.mirrored,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "latency_seconds": latency,
+            "response_chars": chars,
+        }
+        if latency["primary"] and latency["candidate"] and latency["primary"]["p50"]:
+            report["latency_p50_ratio"] = round(latency["candidate"]["p50"] / latency["primary"]["p50"], 3)
+        if chars["primary"] and chars["candidate"] and chars["primary"]["mean"]:
+            report["response_chars_ratio"] = round(chars["candidate"]["mean"] / chars["primary"]["mean"], 3)
+        return report
+
+
+class Shadower:
+    """Rejoue une fraction des requêtes vers les candidats, sous un plafond de concurrence strict"""
+
+    def __init__(self, rules: List[ShadowRule], sample_rate: float = 0.05, max_concurrency: int = 2,
+                 timeout: float = 120.0, window: int = 1000, drain_seconds: float = 5.0):
+        self.rules = rules
+        self.sample_rate = sample_rate
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.window = window
+        self.drain_seconds = drain_seconds
+        self.active = 0
+        self._stats: Dict[str, PairStats] = {}
+        self._tasks: Dict[asyncio.Task, Optional[str]] = {}
+        # Appels miroir en cours (ou lancés) par backend candidat
+        self._per_backend: Dict[str, int] = {}
+
+    def stats(self, rule: ShadowRule) -> PairStats:
+        stats = self._stats.get(rule.pair)
+        if stats is None:
+            stats = self._stats[rule.pair] = PairStats(self.window)
+        return stats
+
+    def select(self, model: Optional[str], mode: str) -> List[ShadowRule]:
+        """Paires à rejouer pour une requête servie par (model, mode), après tirage"""
+        if not self.rules or self.sample_rate <= 0:
+            return []
+        matching = [r for r in self.rules if r.model == model and r.mode in (None, mode)]
+        if not matching or random.random() >= self.sample_rate:  # nosec B311
+            return []
+        return matching
+
+    def has_capacity(self, scheduler: FairScheduler) -> bool:
+        """Le backend candidat a-t-il un slot libre, hors réserve du trafic réel ?"""
+        if scheduler.active + scheduler.queued >= scheduler.concurrency:
+            return False
+        return self._per_backend.get(scheduler.name, 0) < scheduler.concurrency - 1
+
+    def submit(self, rule: ShadowRule, call: Callable[[], Awaitable[str]],
+               primary_latency: float, primary_chars: int,
+               scheduler: Optional[FairScheduler] = None) -> bool:
+        """
+        Lance l'appel miroir `call()` en tâche détachée, si le plafond et la
+        capacité libre de `scheduler` (ordonnanceur du backend candidat) le
+        permettent ; retourne False si la requête n'est pas rejouée.
+        """
+        stats = self.stats(rule)
+        if self.active >= self.max_concurrency:
+            outcome = "dropped"
+        elif scheduler is not None and not self.has_capacity(scheduler):
+            outcome = "busy"
+        else:
+            outcome = None
+        if outcome is not None:
+            stats.dropped += 1
+            SHADOW_REQUESTS.inc(candidate=rule.candidate_model, outcome=outcome)
+            return False
+        self.active += 1
+        SHADOW_ACTIVE.set(self.active)
+        backend = scheduler.name if scheduler is not None else None
+        if backend is not None:
+            self._per_backend[backend] = self._per_backend.get(backend, 0) + 1
+        task = asyncio.get_running_loop().create_task(self._mirror(rule, call, primary_latency, primary_chars))
+        self._tasks[task] = backend
+        task.add_done_callback(self._finished)
+        return True
+
+    def _finished(self, task: asyncio.Task) -> None:
+        # Rappel de fin de tâche : aussi appelé si la tâche est annulée avant de démarrer
+        backend = self._tasks.pop(task, None)
+        if backend is not None:
+            self._per_backend[backend] -= 1
+        self.active -= 1
+        SHADOW_ACTIVE.set(self.active)
+
+    async def _mirror(self, rule: ShadowRule, call: Callable[[], Awaitable[str]],
+                      primary_latency: float, primary_chars: int) -> None:
+        stats = self.stats(rule)
+        started = time.perf_counter()
+        try:
+            with deadline_scope(Deadline(self.timeout)):
+                response_text = await call()
+        except Exception as e:
+            stats.errors += 1
+            SHADOW_REQUESTS.inc(candidate=rule.candidate_model, outcome="error")
+            logger.debug("Shadow call %s failed: %s", rule.pair, e)
+            return
+        latency = time.perf_counter() - started
+        stats.mirrored += 1
+        stats.latency["primary"].append(primary_latency)
+        stats.latency["candidate"].append(latency)
+        stats.chars["primary"].append(primary_chars)
+        stats.chars["candidate"].append(len(response_text))
+        SHADOW_REQUESTS.inc(candidate=rule.candidate_model, outcome="ok")
+        SHADOW_LATENCY.observe(primary_latency, pair=rule.pair, role="primary")
+        SHADOW_LATENCY.observe(latency, pair=rule.pair, role="candidate")
+
+    def report(self) -> Dict:
+        return {
+            "enabled": bool(self.rules) and self.sample_rate > 0,
+            "sample_rate": self.sample_rate,
+            "max_concurrency": self.max_concurrency,
+            "active": self.active,
+            "pairs": {
+                rule.pair: {
+                    "source": {"model": rule.model, "mode": rule.mode},
+                    "candidate": {"model": rule.candidate_model, "mode": rule.candidate_mode},
+                    **self.stats(rule).to_dict(),
+                }
+                for rule in self.rules
+            },
+        }
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        """Attend la fin des appels miroir en cours (au plus `timeout` secondes)"""
+        if self._tasks:
+            await asyncio.wait(list(self._tasks), timeout=timeout)
+
+    async def aclose(self) -> None:
+        """Arrêt : les appels miroir en cours sont abandonnés"""
+        tasks: Tuple[asyncio.Task, ...] = tuple(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+shadow = Shadower(
+    parse_rules(os.getenv("SHADOW_RULES", "")),
+    sample_rate=float(os.getenv("SHADOW_SAMPLE_RATE", "0.05")),
+    max_concurrency=int(os.getenv("SHADOW_MAX_CONCURRENCY", "2")),
+    timeout=float(os.getenv("SHADOW_TIMEOUT_SECONDS", "120")),
+    window=int(os.getenv("SHADOW_WINDOW", "1000")),
+    drain_seconds=float(os.getenv("SHADOW_DRAIN_SECONDS", "5")),
+)
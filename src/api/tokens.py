@@ -0,0 +1,43 @@
+"""
+Prompt2Prod - Estimation du nombre de tokens
+
+Heuristique sans tokenizer (~4 caractères par token pour l'anglais et le
+code), suffisante pour le rate limiting et le dimensionnement de contexte.
+"""
+from typing import Any, Dict, Optional
+
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estime le nombre de tokens d'un texte (0 si vide)"""
+    if not text:
+        return 0
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def usage_tokens(data: Dict[str, Any]) -> Optional[int]:
+    """Total de tokens déclaré par l'upstream (champ `usage` OpenAI/Ollama), ou None"""
+    usage = data.get("usage") if isinstance(data, dict) else None
+    if isinstance(usage, dict):
+        if isinstance(usage.get("total_tokens"), int):
+            return usage["total_tokens"]
+        parts = [usage.get("prompt_tokens"), usage.get("completion_tokens")]
+        if any(isinstance(p, int) for p in parts):
+            return sum(p for p in parts if isinstance(p, int))
+    # Format natif Ollama
+    if isinstance(data, dict) and isinstance(data.get("eval_count"), int):
+        return data["eval_count"] + int(data.get("prompt_eval_count") or 0)
+    return None
+
+
+def completion_tokens(data: Dict[str, Any]) -> Optional[int]:
+    """Tokens générés déclarés par l'upstream (`usage.completion_tokens` ou `eval_count` Ollama), ou None"""
+    if not isinstance(data, dict):
+        return None
+    usage = data.get("usage")
+    if isinstance(usage, dict) and isinstance(usage.get("completion_tokens"), int):
+        return usage["completion_tokens"]
+    if isinstance(data.get("eval_count"), int):
+        return data["eval_count"]
+    return None
@@ -0,0 +1,371 @@
+"""
+Prompt2Prod - Tracing distribué (W3C Trace Context)
+
+Spans légers pour la requête entrante, chaque tentative upstream, les
+lookups de cache et les attentes en file. Le header `traceparent` est
+propagé vers KGateway et Ollama pour relier les segments entre eux.
+
+Configuration (variables d'environnement) :
+- TRACING_SAMPLE_RATE : taux d'échantillonnage en tête (0.0 à 1.0, défaut 0.0)
+- TRACING_EXPORTER    : none | memory | file (défaut none)
+- TRACING_FILE        : chemin du fichier JSONL pour l'exporter file
+"""
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+TRACEPARENT_HEADER = "traceparent"
+_TRACEPARENT_RE = re.compile(r"^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_INVALID_TRACE_ID = "0" * 32
+_INVALID_SPAN_ID = "0" * 16
+
+
+def _new_trace_id() -> str:
+    return f"{random.getrandbits(128):032x}"  # nosec B311
+
+
+def _new_span_id() -> str:
+    return f"{random.getrandbits(64):016x}"  # nosec B311
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[tuple]:
+    """Parse un header traceparent -> (trace_id, parent_id, sampled) ou None si invalide"""
+    if not value:
+        return None
+    match = _TRACEPARENT_RE.match(value.strip().lower())
+    if not match:
+        return None
+    version, trace_id, parent_id, flags = match.groups()
+    if version == "ff" or trace_id == _INVALID_TRACE_ID or parent_id == _INVALID_SPAN_ID:
+        return None
+    return trace_id, parent_id, bool(int(flags, 16) & 0x01)
+
+
+def format_traceparent(trace_id: str, span_id: str, sampled: bool) -> str:
+    return f"00-{trace_id}-{span_id}-{'01' if sampled else '00'}"
+
+
+# ============================================================================
+# Spans
+# ============================================================================
+
+class Span:
+    """Span enregistré (échantillonné), exporté à sa fermeture"""
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id",
+                 "start", "end", "attributes", "status", "_token")
+    sampled = True
+
+    def __init__(self, tracer: "Tracer", name: str, trace_id: str,
+                 parent_id: Optional[str], attributes: Optional[Dict[str, Any]] = None):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = _new_span_id()
+        self.parent_id = parent_id
+        self.start = time.time()
+        self.end: Optional[float] = None
+        self.attributes = dict(attributes) if attributes else {}
+        self.status = "ok"
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def record_error(self, error: BaseException) -> None:
+        self.status = "error"
+        self.attributes["error.type"] = type(error).__name__
+
+    def traceparent(self) -> str:
+        return format_traceparent(self.trace_id, self.span_id, True)
+
+    def finish(self) -> None:
+        if self.end is None:
+            self.end = time.time()
+            self.tracer.exporter.export([self])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.start,
+            "duration_ms": round(((self.end or time.time()) - self.start) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+    def __enter__(self) -> "Span":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc is not None:
+            self.record_error(exc)
+        _current_span.reset(self._token)
+        self.finish()
+
+
+class NonRecordingSpan:
+    """
+    Span racine non échantillonné : ne mesure et n'exporte rien, mais
+    porte le contexte pour que le `traceparent` reste propagé (flag 00).
+    """
+
+    __slots__ = ("trace_id", "span_id", "_token")
+    sampled = False
+    name = ""
+    attributes: Dict[str, Any] = {}
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self._token = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def traceparent(self) -> str:
+        return format_traceparent(self.trace_id, self.span_id, False)
+
+    def finish(self) -> None:
+        pass
+
+    def __enter__(self) -> "NonRecordingSpan":
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current_span.reset(self._token)
+
+
+class _NoopChildSpan:
+    """Enfant d'un span non échantillonné : singleton sans effet"""
+
+    __slots__ = ()
+    sampled = False
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def finish(self) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopChildSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+_NOOP_CHILD = _NoopChildSpan()
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("prompt2prod_span", default=None)
+
+
+def current_span():
+    """Span actif dans le contexte courant (ou None)"""
+    return _current_span.get()
+
+
+# ============================================================================
+# Exporters
+# ============================================================================
+
+class SpanExporter:
+    """Interface d'export : surcharger `export`"""
+
+    def export(self, spans: List[Span]) -> None:
+        raise NotImplementedError
+
+    def shutdown(self) -> None:
+        pass
+
+
+class NoopExporter(SpanExporter):
+    def export(self, spans: List[Span]) -> None:
+        pass
+
+
+class InMemoryExporter(SpanExporter):
+    """Conserve les derniers spans en mémoire (tests, debug)"""
+
+    def __init__(self, max_spans: int = 10000):
+        self.spans: Deque[Span] = deque(maxlen=max_spans)
+
+    def export(self, spans: List[Span]) -> None:
+        self.spans.extend(spans)
+
+    def finished(self, name: Optional[str] = None) -> List[Span]:
+        return [s for s in self.spans if name is None or s.name == name]
+
+    def clear(self) -> None:
+        self.spans.clear()
+
+
+class FileExporter(SpanExporter):
+    """
+    Ajoute chaque span en JSONL dans un fichier local (lecture hors-ligne).
+
+    L'écriture passe par une file et un thread (QueueListener), comme les
+    logs : `export` est appelé sur la boucle asyncio et ne fait aucune I/O.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._logger: Optional[logging.Logger] = None
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._lock = threading.Lock()
+
+    def _writer(self) -> logging.Logger:
+        """Logger dédié branché (au premier usage) sur le fichier via une file"""
+        with self._lock:
+            if self._logger is None:
+                handler = logging.FileHandler(self.path, encoding="utf-8", delay=True)
+                handler.setFormatter(logging.Formatter("%(message)s"))
+                records: queue.SimpleQueue = queue.SimpleQueue()
+                self._listener = logging.handlers.QueueListener(records, handler)
+                self._listener.start()
+                atexit.register(self.shutdown)
+                logger = logging.getLogger(f"prompt2prod.tracing.{id(self)}")
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.handlers = [logging.handlers.QueueHandler(records)]
+                self._logger = logger
+            return self._logger
+
+    def export(self, spans: List[Span]) -> None:
+        writer = self._writer()
+        for span in spans:
+            writer.info(json.dumps(span.to_dict(), default=str))
+
+    def shutdown(self) -> None:
+        """Vide la file et ferme le fichier"""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                for handler in self._listener.handlers:
+                    handler.close()
+                self._listener = None
+                self._logger = None
+
+
+# ============================================================================
+# Tracer
+# ============================================================================
+
+class Tracer:
+    """
+    Fabrique de spans avec échantillonnage en tête.
+
+    La décision d'échantillonnage est prise une seule fois, sur le span
+    racine : un `traceparent` entrant est respecté, sinon on tire au sort
+    selon `sample_rate`. Les spans enfants héritent de la décision.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, exporter: Optional[SpanExporter] = None):
+        self.sample_rate = max(0.0, min(1.0, sample_rate))
+        self.exporter = exporter or NoopExporter()
+
+    def start_span(self, name: str, attributes: Optional[Dict[str, Any]] = None,
+                   traceparent: Optional[str] = None):
+        """
+        Crée un span enfant du span courant, ou un span racine.
+
+        À utiliser comme context manager : `with tracer.start_span("x") as span:`
+        """
+        parent = _current_span.get()
+        if parent is not None:
+            if not parent.sampled:
+                return _NOOP_CHILD
+            return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+        incoming = parse_traceparent(traceparent)
+        if incoming is not None:
+            trace_id, parent_id, sampled = incoming
+        else:
+            trace_id, parent_id = _new_trace_id(), None
+            sampled = self.sample_rate > 0.0 and random.random() < self.sample_rate  # nosec B311
+        if not sampled:
+            return NonRecordingSpan(trace_id, _new_span_id())
+        return Span(self, name, trace_id, parent_id, attributes)
+
+    def shutdown(self) -> None:
+        """Arrêt : vide l'exporter"""
+        self.exporter.shutdown()
+
+    def inject(self, headers: Dict[str, str]) -> Dict[str, str]:
+        """Ajoute le header traceparent du span courant aux headers sortants"""
+        span = _current_span.get()
+        if span is not None:
+            headers[TRACEPARENT_HEADER] = span.traceparent()
+        return headers
+
+
+def _exporter_from_env() -> SpanExporter:
+    kind = os.getenv("TRACING_EXPORTER", "none").lower()
+    if kind == "memory":
+        return InMemoryExporter()
+    if kind == "file":
+        return FileExporter(os.getenv("TRACING_FILE", "traces.jsonl"))
+    return NoopExporter()
+
+
+tracer = Tracer(
+    sample_rate=float(os.getenv("TRACING_SAMPLE_RATE", "0.0")),
+    exporter=_exporter_from_env(),
+)
+
+
+class TracingMiddleware:
+    """
+    Middleware ASGI : ouvre un span racine par requête HTTP entrante.
+
+    Implémenté en ASGI pur (pas BaseHTTPMiddleware) pour ne pas perturber
+    le streaming ni la détection de déconnexion client.
+    """
+
+    def __init__(self, app, tracer: Tracer = tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        traceparent = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                traceparent = value.decode("latin-1")
+                break
+
+        span = self.tracer.start_span("http.request", traceparent=traceparent)
+        if span.sampled:
+            span.set_attribute("http.method", scope.get("method"))
+            span.set_attribute("http.path", scope.get("path"))
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+            await send(message)
+
+        with span:
+            await self.app(scope, receive, send_wrapper if span.sampled else send)
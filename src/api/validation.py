@@ -0,0 +1,190 @@
+"""
+Prompt2Prod - Validation du code généré
+
+Extrait les blocs de code (```lang ... ```) d'une réponse et vérifie leur
+syntaxe : Python (ast), JSON, YAML (si PyYAML est installé), TOML.
+
+Le parsing tourne dans un ProcessPoolExecutor pour garder le CPU hors de
+la boucle d'événements ; les résultats sont mis en cache par empreinte
+du contenu. Si un processus du pool meurt (ex. code pathologique qui fait
+planter le parseur), le pool est recréé et le bloc est signalé invalide.
+
+Configuration (variables d'environnement) :
+- VALIDATION_WORKERS     : processus du pool (défaut 2)
+- VALIDATION_CACHE_SIZE  : résultats conservés en cache (défaut 2048)
+- VALIDATION_MAX_REPAIRS : plafond serveur des re-prompts de réparation (défaut 2)
+"""
+import ast
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from src.api.metrics import registry
+from src.api.tracing import tracer
+
+logger = logging.getLogger("prompt2prod.validation")
+
+FENCE_RE = re.compile(r"```[ \t]*([\w+#.-]*)[^\n]*\n(.*?)```", re.DOTALL)
+
+LANGUAGE_ALIASES = {
+    "py": "python", "python": "python", "python3": "python",
+    "json": "json",
+    "yaml": "yaml", "yml": "yaml",
+    "toml": "toml",
+}
+
+MAX_REPAIRS = int(os.getenv("VALIDATION_MAX_REPAIRS", "2"))
+
+CACHE_LOOKUPS = registry.counter(
+    "prompt2prod_validation_cache_total", "Lookups du cache de validation", ["result"],
+)
+
+
+def extract_code_blocks(text: str) -> List[Tuple[str, str]]:
+    """Blocs de code clôturés -> [(langage normalisé ou étiquette brute, code)]"""
+    blocks = []
+    for lang, code in FENCE_RE.findall(text or ""):
+        lang = lang.lower()
+        blocks.append((LANGUAGE_ALIASES.get(lang, lang or "text"), code))
+    return blocks
+
+
+def check_syntax(language: str, code: str) -> Dict:
+    """
+    Vérifie la syntaxe d'un bloc (exécuté dans un processus du pool).
+
+    Retourne {"status": "valid" | "invalid" | "skipped", "error": ..., "line": ...}
+    """
+    try:
+        if language == "python":
+            ast.parse(code)
+        elif language == "json":
+            json.loads(code)
+        elif language == "toml":
+            import tomllib
+            tomllib.loads(code)
+        elif language == "yaml":
+            try:
+                import yaml
+            except ImportError:
+                return {"status": "skipped", "error": "PyYAML not installed", "line": None}
+            list(yaml.safe_load_all(code))
+        else:
+            return {"status": "skipped", "error": None, "line": None}
+    except SyntaxError as e:
+        return {"status": "invalid", "error": f"{type(e).__name__}: {e.msg}", "line": e.lineno}
+    except json.JSONDecodeError as e:
+        return {"status": "invalid", "error": f"JSONDecodeError: {e.msg}", "line": e.lineno}
+    except Exception as e:
+        mark = getattr(e, "problem_mark", None)
+        line = mark.line + 1 if mark is not None else getattr(e, "lineno", None)
+        return {"status": "invalid", "error": f"{type(e).__name__}: {e}", "line": line}
+    return {"status": "valid", "error": None, "line": None}
+
+
+class CodeValidator:
+    """Validation parallèle des blocs, avec cache LRU par empreinte"""
+
+    def __init__(self, workers: int = 2, cache_size: int = 2048):
+        self.workers = max(1, workers)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Dict]" = OrderedDict()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def shutdown(self, executor: Optional[ProcessPoolExecutor] = None) -> None:
+        """Arrête le pool (seulement s'il s'agit encore de `executor`, si fourni)"""
+        with self._lock:
+            if self._executor is not None and executor in (None, self._executor):
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    @staticmethod
+    def _digest(language: str, code: str) -> str:
+        return hashlib.sha256(f"{language}\0{code}".encode("utf-8")).hexdigest()
+
+    def _cached(self, digest: str) -> Optional[Dict]:
+        with tracer.start_span("cache.lookup", {"cache": "validation"}) as span:
+            result = self._cache.get(digest)
+            span.set_attribute("cache.hit", result is not None)
+        if result is not None:
+            self._cache.move_to_end(digest)
+        CACHE_LOOKUPS.inc(result="hit" if result is not None else "miss")
+        return result
+
+    def _store(self, digest: str, result: Dict) -> None:
+        self._cache[digest] = result
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    async def _check(self, language: str, code: str) -> Dict:
+        digest = self._digest(language, code)
+        result = self._cached(digest)
+        if result is None:
+            if language in ("python", "json", "toml", "yaml"):
+                loop = asyncio.get_running_loop()
+                executor = self._pool()
+                try:
+                    result = await loop.run_in_executor(executor, check_syntax, language, code)
+                except BrokenProcessPool:
+                    # Processus mort : pool recréé au prochain appel, résultat non mis en cache
+                    logger.warning("Validation worker died on a %s block, restarting pool", language)
+                    self.shutdown(executor)
+                    return {"status": "invalid", "error": "BrokenProcessPool: validation worker crashed",
+                            "line": None}
+            else:
+                result = check_syntax(language, code)
+            self._store(digest, result)
+        return result
+
+    async def validate(self, text: str) -> Dict:
+        """
+        Valide tous les blocs d'une réponse en parallèle.
+
+        `valid` est False dès qu'un bloc est invalide ; une réponse sans bloc
+        reconnu est considérée valide (rien à vérifier).
+        """
+        blocks = extract_code_blocks(text)
+        results = await asyncio.gather(*(self._check(lang, code) for lang, code in blocks))
+        report = []
+        for index, ((language, code), result) in enumerate(zip(blocks, results)):
+            report.append({"index": index, "language": language, "lines": code.count("\n"), **result})
+        return {
+            "valid": all(r["status"] != "invalid" for r in report),
+            "checked": sum(r["status"] != "skipped" for r in report),
+            "blocks": report,
+        }
+
+
+def repair_prompt(report: Dict) -> str:
+    """Message de re-prompt listant les erreurs de syntaxe détectées"""
+    errors = []
+    for block in report["blocks"]:
+        if block["status"] == "invalid":
+            where = f" (line {block['line']})" if block.get("line") else ""
+            errors.append(f"- block {block['index'] + 1} [{block['language']}]{where}: {block['error']}")
+    return (
+        "The code in your previous answer does not parse:\n"
+        + "\n".join(errors)
+        + "\nReturn the complete corrected answer, with every code block syntactically valid."
+    )
+
+
+validator = CodeValidator(
+    workers=int(os.getenv("VALIDATION_WORKERS", "2")),
+    cache_size=int(os.getenv("VALIDATION_CACHE_SIZE", "2048")),
+)
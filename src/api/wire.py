@@ -0,0 +1,157 @@
+"""
+Prompt2Prod - Format binaire MessagePack (négociation de contenu)
+
+Les services internes appellent /generate et /models à haut débit :
+l'encodage/décodage JSON de longues réponses de code pèse sur le CPU des
+deux côtés. MessagePack est proposé en alternative, négociée par requête :
+- corps de requête : `Content-Type: application/msgpack` (ou
+  `application/x-msgpack`, `application/vnd.msgpack`)
+- réponse : `Accept: application/msgpack` (q-values respectées ; JSON
+  reste le défaut)
+- flux NDJSON (fan-out `all`) : objets MessagePack concaténés, à lire avec
+  `msgpack.Unpacker`
+- WebSocket : sous-protocole `msgpack` (`Sec-WebSocket-Protocol`), un
+  message MessagePack par trame binaire
+
+Le schéma est le même qu'en JSON : une map MessagePack par objet, mêmes
+clés, mêmes types (PromptRequest et PromptResponse sont validés et
+sérialisés par les mêmes modèles pydantic). Les erreurs restent en JSON.
+
+Dépendance optionnelle : sans le paquet `msgpack`, les réponses restent en
+JSON et un corps MessagePack est refusé (415).
+"""
+from typing import Any, Callable, Coroutine, Dict, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.datastructures import DefaultPlaceholder
+from fastapi.responses import JSONResponse, Response
+from fastapi.routing import APIRoute
+
+from src.api.metrics import registry
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - dépendance optionnelle
+    msgpack = None
+
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+WS_SUBPROTOCOL = "msgpack"
+
+WIRE_RESPONSES = registry.counter(
+    "prompt2prod_wire_responses_total", "Réponses par format négocié", ["format"],
+)
+
+
+def available() -> bool:
+    return msgpack is not None
+
+
+def packb(obj: Any) -> bytes:
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def unpackb(data: bytes) -> Any:
+    """Décode un objet MessagePack (400 si le corps est invalide)"""
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid MessagePack body: {type(e).__name__}")
+
+
+def _media_type(value: Optional[str]) -> str:
+    return (value or "").split(";", 1)[0].strip().lower()
+
+
+def is_msgpack(content_type: Optional[str]) -> bool:
+    return _media_type(content_type) in MSGPACK_TYPES
+
+
+def _accept_quality(accept: str) -> Dict[str, float]:
+    qualities: Dict[str, float] = {}
+    for item in accept.split(","):
+        media_type, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[media_type.strip().lower()] = quality
+    return qualities
+
+
+def prefers_msgpack(accept: Optional[str]) -> bool:
+    """
+    Le header Accept préfère-t-il MessagePack à JSON ? Le type le plus
+    précis l'emporte : MessagePack nommé bat `*/*` ou `application/*` à
+    qualité égale ; seul un `application/json` explicite de même qualité
+    départage en faveur de JSON.
+    """
+    if not accept or not available():
+        return False
+    qualities = _accept_quality(accept)
+    msgpack_q = max((qualities.get(t, 0.0) for t in MSGPACK_TYPES), default=0.0)
+    if msgpack_q <= 0:
+        return False
+    if "application/json" in qualities:
+        return msgpack_q > qualities["application/json"]
+    return msgpack_q >= qualities.get("application/*", qualities.get("*/*", 0.0))
+
+
+def wants_msgpack(request: Request) -> bool:
+    return prefers_msgpack(request.headers.get("accept"))
+
+
+class MsgPackResponse(Response):
+    media_type = MSGPACK
+
+    def render(self, content: Any) -> bytes:
+        return packb(content)
+
+
+class MsgPackRequest(Request):
+    """Requête dont le corps MessagePack est exposé par `json()` (validation pydantic inchangée)"""
+
+    async def json(self) -> Any:
+        if not hasattr(self, "_json"):
+            self._json = unpackb(await self.body())
+        return self._json
+
+
+def _as_json_request(request: Request) -> MsgPackRequest:
+    # FastAPI ne lit via `json()` que les corps déclarés JSON : le Content-Type est réécrit
+    headers = [(k, v) for k, v in request.scope["headers"] if k != b"content-type"]
+    headers.append((b"content-type", b"application/json"))
+    return MsgPackRequest({**request.scope, "headers": headers}, request.receive)
+
+
+class WireRoute(APIRoute):
+    """Route acceptant des corps MessagePack et servant MessagePack sur demande (Accept)"""
+
+    def get_route_handler(self) -> Callable[[Request], Coroutine[Any, Any, Response]]:
+        json_handler = super().get_route_handler()
+        # Négociation réservée aux routes JSON (pas /metrics ni les réponses texte)
+        response_class = self.response_class
+        default = response_class.value if isinstance(response_class, DefaultPlaceholder) else response_class
+        negotiated = default is JSONResponse
+        self.response_class = MsgPackResponse
+        try:
+            msgpack_handler = super().get_route_handler()
+        finally:
+            self.response_class = response_class
+
+        async def handler(request: Request) -> Response:
+            if is_msgpack(request.headers.get("content-type")):
+                if not available():
+                    raise HTTPException(status_code=415, detail="MessagePack support not installed")
+                request = _as_json_request(request)
+            if negotiated and wants_msgpack(request):
+                WIRE_RESPONSES.inc(format="msgpack")
+                return await msgpack_handler(request)
+            WIRE_RESPONSES.inc(format="json")
+            return await json_handler(request)
+
+        return handler
@@ -0,0 +1,317 @@
+"""
+Micro-benchmarks du chemin chaud d'une requête
+
+Mesure ce que le service ajoute lui-même à chaque génération, hors temps
+du modèle : upstream simulé en process (httpx.MockTransport), aucun accès
+réseau. Chaque cas est mesuré en temps (meilleure de plusieurs séries,
+en microsecondes par opération, comme timeit) et en mémoire (pic alloué par opération,
+tracemalloc), puis comparé à la référence enregistrée (baseline.json).
+
+Usage :
+    python -m tests.benchmarks.hotpath             # mesure et compare
+    python -m tests.benchmarks.hotpath --update    # réécrit la référence
+    python -m tests.benchmarks.hotpath -k models   # cas dont le nom contient "models"
+
+Tolérances (variables d'environnement ou options) :
+- BENCH_TIME_TOLERANCE  : régression de temps tolérée (défaut 0.30, soit +30 %)
+- BENCH_ALLOC_TOLERANCE : régression de mémoire tolérée (défaut 0.10)
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from unittest.mock import patch
+
+import httpx
+
+from src.api import main
+from src.api.backends import CLOUD_MODELS, Backend, BackendRegistry
+from src.api.limits import read_json_bounded
+from src.api.main import PromptRequest, PromptResponse, app
+from src.api import ratelimit
+from src.api.ratelimit import RateLimiter
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+TIME_TOLERANCE = float(os.getenv("BENCH_TIME_TOLERANCE", "0.30"))
+ALLOC_TOLERANCE = float(os.getenv("BENCH_ALLOC_TOLERANCE", "0.10"))
+
+# Tailles réalistes : prompt court, prompt de 100 Ko (code collé), complétion de 4000 tokens
+SHORT_PROMPT = "Create a Python function that parses a CSV file and returns a list of dicts"
+LARGE_PROMPT = ("def handler(event, context):\n    return {'status': 200, 'body': event}\n" * 1400)[:100_000]
+COMPLETION_4000 = ("x = compute(value) + 1  # step\n" * 500)[:16_000]  # ~4000 tokens estimés
+
+TAGS = {"models": [
+    {"name": f"model-{i}:7b", "size": 4_000_000_000 + i, "modified_at": "2024-01-01T00:00:00Z",
+     "details": {"family": "llama", "parameter_size": "7B"}}
+    for i in range(12)
+]}
+
+
+def _completion(content: str) -> Dict:
+    return {
+        "choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 20, "completion_tokens": len(content) // 4, "total_tokens": 20 + len(content) // 4},
+    }
+
+
+def _upstream(completion: str) -> httpx.MockTransport:
+    """Upstream simulé : chat completions et liste des modèles Ollama"""
+    chat = json.dumps(_completion(completion)).encode()
+    tags = json.dumps(TAGS).encode()
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        if request.url.path.endswith("/api/tags"):
+            return httpx.Response(200, content=tags, headers={"content-type": "application/json"})
+        return httpx.Response(200, content=chat, headers={"content-type": "application/json"})
+
+    return httpx.MockTransport(handle)
+
+
+def _registry(completion: str) -> BackendRegistry:
+    transport = _upstream(completion)
+    return BackendRegistry([
+        Backend("ollama", "http://upstream/ollama", type="local", provider="ollama",
+                models_url="http://ollama/api/tags", models_adapter="ollama", transport=transport),
+        Backend("openai", "http://upstream/openai", type="cloud", provider="openai",
+                models=CLOUD_MODELS, transport=transport),
+    ])
+
+
+# ----------------------------------------------------------------------
+# Cas mesurés
+# ----------------------------------------------------------------------
+
+class Case:
+    """Opération mesurée : `run()` synchrone, ou coroutine exécutée sur une boucle dédiée"""
+
+    def __init__(self, name: str, operation: Callable, is_async: bool = False,
+                 setup: Optional[Callable[[], ExitStack]] = None):
+        self.name = name
+        self.operation = operation
+        self.is_async = is_async
+        self.setup = setup
+
+
+def _request_body(prompt: str) -> bytes:
+    return json.dumps({"prompt": prompt, "model": "llama3.2:1b", "mode": "local"}).encode()
+
+
+def _validate(body: bytes) -> Callable:
+    return lambda: PromptRequest.model_validate_json(body)
+
+
+def _build_payload(prompt: str) -> Callable:
+    backend = _registry("").get("ollama")
+    messages = [{"role": "user", "content": prompt}]
+    return lambda: backend.build_request("llama3.2:1b", messages)
+
+
+def _extract(completion: str) -> Callable:
+    backend = _registry(completion).get("openai")
+    body = json.dumps(_completion(completion)).encode()
+    request = httpx.Request("POST", "http://upstream/openai")
+
+    async def run():
+        response = httpx.Response(200, stream=httpx.ByteStream(body), request=request)
+        return backend.parse_response(await read_json_bounded(response))
+
+    return run
+
+
+def _serialize(completion: str) -> Callable:
+    field = app.router.routes[[r.path for r in app.router.routes].index("/generate")].response_field
+    response = PromptResponse(response=completion, model="llama3.2:1b", provider="openai", mode="local")
+
+    def run():
+        value, _ = field.validate(response, {}, loc=("response",))
+        return json.dumps(field.serialize(value, mode="json", exclude_none=True)).encode()
+
+    return run
+
+
+def _with_registry(completion: str) -> Callable[[], ExitStack]:
+    """Registre de backends sur l'upstream simulé, rate limiting désactivé"""
+    def setup() -> ExitStack:
+        stack = ExitStack()
+        stack.enter_context(patch.object(main, "backends", _registry(completion)))
+        unlimited = RateLimiter(0, 0)
+        stack.enter_context(patch.object(ratelimit, "limiter", unlimited))
+        stack.enter_context(patch.object(main, "limiter", unlimited))
+        return stack
+    return setup
+
+
+def _models() -> Callable:
+    return main.list_models
+
+
+def _generate(prompt: str) -> Callable:
+    body = _request_body(prompt)
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+
+    async def run():
+        response = await client.post("/generate", content=body, headers={"content-type": "application/json"})
+        assert response.status_code == 200, response.text
+        return response
+
+    return run
+
+
+def cases() -> List[Case]:
+    return [
+        Case("request_validation_short", _validate(_request_body(SHORT_PROMPT))),
+        Case("request_validation_100kb", _validate(_request_body(LARGE_PROMPT))),
+        Case("payload_build_short", _build_payload(SHORT_PROMPT)),
+        Case("payload_build_100kb", _build_payload(LARGE_PROMPT)),
+        Case("response_extract_4000_tokens", _extract(COMPLETION_4000), is_async=True),
+        Case("response_serialize_4000_tokens", _serialize(COMPLETION_4000)),
+        Case("models_assembly", _models(), is_async=True, setup=_with_registry("")),
+        Case("generate_short_4000_tokens", _generate(SHORT_PROMPT), is_async=True,
+             setup=_with_registry(COMPLETION_4000)),
+        Case("generate_100kb_4000_tokens", _generate(LARGE_PROMPT), is_async=True,
+             setup=_with_registry(COMPLETION_4000)),
+    ]
+
+
+# ----------------------------------------------------------------------
+# Mesure
+# ----------------------------------------------------------------------
+
+def _runner(case: Case, loop: asyncio.AbstractEventLoop) -> Callable[[], object]:
+    if case.is_async:
+        return lambda: loop.run_until_complete(case.operation())
+    return case.operation
+
+
+def measure(case: Case, repeats: int = 7, target_seconds: float = 0.05) -> Dict:
+    """Meilleur temps (µs/op) sur `repeats` séries calibrées, et pic mémoire d'une opération (Kio)"""
+    loop = asyncio.new_event_loop()
+    try:
+        with case.setup() if case.setup else ExitStack():
+            run = _runner(case, loop)
+            for _ in range(3):  # échauffement (caches, imports paresseux, pools)
+                run()
+
+            # Calibrage : assez d'itérations par série pour lisser la résolution de l'horloge
+            iterations = 1
+            while True:
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    run()
+                elapsed = time.perf_counter() - started
+                if elapsed >= target_seconds / 4 or iterations >= 100_000:
+                    break
+                iterations *= 2
+            iterations = max(1, int(iterations * target_seconds / max(elapsed, 1e-9)))
+
+            samples = []
+            gc_enabled = gc.isenabled()
+            gc.disable()
+            try:
+                for _ in range(repeats):
+                    started = time.perf_counter_ns()
+                    for _ in range(iterations):
+                        run()
+                    samples.append((time.perf_counter_ns() - started) / iterations / 1000)
+            finally:
+                if gc_enabled:
+                    gc.enable()
+
+            tracemalloc.start()
+            try:
+                tracemalloc.reset_peak()
+                baseline, _ = tracemalloc.get_traced_memory()
+                run()
+                _, peak = tracemalloc.get_traced_memory()
+            finally:
+                tracemalloc.stop()
+    finally:
+        loop.close()
+    return {
+        "time_us": round(min(samples), 2),
+        "peak_kib": round((peak - baseline) / 1024, 1),
+    }
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], time_tolerance: float = TIME_TOLERANCE,
+            alloc_tolerance: float = ALLOC_TOLERANCE) -> List[str]:
+    """Régressions au-delà des tolérances (liste vide si aucune)"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        if result["time_us"] > reference["time_us"] * (1 + time_tolerance):
+            regressions.append(
+                f"{name}: {result['time_us']:.1f} µs/op vs {reference['time_us']:.1f} µs/op "
+                f"(+{result['time_us'] / reference['time_us'] - 1:.0%}, tolerance {time_tolerance:.0%})"
+            )
+        # Plancher de 1 Kio : les petits pics varient d'un interpréteur à l'autre
+        allowed = max(reference["peak_kib"] * (1 + alloc_tolerance), reference["peak_kib"] + 1.0)
+        if result["peak_kib"] > allowed:
+            regressions.append(
+                f"{name}: {result['peak_kib']:.1f} KiB peak vs {reference['peak_kib']:.1f} KiB "
+                f"(tolerance {alloc_tolerance:.0%})"
+            )
+    return regressions
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> Dict[str, Dict]:
+    if not path.exists():
+        return {}
+    return json.loads(path.read_text())["results"]
+
+
+def save_baseline(results: Dict[str, Dict], path: Path = BASELINE_PATH) -> None:
+    document = {
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "results": results,
+    }
+    path.write_text(json.dumps(document, indent=2, sort_keys=True) + "\n")
+
+
+def run_all(selection: Optional[str] = None, repeats: int = 7) -> Dict[str, Dict]:
+    return {
+        case.name: measure(case, repeats=repeats)
+        for case in cases()
+        if not selection or selection in case.name
+    }
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--update", action="store_true", help="réécrit baseline.json avec les mesures")
+    parser.add_argument("-k", dest="selection", help="ne mesure que les cas dont le nom contient ce texte")
+    parser.add_argument("--repeats", type=int, default=7)
+    parser.add_argument("--time-tolerance", type=float, default=TIME_TOLERANCE)
+    parser.add_argument("--alloc-tolerance", type=float, default=ALLOC_TOLERANCE)
+    args = parser.parse_args(argv)
+
+    baseline = load_baseline()
+    results = run_all(args.selection, args.repeats)
+    print(f"{'case':<34} {'µs/op':>10} {'baseline':>10} {'peak KiB':>10} {'baseline':>10}")
+    for name, result in results.items():
+        reference = baseline.get(name, {})
+        print(f"{name:<34} {result['time_us']:>10.1f} {reference.get('time_us', float('nan')):>10.1f} "
+              f"{result['peak_kib']:>10.1f} {reference.get('peak_kib', float('nan')):>10.1f}")
+
+    if args.update:
+        save_baseline({**baseline, **results})
+        print(f"Baseline written to {BASELINE_PATH}")
+        return 0
+    regressions = compare(results, baseline, args.time_tolerance, args.alloc_tolerance)
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
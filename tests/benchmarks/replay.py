@@ -0,0 +1,197 @@
+"""
+Rejeu d'une capture de trafic /generate (voir src/api/capture.py)
+
+Rejoue les requêtes capturées contre une API cible, au rythme d'arrivée
+d'origine ou accéléré, et mesure latences et débit côté client. Deux
+rapports (un par build) se comparent avec --baseline.
+
+Cibles :
+- `--target http://host:port` : API déployée (upstream réel, ou
+  tests/mock_kgateway.py lancé à part et KGATEWAY_ENDPOINT pointé dessus)
+- sans `--target` : l'API de l'arbre courant, en
+  process, avec tests/mock_kgateway.py comme upstream ; aucun réseau
+
+Usage :
+    python -m tests.benchmarks.replay capture.jsonl --speed 4 --output build-a.json
+    python -m tests.benchmarks.replay capture.jsonl capture.jsonl.1.gz --speed 4 --baseline build-a.json
+    python -m tests.benchmarks.replay capture.jsonl --target http://localhost:8000 --speed 0
+
+`--speed 1` respecte les intervalles d'origine, `--speed 4` les divise par
+4, `--speed 0` envoie aussi vite que `--concurrency` le permet.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from contextlib import ExitStack
+from typing import Dict, Iterable, List, Optional
+from unittest.mock import patch
+
+import httpx
+
+from src.api import main, ratelimit
+from src.api.backends import CLOUD_MODELS, Backend, BackendRegistry
+from src.api.capture import read_capture
+from src.api.ratelimit import RateLimiter
+from tests import mock_kgateway
+
+FILLER = "Create a Python function that parses a CSV file and returns a list of dicts. "
+
+
+def load_records(paths: Iterable[str], limit: Optional[int] = None) -> List[Dict]:
+    """Enregistrements de plusieurs fichiers de capture, par ordre d'arrivée"""
+    records = [record for path in paths for record in read_capture(path)]
+    records.sort(key=lambda record: record.get("ts", 0))
+    return records[:limit] if limit else records
+
+
+def request_body(record: Dict) -> Dict:
+    """Corps /generate d'un enregistrement ; prompt synthétique de même taille s'il n'a pas été capturé"""
+    prompt = record.get("prompt")
+    if prompt is None:
+        chars = record.get("prompt_chars", len(FILLER))
+        prompt = (FILLER * (chars // len(FILLER) + 1))[:chars]
+    body = {"prompt": prompt, "mode": record.get("mode", "cloud"), "model": record.get("model")}
+    if record.get("priority"):
+        body["priority"] = record["priority"]
+    return body
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def summarize(results: List[Dict], duration: float) -> Dict:
+    """Latences (ms), débit et erreurs d'un rejeu"""
+    latencies = [r["latency_ms"] for r in results if 200 <= r["status"] < 300]
+    statuses: Dict[str, int] = {}
+    for result in results:
+        statuses[str(result["status"])] = statuses.get(str(result["status"]), 0) + 1
+    return {
+        "requests": len(results),
+        "errors": len(results) - len(latencies),
+        "statuses": statuses,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(len(results) / duration, 2) if duration > 0 else 0.0,
+        "latency_ms": {
+            "mean": round(statistics.fmean(latencies), 1) if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50), 1),
+            "p90": round(percentile(latencies, 0.90), 1),
+            "p99": round(percentile(latencies, 0.99), 1),
+            "max": round(max(latencies), 1) if latencies else 0.0,
+        },
+        "max_schedule_lag_ms": round(max((r["lag_ms"] for r in results), default=0.0), 1),
+    }
+
+
+def compare(report: Dict, baseline: Dict) -> List[str]:
+    """Lignes de comparaison baseline -> rapport courant"""
+    def delta(current: float, reference: float) -> str:
+        return f"{(current / reference - 1):+.1%}" if reference else "n/a"
+
+    lines = [f"{'metric':<18} {'baseline':>10} {'current':>10} {'delta':>8}"]
+    rows = [("throughput_rps", report["throughput_rps"], baseline["throughput_rps"]),
+            ("errors", report["errors"], baseline["errors"])]
+    rows += [(f"latency_{name}_ms", report["latency_ms"][name], baseline["latency_ms"][name])
+             for name in ("mean", "p50", "p90", "p99", "max")]
+    for name, current, reference in rows:
+        lines.append(f"{name:<18} {reference:>10} {current:>10} {delta(current, reference):>8}")
+    return lines
+
+
+async def replay(records: List[Dict], client: httpx.AsyncClient, speed: float = 1.0,
+                 concurrency: int = 32, timeout: float = 300.0) -> Dict:
+    """Rejoue `records` via `client` et retourne le rapport"""
+    semaphore = asyncio.Semaphore(concurrency)
+    origin = records[0].get("ts", 0) if records else 0
+    started = time.perf_counter()
+
+    async def send(record: Dict) -> Dict:
+        scheduled = (record.get("ts", origin) - origin) / speed if speed > 0 else 0.0
+        delay = scheduled - (time.perf_counter() - started)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        async with semaphore:
+            sent = time.perf_counter()
+            try:
+                response = await client.post("/generate", json=request_body(record), timeout=timeout)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = 0
+            return {
+                "status": status,
+                "latency_ms": (time.perf_counter() - sent) * 1000,
+                "lag_ms": max(0.0, (sent - started - scheduled) * 1000),
+            }
+
+    results = await asyncio.gather(*(send(record) for record in records))
+    return summarize(list(results), time.perf_counter() - started)
+
+
+def in_process_target() -> ExitStack:
+    """Patches servant l'API de l'arbre courant en process, upstream tests/mock_kgateway.py"""
+    stack = ExitStack()
+    # Jamais d'appel à la vraie API OpenAI depuis le mock
+    stack.enter_context(patch.dict(os.environ, {"OPENAI_API_KEY": ""}))
+    upstream = httpx.ASGITransport(app=mock_kgateway.app)
+    registry = BackendRegistry([
+        Backend("ollama", "http://kgateway/ollama", type="local", provider="ollama", transport=upstream),
+        Backend("openai", "http://kgateway/openai", type="cloud", provider="openai",
+                models=CLOUD_MODELS, transport=upstream),
+    ])
+    unlimited = RateLimiter(0, 0)
+    stack.enter_context(patch.object(main, "backends", registry))
+    stack.enter_context(patch.object(main, "limiter", unlimited))
+    stack.enter_context(patch.object(ratelimit, "limiter", unlimited))
+    return stack
+
+
+async def run(records: List[Dict], target: Optional[str], speed: float, concurrency: int,
+              timeout: float) -> Dict:
+    if target:
+        async with httpx.AsyncClient(base_url=target) as client:
+            return await replay(records, client, speed, concurrency, timeout)
+    with in_process_target():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://replay") as client:
+            return await replay(records, client, speed, concurrency, timeout)
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("captures", nargs="+", help="fichiers de capture (.jsonl, .jsonl.N.gz)")
+    parser.add_argument("--target", help="URL de l'API cible (défaut : API en process + mock KGateway)")
+    parser.add_argument("--speed", type=float, default=1.0, help="multiplicateur de rythme (0 = sans pause)")
+    parser.add_argument("--concurrency", type=int, default=32, help="requêtes simultanées au plus")
+    parser.add_argument("--limit", type=int, help="ne rejoue que les N premières requêtes")
+    parser.add_argument("--timeout", type=float, default=300.0, help="timeout client par requête (s)")
+    parser.add_argument("--output", help="écrit le rapport JSON dans ce fichier")
+    parser.add_argument("--baseline", help="rapport JSON d'un autre build à comparer")
+    args = parser.parse_args(argv)
+
+    records = load_records(args.captures, args.limit)
+    if not records:
+        print("No records to replay")
+        return 1
+    report = asyncio.run(run(records, args.target, args.speed, args.concurrency, args.timeout))
+    report["target"] = args.target or "in-process"
+    report["speed"] = args.speed
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            print("\n".join(compare(report, json.load(f))))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
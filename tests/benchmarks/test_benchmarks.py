@@ -0,0 +1,61 @@
+"""
+Porte de régression des micro-benchmarks du chemin chaud.
+
+Les mesures dépendent de la machine : la comparaison à baseline.json ne
+tourne qu'avec RUN_BENCHMARKS=1 (CI sur un runner dédié, ou en local après
+`python -m tests.benchmarks.hotpath --update` sur la même machine).
+"""
+import os
+
+import pytest
+
+from tests.benchmarks import hotpath
+
+RUN_BENCHMARKS = os.getenv("RUN_BENCHMARKS", "0") == "1"
+
+requires_opt_in = pytest.mark.skipif(not RUN_BENCHMARKS, reason="micro-benchmarks: set RUN_BENCHMARKS=1")
+
+
+def pytest_generate_tests(metafunc):
+    """Cas construits à la demande : rien n'est préparé à la collecte sans RUN_BENCHMARKS"""
+    if "case" not in metafunc.fixturenames:
+        return
+    if RUN_BENCHMARKS:
+        metafunc.parametrize("case", hotpath.cases(), ids=lambda case: case.name)
+    else:
+        metafunc.parametrize("case", [None], ids=["opt-in"])
+
+
+class TestCompare:
+    def test_within_tolerance(self):
+        baseline = {"case": {"time_us": 100.0, "peak_kib": 50.0}}
+        results = {"case": {"time_us": 125.0, "peak_kib": 54.0}}
+        assert hotpath.compare(results, baseline, time_tolerance=0.30, alloc_tolerance=0.10) == []
+
+    def test_time_and_allocation_regressions(self):
+        baseline = {"case": {"time_us": 100.0, "peak_kib": 50.0}}
+        results = {"case": {"time_us": 140.0, "peak_kib": 60.0}}
+        regressions = hotpath.compare(results, baseline, time_tolerance=0.30, alloc_tolerance=0.10)
+        assert len(regressions) == 2
+        assert "µs/op" in regressions[0] and "KiB" in regressions[1]
+
+    def test_small_allocations_have_absolute_floor(self):
+        baseline = {"case": {"time_us": 1.0, "peak_kib": 0.5}}
+        results = {"case": {"time_us": 1.0, "peak_kib": 1.2}}
+        assert hotpath.compare(results, baseline, alloc_tolerance=0.10) == []
+
+    def test_new_case_without_baseline_is_ignored(self):
+        assert hotpath.compare({"new": {"time_us": 1.0, "peak_kib": 1.0}}, {}) == []
+
+    def test_baseline_covers_every_case(self):
+        baseline = hotpath.load_baseline()
+        assert {case.name for case in hotpath.cases()} <= set(baseline)
+
+
+@requires_opt_in
+@pytest.mark.timeout(300)
+def test_no_regression(case):
+    baseline = hotpath.load_baseline()
+    result = hotpath.measure(case)
+    regressions = hotpath.compare({case.name: result}, baseline)
+    assert not regressions, "\n".join(regressions)
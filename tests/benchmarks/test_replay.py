@@ -0,0 +1,40 @@
+"""
+Tests de l'outil de rejeu de capture (en process, upstream tests/mock_kgateway.py)
+"""
+import json
+import pytest
+from src.api.capture import TrafficCapture
+from tests.benchmarks import replay
+
+
+@pytest.fixture
+def capture_path(tmp_path):
+    capture = TrafficCapture(str(tmp_path / "capture.jsonl"), sample_rate=1.0)
+    for i in range(6):
+        capture.record(mode="local" if i % 2 else "cloud", model="llama3.2:1b" if i % 2 else "gpt-4o-mini",
+                       priority="interactive", prompt=f"Create a python function {i}", status=200,
+                       latency=0.5, started_at=1000.0 + i * 0.01)
+    capture.close()
+    return capture.path
+
+
+def test_request_body_synthesizes_missing_prompt():
+    body = replay.request_body({"mode": "local", "model": "phi3:mini", "prompt_chars": 500})
+    assert len(body["prompt"]) == 500 and body["mode"] == "local"
+
+
+def test_compare_reports():
+    baseline = replay.summarize([{"status": 200, "latency_ms": 100.0, "lag_ms": 0.0}], 1.0)
+    current = replay.summarize([{"status": 200, "latency_ms": 150.0, "lag_ms": 0.0}], 1.0)
+    lines = replay.compare(current, baseline)
+    assert any(line.startswith("latency_p50_ms") and "+50.0%" in line for line in lines)
+
+
+def test_in_process_replay(capture_path, tmp_path, capsys):
+    output = tmp_path / "report.json"
+    assert replay.main_cli([capture_path, "--speed", "0", "--output", str(output)]) == 0
+    report = json.loads(output.read_text())
+    assert report["requests"] == 6 and report["errors"] == 0
+    assert report["statuses"] == {"200": 6}
+    assert replay.main_cli([capture_path, "--speed", "0", "--baseline", str(output)]) == 0
+    assert "throughput_rps" in capsys.readouterr().out
@@ -0,0 +1,37 @@
+"""
+Configuration commune des tests
+
+Mode strict de la surveillance de boucle (LOOP_MONITOR_STRICT, actif par
+défaut ici) : tout callback asyncio dépassant LOOP_BLOCK_THRESHOLD_MS fait
+échouer le test qui l'a provoqué. Un test qui bloque volontairement la
+boucle le déclare avec le marker `allow_blocking`.
+
+Le seuil est relevé à 250 ms par défaut : sur un runner CI partagé, la
+préemption du processus peut à elle seule dépasser 100 ms, alors qu'un vrai
+blocage (I/O synchrone, CPU) se mesure en centaines de ms.
+"""
+import os
+
+import pytest
+
+os.environ.setdefault("LOOP_MONITOR_STRICT", "1")
+os.environ.setdefault("LOOP_BLOCK_THRESHOLD_MS", "250")
+
+from src.api.loopmonitor import STRICT, monitor  # noqa: E402
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "allow_blocking: test that blocks the event loop on purpose")
+    if STRICT:
+        monitor.install_callback_timer()
+
+
+@pytest.fixture(autouse=True)
+def no_blocking_calls(request):
+    monitor.clear()
+    yield
+    blocked = list(monitor.blocked)
+    monitor.clear()
+    if STRICT and blocked and request.node.get_closest_marker("allow_blocking") is None:
+        details = "\n".join(f"- {c.location}: {c.duration * 1000:.0f} ms" for c in blocked)
+        pytest.fail(f"Event loop blocked during the test:\n{details}", pytrace=False)
@@ -6,6 +6,7 @@ from unittest.mock import AsyncMock, patch, MagicMock
 from fastapi.testclient import TestClient
 import httpx
 from src.api.main import app, PromptRequest, PromptResponse
+from tests.upstream_mock import FakeUpstreamResponse, mock_upstream
 
 
 @pytest.fixture
@@ -124,9 +125,7 @@ class TestGenerateEndpoint:
     def test_generate_cloud_success(self, mock_client_class, client):
         """Test de génération réussie avec OpenAI (cloud)"""
         # Mock de la réponse OpenAI
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_upstream(mock_client_class, FakeUpstreamResponse({
             "choices": [
                 {
                     "message": {
@@ -134,16 +133,7 @@ class TestGenerateEndpoint:
                     }
                 }
             ]
-        }
-        mock_response.raise_for_status.return_value = None
-        mock_response.text = '{"choices":[{"message":{"content":"print(\'Hello World!\')"}}]}'
-        mock_response.headers = {"content-type": "application/json"}
-        
-        mock_client = MagicMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(return_value=mock_response)
-        mock_client_class.return_value = mock_client
+        }))
         
         response = client.post("/generate", json={
             "prompt": "Create a hello world",
@@ -162,20 +152,9 @@ class TestGenerateEndpoint:
     def test_generate_local_success(self, mock_client_class, client):
         """Test de génération réussie avec Ollama (local)"""
         # Mock de la réponse Ollama
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_upstream(mock_client_class, FakeUpstreamResponse({
             "response": "def hello():\n    print('Hello World!')"
-        }
-        mock_response.raise_for_status.return_value = None
-        mock_response.text = '{"response":"def hello():\\n    print(\'Hello World!\')"}'
-        mock_response.headers = {"content-type": "application/json"}
-        
-        mock_client = MagicMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(return_value=mock_response)
-        mock_client_class.return_value = mock_client
+        }))
         
         response = client.post("/generate", json={
             "prompt": "Create a hello function",
@@ -193,11 +172,8 @@ class TestGenerateEndpoint:
     @patch('httpx.AsyncClient')
     def test_generate_timeout_error(self, mock_client_class, client):
         """Test de gestion d'erreur de timeout"""
-        mock_client = MagicMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(side_effect=httpx.TimeoutException("Request timed out"))
-        mock_client_class.return_value = mock_client
+        mock_client = mock_upstream(mock_client_class)
+        mock_client.stream.side_effect = httpx.TimeoutException("Request timed out")
         
         response = client.post("/generate", json={
             "prompt": "Create a function",
@@ -210,17 +186,9 @@ class TestGenerateEndpoint:
     @patch('httpx.AsyncClient')
     def test_generate_http_error(self, mock_client_class, client):
         """Test de gestion d'erreur HTTP"""
-        mock_response = MagicMock()
-        mock_response.status_code = 429
-        mock_response.text = "Rate limit exceeded"
-        
-        mock_client = MagicMock()
-        mock_client.__aenter__ = AsyncMock(return_value=mock_client)
-        mock_client.__aexit__ = AsyncMock(return_value=None)
-        mock_client.post = AsyncMock(side_effect=httpx.HTTPStatusError(
-            "Rate limit exceeded", request=MagicMock(), response=mock_response
+        mock_upstream(mock_client_class, FakeUpstreamResponse(
+            "Rate limit exceeded", status_code=429, headers={"content-type": "text/plain"}
         ))
-        mock_client_class.return_value = mock_client
         
         response = client.post("/generate", json={
             "prompt": "Create a function",
@@ -0,0 +1,165 @@
+"""
+Tests unitaires du registre des backends
+"""
+import asyncio
+import json
+import httpx
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from fastapi.testclient import TestClient
+from src.api import main
+from src.api.backends import Backend, BackendRegistry, UnknownBackend, default_backends, load_backends
+from src.api.httpclient import SSL_CONTEXT
+from src.api.main import app
+from tests.upstream_mock import chat_response, mock_upstream
+
+CONFIG = {
+    "backends": [
+        {"name": "ollama", "url": "http://gw/ollama", "type": "local", "models": ["llama3.2:1b"]},
+        {"name": "vllm", "url": "http://vllm:8000/v1/chat/completions", "type": "local",
+         "models": [{"id": "qwen2.5-coder:7b", "context_length": 32768}],
+         "models_url": "http://vllm:8000/v1/models",
+         "concurrency": 8, "timeouts": {"connect": 2, "read": 45},
+         "pool": {"max_connections": 64}, "payload": {"temperature": 0.2}},
+        {"name": "native", "url": "http://ollama:11434/api/chat", "type": "local", "adapter": "ollama"},
+        {"name": "openai", "url": "http://gw/openai", "type": "cloud", "models": ["gpt-4o-mini"]},
+    ]
+}
+
+
+@pytest.fixture
+def registry():
+    return BackendRegistry.from_config(CONFIG)
+
+
+class TestBackendRegistry:
+    """Tests de la configuration et de la résolution"""
+
+    def test_load_from_file(self, tmp_path):
+        path = tmp_path / "backends.json"
+        path.write_text(json.dumps(CONFIG))
+        registry = load_backends(str(path), "http://unused", "http://unused")
+        assert [b.name for b in registry] == ["ollama", "vllm", "native", "openai"]
+        vllm = registry.get("vllm")
+        assert vllm.scheduler.concurrency == 8
+        assert vllm.timeout.read == 45 and vllm.timeout.connect == 2
+        assert vllm.limits.max_connections == 64
+
+    def test_default_registry_keeps_kgateway_routes(self):
+        registry = default_backends("http://gw", "http://ollama:11434")
+        assert registry.resolve("local").url == "http://gw/ollama"
+        assert registry.resolve("cloud").url == "http://gw/openai"
+        assert registry.resolve("cloud").context_length("gpt-3.5-turbo") == 16385
+
+    def test_resolve(self, registry):
+        assert registry.resolve("vllm").name == "vllm"
+        assert registry.resolve("local", "qwen2.5-coder:7b").name == "vllm"
+        assert registry.resolve("local", "unknown-model").name == "ollama"
+        assert registry.resolve(None).name == "openai"
+        # Mode inconnu : cloud, comme avant le registre
+        assert registry.resolve("tpu").name == "openai"
+        local_only = BackendRegistry([Backend("ollama", "http://ollama", type="local")])
+        with pytest.raises(UnknownBackend):
+            local_only.resolve("tpu")
+
+    def test_invalid_config(self):
+        with pytest.raises(ValueError):
+            Backend("x", "http://x", adapter="grpc")
+        with pytest.raises(ValueError):
+            Backend("x", "http://x", type="edge")
+        with pytest.raises(ValueError):
+            BackendRegistry.from_config({"backends": [CONFIG["backends"][0]] * 2})
+
+    def test_adapters(self, registry):
+        _, payload, _ = registry.get("vllm").build_request("m", [], {"max_tokens": 64})
+        assert payload == {"model": "m", "messages": [], "max_tokens": 64, "temperature": 0.2, "stream": False}
+        _, payload, _ = registry.get("native").build_request("m", [], {"max_tokens": 64})
+        assert payload == {"model": "m", "messages": [], "stream": False,
+                           "options": {"num_predict": 64, "temperature": 0.7}}
+        assert registry.get("native").parse_response({"message": {"content": "hi"}}) == ("hi", "ollama")
+
+    @pytest.mark.asyncio
+    async def test_connection_pool_is_reused(self, registry):
+        backend = registry.get("vllm")
+        client = backend.client()
+        assert backend.client() is client
+        await backend.aclose()
+        assert client.is_closed
+
+    @pytest.mark.asyncio
+    async def test_pools_are_opened_at_startup_with_shared_ssl_context(self, registry):
+        with patch('httpx.AsyncClient') as mock_client_class:
+            mock_client_class.return_value.aclose = AsyncMock()
+            registry.open()
+            assert mock_client_class.call_count == len(list(registry))
+            assert all(call.kwargs["verify"] is SSL_CONTEXT for call in mock_client_class.call_args_list)
+            registry.get("vllm").client()
+            assert mock_client_class.call_count == len(list(registry))
+            await registry.aclose()
+
+    def test_pool_from_previous_loop_is_closed(self, registry):
+        backend = registry.get("vllm")
+
+        async def get_client():
+            return backend.client()
+
+        stale = asyncio.run(get_client())
+
+        async def switch_loop():
+            fresh = backend.client()
+            await backend.aclose()
+            return fresh
+
+        fresh = asyncio.run(switch_loop())
+        assert fresh is not stale
+        assert stale.is_closed and fresh.is_closed
+
+
+class TestRoutingThroughRegistry:
+    """Tests des endpoints construits sur le registre"""
+
+    @patch('httpx.AsyncClient')
+    def test_generate_uses_backend_profile(self, mock_client_class, registry):
+        mock_client = mock_upstream(mock_client_class, chat_response("ok"))
+        with patch.object(main, "backends", registry):
+            response = TestClient(app).post("/generate", json={"prompt": "hi", "mode": "vllm",
+                                                               "model": "qwen2.5-coder:7b"})
+        assert response.status_code == 200
+        assert response.json()["mode"] == "vllm"
+        call = mock_client.stream.call_args
+        assert call.args[1] == "http://vllm:8000/v1/chat/completions"
+        assert call.kwargs["json"]["temperature"] == 0.2
+        assert call.kwargs["timeout"].read <= 45
+        assert mock_client_class.call_args.kwargs["limits"].max_connections == 64
+
+    @patch('httpx.AsyncClient')
+    def test_unknown_mode_falls_back_to_cloud(self, mock_client_class, registry):
+        mock_client = mock_upstream(mock_client_class, chat_response("ok"))
+        with patch.object(main, "backends", registry):
+            response = TestClient(app).post("/generate", json={"prompt": "hi", "mode": "tpu"})
+        assert response.status_code == 200
+        assert mock_client.stream.call_args.args[1] == "http://gw/openai"
+
+    def test_unknown_mode_without_cloud_backend(self):
+        local_only = BackendRegistry([Backend("ollama", "http://ollama", type="local")])
+        with patch.object(main, "backends", local_only):
+            response = TestClient(app).post("/generate", json={"prompt": "hi", "mode": "tpu"})
+        assert response.status_code == 422
+
+    @patch('httpx.AsyncClient')
+    def test_models_built_from_registry(self, mock_client_class, registry):
+        mock_client = MagicMock()
+        mock_client.get = AsyncMock(return_value=httpx.Response(200, json={"data": [{"id": "qwen2.5-coder:7b"},
+                                                                                    {"id": "llama3.1:8b"}]}))
+        mock_client_class.return_value = mock_client
+        with patch.object(main, "backends", registry):
+            data = TestClient(app).get("/models").json()
+        local = {m["id"]: m for m in data["models"]["local"]}
+        assert set(local) == {"llama3.2:1b", "qwen2.5-coder:7b", "llama3.1:8b"}
+        assert local["llama3.1:8b"]["backend"] == "vllm"
+        # Modèle déclaré et découvert : une seule entrée, métadonnées déclarées conservées
+        assert [m["id"] for m in data["models"]["local"]].count("qwen2.5-coder:7b") == 1
+        assert local["qwen2.5-coder:7b"]["context_length"] == 32768
+        assert [m["id"] for m in data["models"]["cloud"]] == ["gpt-4o-mini"]
+        assert data["summary"]["backends"]["vllm"]["models"] == {"status": "available", "count": 2}
+        assert data["summary"]["backends"]["ollama"]["models"]["status"] == "static"
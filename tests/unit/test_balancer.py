@@ -0,0 +1,158 @@
+"""
+Tests unitaires du load balancing entre réplicas Ollama
+"""
+import pytest
+import httpx
+from unittest.mock import patch, AsyncMock, MagicMock
+from fastapi.testclient import TestClient
+from src.api.main import app
+from src.api.balancer import OllamaBalancer, NoReplicaAvailable
+from tests.upstream_mock import chat_response, mock_upstream
+
+HOSTS = ["http://ollama-0:11434", "http://ollama-1:11434", "http://ollama-2:11434"]
+
+
+@pytest.fixture
+def lb():
+    local = OllamaBalancer(hosts=HOSTS, eject_failures=2, eject_seconds=30, refresh_interval=3600)
+    # Pas de rafraîchissement réseau pendant les tests
+    local._last_refresh = float("inf")
+    return local
+
+
+class TestReplicaSelection:
+    """Tests du choix de réplica"""
+
+    def test_disabled_with_single_host(self):
+        assert not OllamaBalancer(hosts=["http://ollama:11434"]).enabled
+        assert OllamaBalancer(hosts=HOSTS).enabled
+
+    def test_prefers_replica_with_model_loaded(self, lb):
+        lb.replicas[HOSTS[2]].loaded_models.add("mistral:7b-instruct")
+        for _ in range(20):
+            assert lb.pick("mistral:7b-instruct").url == HOSTS[2]
+
+    def test_least_outstanding(self, lb):
+        lb.strategy = "least"
+        lb.replicas[HOSTS[0]].outstanding = 5
+        lb.replicas[HOSTS[1]].outstanding = 1
+        lb.replicas[HOSTS[2]].outstanding = 3
+        assert lb.pick().url == HOSTS[1]
+
+    def test_p2c_never_picks_the_most_loaded(self, lb):
+        lb.replicas[HOSTS[0]].outstanding = 10
+        picks = {lb.pick().url for _ in range(50)}
+        assert HOSTS[0] not in picks
+
+    def test_affinity_is_sticky(self, lb):
+        chosen = {lb.pick("m", affinity_key="session-1").url for _ in range(20)}
+        assert len(chosen) == 1
+
+
+class TestPassiveHealth:
+    """Tests de l'éjection / réadmission"""
+
+    def test_ejection_after_consecutive_failures(self, lb):
+        replica = lb.replicas[HOSTS[0]]
+        lb.record(replica, False, 0.1)
+        assert replica.ejected_until == 0.0
+        lb.record(replica, False, 0.1)
+        assert replica.ejected_until > 0.0
+        assert all(lb.pick().url != HOSTS[0] for _ in range(20))
+
+    def test_readmission_after_successful_trial(self, lb):
+        replica = lb.replicas[HOSTS[0]]
+        replica.ejected_until = 1.0  # éjection expirée
+        replica.ejections = 1
+        lb.record(replica, True, 0.1, "llama3.2:1b")
+        assert replica.ejected_until == 0.0
+        assert "llama3.2:1b" in replica.loaded_models
+
+    def test_failed_trial_doubles_backoff(self, lb):
+        replica = lb.replicas[HOSTS[0]]
+        replica.ejected_until = 1.0
+        replica.ejections = 1
+        lb.record(replica, False, 0.1)
+        assert replica.ejections == 2
+
+    def test_all_ejected(self, lb):
+        for replica in lb.replicas.values():
+            replica.ejected_until = float("inf")
+        with pytest.raises(NoReplicaAvailable):
+            lb.pick()
+
+    @pytest.mark.asyncio
+    async def test_acquire_tracks_outstanding_and_errors(self, lb):
+        async with lb.acquire("m") as replica:
+            assert replica.outstanding == 1
+        assert replica.outstanding == 0
+
+        response = MagicMock(status_code=503)
+        with pytest.raises(httpx.HTTPStatusError):
+            async with lb.acquire("m") as replica:
+                raise httpx.HTTPStatusError("down", request=MagicMock(), response=response)
+        assert replica.failures == 1
+
+        response = MagicMock(status_code=400)
+        with pytest.raises(httpx.HTTPStatusError):
+            async with lb.acquire("m") as replica:
+                raise httpx.HTTPStatusError("bad", request=MagicMock(), response=response)
+        assert replica.failures == 0
+
+
+    @pytest.mark.asyncio
+    async def test_trial_is_released_when_generator_is_closed(self, lb):
+        for url in HOSTS[1:]:
+            del lb.replicas[url]
+        replica = lb.replicas[HOSTS[0]]
+        replica.ejected_until = 1.0  # éjection expirée : requête d'essai
+        replica.ejections = 1
+
+        acquisition = lb.acquire("m")
+        assert await acquisition.__aenter__() is replica
+        assert replica.trial_in_flight
+        with pytest.raises(NoReplicaAvailable):
+            lb.pick()
+
+        await acquisition.gen.aclose()  # GeneratorExit au milieu de l'essai
+
+        assert not replica.trial_in_flight
+        assert replica.outstanding == 0
+        assert replica.ejections == 1
+        assert lb.pick() is replica
+
+
+class TestModelPolling:
+    """Tests du suivi des modèles chargés"""
+
+    @pytest.mark.asyncio
+    async def test_polling_reuses_one_client(self, lb):
+        with patch('httpx.AsyncClient') as mock_client_class:
+            mock_client = mock_client_class.return_value
+            mock_client.get = AsyncMock(return_value=httpx.Response(200, json={"models": [{"name": "m"}]}))
+            mock_client.aclose = AsyncMock()
+            await lb.refresh()
+            await lb.refresh()
+            await lb.aclose()
+
+        assert mock_client_class.call_count == 1
+        assert mock_client.get.call_count == 2 * len(HOSTS)
+        assert all(r.loaded_models == {"m"} for r in lb.replicas.values())
+
+
+class TestGenerateWithReplicas:
+    """Tests de /generate en mode local multi-réplicas"""
+
+    @patch('httpx.AsyncClient')
+    def test_local_call_goes_to_replica(self, mock_client_class, lb):
+        mock_client = mock_upstream(mock_client_class, chat_response("ok"))
+
+        with patch("src.api.main.balancer", lb):
+            response = TestClient(app).post("/generate", json={
+                "prompt": "hi", "mode": "local", "model": "llama3.2:1b"
+            })
+
+        assert response.status_code == 200
+        endpoint = mock_client.stream.call_args.args[1]
+        assert endpoint.endswith("/v1/chat/completions")
+        assert endpoint.rsplit("/v1/", 1)[0] in HOSTS
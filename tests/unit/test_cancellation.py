@@ -0,0 +1,134 @@
+"""
+Tests unitaires de l'annulation à la déconnexion du client
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+from src.api.cancellation import ClientDisconnected, cancel_on_disconnect
+from src.api.main import call_llm
+from src.api.scheduler import CANCELLED, SECONDS_SAVED, FairScheduler, schedulers
+from tests.upstream_mock import FakeUpstreamResponse, mock_upstream
+
+WEIGHTS = {"interactive": 8.0, "batch": 1.0}
+
+
+class _FakeRequest:
+    """Requête dont le client se déconnecte quand `disconnect` est positionné"""
+
+    def __init__(self):
+        self.disconnect = asyncio.Event()
+
+    async def receive(self):
+        await self.disconnect.wait()
+        return {"type": "http.disconnect"}
+
+
+class TestCancelOnDisconnect:
+    """Tests de la surveillance de la connexion"""
+
+    @pytest.mark.asyncio
+    async def test_returns_result_when_client_stays(self):
+        async def work():
+            await asyncio.sleep(0)
+            return "ok"
+
+        assert await cancel_on_disconnect(_FakeRequest(), work()) == "ok"
+
+    @pytest.mark.asyncio
+    async def test_cancels_work_on_disconnect(self):
+        request = _FakeRequest()
+        cancelled = asyncio.Event()
+
+        async def work():
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        asyncio.get_running_loop().call_later(0.01, request.disconnect.set)
+        with pytest.raises(ClientDisconnected):
+            await cancel_on_disconnect(request, work())
+        assert cancelled.is_set()
+
+    @pytest.mark.asyncio
+    @patch('httpx.AsyncClient')
+    async def test_disconnect_aborts_upstream_and_frees_slot(self, mock_client_class):
+        started = asyncio.Event()
+        aborted = asyncio.Event()
+
+        class HangingResponse(FakeUpstreamResponse):
+            async def aiter_bytes(self):
+                started.set()
+                try:
+                    await asyncio.sleep(60)
+                except asyncio.CancelledError:
+                    aborted.set()
+                    raise
+                yield b""
+
+        response = HangingResponse()
+        mock_upstream(mock_client_class, response)
+
+        request = _FakeRequest()
+        scheduler = schedulers["cloud"]
+        before = CANCELLED.value(backend=scheduler.name, stage="upstream")
+        work = call_llm("cloud", "gpt-4o-mini", [{"role": "user", "content": "hi"}])
+        waiting = asyncio.create_task(cancel_on_disconnect(request, work))
+        await started.wait()
+        assert scheduler.active == 1
+        request.disconnect.set()
+        with pytest.raises(ClientDisconnected):
+            await waiting
+        assert aborted.is_set()
+        assert response.closed
+        assert scheduler.active == 0
+        assert CANCELLED.value(backend=scheduler.name, stage="upstream") == before + 1
+
+
+class TestCancellationMetrics:
+    """Tests des compteurs d'annulation de l'ordonnanceur"""
+
+    @pytest.mark.asyncio
+    async def test_seconds_saved_from_observed_service_time(self):
+        scheduler = FairScheduler("test-cancel", 1, WEIGHTS)
+        async with scheduler.slot("a"):
+            pass
+        scheduler.service_time = 10.0
+
+        async def long_call():
+            async with scheduler.slot("a"):
+                await asyncio.sleep(60)
+
+        task = asyncio.create_task(long_call())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        assert scheduler.active == 0
+        assert CANCELLED.value(backend="test-cancel", stage="upstream") == 1
+        assert 9.0 < SECONDS_SAVED.value(backend="test-cancel") <= 10.0
+
+    @pytest.mark.asyncio
+    async def test_cancel_while_queued(self):
+        scheduler = FairScheduler("test-cancel-queued", 1, WEIGHTS)
+        gate = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("a"):
+                await gate.wait()
+
+        async def queued():
+            async with scheduler.slot("b"):
+                pass
+
+        hold = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(queued())
+        await asyncio.sleep(0)
+        assert scheduler.queued == 1
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert scheduler.queued == 0
+        assert CANCELLED.value(backend="test-cancel-queued", stage="queued") == 1
+        gate.set()
+        await hold
@@ -0,0 +1,129 @@
+"""
+Tests unitaires de la propagation de deadline
+"""
+import asyncio
+import pytest
+import httpx
+from unittest.mock import patch
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+from src.api import deadline as deadline_module
+from src.api.deadline import (
+    Deadline, DeadlineUnreachable, current_deadline, deadline_scope, parse_timeout, request_deadline,
+)
+from src.api.main import app
+from src.api.scheduler import FairScheduler, schedulers
+from tests.upstream_mock import chat_response, mock_upstream
+
+WEIGHTS = {"interactive": 8.0, "batch": 1.0}
+
+
+class TestDeadline:
+    """Tests du calcul de deadline"""
+
+    def test_parse_timeout(self):
+        assert parse_timeout("30") == 30.0
+        assert parse_timeout("2.5s") == 2.5
+        assert parse_timeout("500ms") == 0.5
+        assert parse_timeout(12) == 12.0
+
+    def test_request_deadline_bounds(self):
+        assert request_deadline().seconds == deadline_module.DEFAULT_TIMEOUT_SECONDS
+        assert request_deadline(None, "10").seconds == 10.0
+        # Le champ l'emporte sur le header
+        assert request_deadline(5.0, "10").seconds == 5.0
+        assert request_deadline(None, "100000").seconds == deadline_module.MAX_TIMEOUT_SECONDS
+        assert request_deadline(None, "1ms").seconds == deadline_module.MIN_TIMEOUT_SECONDS
+        for invalid in ("abc", "-3", "0"):
+            with pytest.raises(HTTPException) as exc:
+                request_deadline(None, invalid)
+            assert exc.value.status_code == 422
+
+    def test_upstream_settings_follow_remaining_budget(self):
+        deadline = Deadline(5.0)
+        timeout = deadline.upstream_timeout()
+        assert timeout.read <= 5.0
+        assert timeout.connect <= deadline_module.CONNECT_TIMEOUT_SECONDS
+        headers = deadline.upstream_headers()
+        assert 4000 <= int(headers["x-envoy-upstream-rq-timeout-ms"]) <= 5000
+
+    def test_scope(self):
+        deadline = Deadline(5.0)
+        assert current_deadline() is None
+        with deadline_scope(deadline):
+            assert current_deadline() is deadline
+        assert current_deadline() is None
+
+    def test_ensure_reachable(self):
+        Deadline(5.0).ensure_reachable(1.0)
+        with pytest.raises(DeadlineUnreachable):
+            Deadline(5.0).ensure_reachable(20.0)
+
+
+class TestEstimatedLatency:
+    """Tests de l'estimation file + appel de l'ordonnanceur"""
+
+    @pytest.mark.asyncio
+    async def test_estimate_grows_with_queue(self):
+        scheduler = FairScheduler("test-estimate", 1, WEIGHTS)
+        assert scheduler.estimated_latency() == 0.0
+        scheduler.service_time = 2.0
+        assert scheduler.estimated_latency() == 2.0
+
+        gate = asyncio.Event()
+
+        async def call(priority):
+            async with scheduler.slot("t", priority):
+                await gate.wait()
+
+        tasks = [asyncio.create_task(call("batch")) for _ in range(3)]
+        await asyncio.sleep(0)
+        # 1 appel en cours, 2 batch en file
+        assert scheduler.estimated_latency("batch") == pytest.approx(3 * 2.0 + 2.0)
+        # Les batch en file ne passent pas devant une requête interactive
+        assert scheduler.estimated_latency("interactive") == pytest.approx(2.0 + 2.0)
+        gate.set()
+        await asyncio.gather(*tasks)
+
+
+class TestDeadlineEndpoint:
+    """Tests de /generate avec deadline"""
+
+    @patch('httpx.AsyncClient')
+    def test_deadline_drives_upstream_timeout_and_headers(self, mock_client_class):
+        mock_client = mock_upstream(mock_client_class, chat_response("ok"))
+
+        client = TestClient(app)
+        response = client.post("/generate", json={"prompt": "hi", "mode": "cloud"},
+                               headers={"X-Request-Timeout": "20"})
+        assert response.status_code == 200
+        timeout = mock_client.stream.call_args.kwargs["timeout"]
+        assert isinstance(timeout, httpx.Timeout)
+        assert timeout.read <= 20.0
+        sent = mock_client.stream.call_args.kwargs["headers"]
+        assert 0 < int(sent["x-envoy-upstream-rq-timeout-ms"]) <= 20000
+
+    @patch('httpx.AsyncClient')
+    def test_early_rejection_when_queue_too_long(self, mock_client_class):
+        scheduler = schedulers["cloud"]
+        previous = scheduler.service_time
+        scheduler.service_time = 30.0
+        try:
+            client = TestClient(app)
+            response = client.post("/generate", json={"prompt": "hi", "mode": "cloud", "timeout": 5})
+        finally:
+            scheduler.service_time = previous
+        assert response.status_code == 503
+        assert "Deadline cannot be met" in response.json()["detail"]
+        mock_client_class.assert_not_called()
+
+    @patch('httpx.AsyncClient')
+    def test_deadline_expiry_returns_504(self, mock_client_class):
+        mock_upstream(mock_client_class, chat_response("late", delay=5))
+
+        with patch.object(deadline_module, "MIN_TIMEOUT_SECONDS", 0.05):
+            client = TestClient(app)
+            response = client.post("/generate", json={"prompt": "hi", "mode": "cloud"},
+                                   headers={"X-Request-Timeout": "100ms"})
+        assert response.status_code == 504
+        assert schedulers["cloud"].active == 0
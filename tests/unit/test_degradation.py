@@ -0,0 +1,153 @@
+"""
+Tests unitaires de la dégradation de modèle sous charge
+"""
+import asyncio
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from src.api import main
+from src.api.backends import BackendRegistry
+from src.api.degradation import DegradationLadder, ThroughputTracker, parse_ladders
+from src.api.main import app
+from tests.upstream_mock import FakeUpstreamResponse, mock_upstream
+
+LADDER = "mistral:7b-instruct>phi3:mini>llama3.2:1b>gpt-4o-mini@cloud"
+
+
+def _registry(local_concurrency=1):
+    return BackendRegistry.from_config({"backends": [
+        {"name": "ollama", "url": "http://gw/ollama", "type": "local", "concurrency": local_concurrency},
+        {"name": "openai", "url": "http://gw/openai", "type": "cloud", "models": ["gpt-4o-mini"]},
+    ]})
+
+
+def _tracker():
+    tracker = ThroughputTracker()
+    tracker.observe("ollama", "mistral:7b-instruct", 500, 50.0)  # 10 tok/s
+    tracker.observe("ollama", "phi3:mini", 500, 10.0)            # 50 tok/s
+    tracker.observe("ollama", "llama3.2:1b", 500, 5.0)           # 100 tok/s
+    tracker.observe("openai", "gpt-4o-mini", 500, 4.0)
+    return tracker
+
+
+async def _occupy(scheduler, count):
+    """Occupe le backend avec `count` appels bloqués ; retourne (gate, tâches)"""
+    gate = asyncio.Event()
+
+    async def call():
+        async with scheduler.slot("t"):
+            await gate.wait()
+
+    tasks = [asyncio.create_task(call()) for _ in range(count)]
+    await asyncio.sleep(0)
+    return gate, tasks
+
+
+class TestThroughputTracker:
+    """Tests des débits observés"""
+
+    def test_ewma(self):
+        tracker = ThroughputTracker(alpha=0.5)
+        assert tracker.generation_seconds("b", "m") is None
+        tracker.observe("b", "m", 100, 10.0)
+        tracker.observe("b", "m", 300, 10.0)
+        assert tracker.tokens_per_second("b", "m") == 20.0
+        assert tracker.generation_seconds("b", "m") == 10.0
+        tracker.observe("b", "m", 0, 1.0)
+        assert tracker.tokens_per_second("b", "m") == 20.0
+
+    def test_parse_ladders(self):
+        assert parse_ladders(LADDER + "; a>b ;single") == [
+            [("mistral:7b-instruct", None), ("phi3:mini", None), ("llama3.2:1b", None), ("gpt-4o-mini", "cloud")],
+            [("a", None), ("b", None)],
+        ]
+
+
+class TestDegradationLadder:
+    """Tests du choix du modèle servi"""
+
+    def test_keeps_requested_model_without_slo_or_data(self):
+        registry = _registry()
+        ladder = DegradationLadder(parse_ladders(LADDER), ThroughputTracker())
+        assert ladder.choose("local", "mistral:7b-instruct", "interactive", None, registry.resolve).report is None
+        choice = ladder.choose("local", "mistral:7b-instruct", "interactive", 1.0, registry.resolve)
+        assert (choice.model, choice.report) == ("mistral:7b-instruct", None)
+
+    def test_steps_down_to_first_rung_meeting_slo(self):
+        registry = _registry()
+        ladder = DegradationLadder(parse_ladders(LADDER), _tracker())
+        choice = ladder.choose("local", "mistral:7b-instruct", "interactive", 8.0, registry.resolve)
+        assert (choice.model, choice.mode) == ("llama3.2:1b", "local")
+        assert choice.report["requested_model"] == "mistral:7b-instruct"
+        assert "exceeds latency SLO 8s" in choice.report["reason"]
+        assert choice.report["predicted_seconds"] == {"mistral:7b-instruct": 50.0, "phi3:mini": 10.0,
+                                                      "llama3.2:1b": 5.0}
+
+        assert ladder.choose("local", "mistral:7b-instruct", "interactive", 60.0,
+                             registry.resolve).model == "mistral:7b-instruct"
+
+    @pytest.mark.asyncio
+    async def test_live_queue_depth_moves_to_cloud(self):
+        registry = _registry()
+        ollama = registry.get("ollama").scheduler
+        ollama.service_time = 20.0
+        ladder = DegradationLadder(parse_ladders(LADDER), _tracker())
+
+        gate, tasks = await _occupy(ollama, 3)  # 1 en cours, 2 en file
+        try:
+            choice = ladder.choose("local", "mistral:7b-instruct", "interactive", 8.0, registry.resolve)
+        finally:
+            gate.set()
+            await asyncio.gather(*tasks)
+        # File locale : 3 x 20s d'attente, même pour le plus petit modèle
+        assert (choice.model, choice.mode) == ("gpt-4o-mini", "cloud")
+        assert choice.report["predicted_seconds"]["llama3.2:1b"] == 65.0
+
+    def test_unmeasured_rung_is_skipped(self):
+        registry = _registry()
+        registry.get("ollama").scheduler.service_time = 2.0
+        tracker = ThroughputTracker()
+        tracker.observe("ollama", "mistral:7b-instruct", 500, 50.0)
+        ladder = DegradationLadder(parse_ladders("mistral:7b-instruct>phi3:mini"), tracker)
+        choice = ladder.choose("local", "mistral:7b-instruct", "interactive", 8.0, registry.resolve)
+        # phi3:mini n'a aucune mesure : la durée moyenne du backend ne suffit pas à le choisir
+        assert choice.model == "mistral:7b-instruct"
+        assert choice.report["predicted_seconds"] == {"mistral:7b-instruct": 50.0}
+
+    def test_fastest_rung_when_none_meets_slo(self):
+        registry = _registry()
+        ladder = DegradationLadder(parse_ladders("mistral:7b-instruct>phi3:mini"), _tracker())
+        choice = ladder.choose("local", "mistral:7b-instruct", "interactive", 1.0, registry.resolve)
+        assert choice.model == "phi3:mini"
+        assert "phi3:mini is the fastest option" in choice.report["reason"]
+
+
+class TestGenerateWithSlo:
+    """Tests de /generate avec objectif de latence"""
+
+    @patch('httpx.AsyncClient')
+    def test_downgraded_model_reported(self, mock_client_class):
+        mock_client = mock_upstream(mock_client_class, FakeUpstreamResponse({
+            "choices": [{"message": {"content": "ok"}}], "usage": {"completion_tokens": 40},
+        }))
+        registry, tracker = _registry(), _tracker()
+        with patch.object(main, "backends", registry), \
+                patch.object(main, "throughput", tracker), \
+                patch.object(main, "ladder", DegradationLadder(parse_ladders(LADDER), tracker)):
+            response = TestClient(app).post("/generate", json={
+                "prompt": "hi", "mode": "local", "model": "mistral:7b-instruct", "latency_slo": 8,
+            })
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["model"] == "llama3.2:1b"
+        assert data["degradation"]["requested_model"] == "mistral:7b-instruct"
+        assert mock_client.stream.call_args.kwargs["json"]["model"] == "llama3.2:1b"
+        # L'appel alimente le débit observé du modèle servi
+        assert tracker.tokens_per_second("ollama", "llama3.2:1b") > 100
+
+    @patch('httpx.AsyncClient')
+    def test_no_degradation_field_without_slo(self, mock_client_class):
+        mock_upstream(mock_client_class, FakeUpstreamResponse({"choices": [{"message": {"content": "ok"}}]}))
+        response = TestClient(app).post("/generate", json={"prompt": "hi", "mode": "cloud"})
+        assert "degradation" not in response.json()
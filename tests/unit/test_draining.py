@@ -0,0 +1,178 @@
+"""
+Tests unitaires de l'arrêt progressif (drainage au SIGTERM)
+"""
+import asyncio
+import signal
+import httpx
+import pytest
+from unittest.mock import patch
+from src.api import main
+from src.api.main import app
+from src.api.readiness import readiness
+from src.api.draining import Drainer, ServerDraining
+from src.api.multiplex import StreamMultiplexer
+from tests.upstream_mock import chat_response, mock_upstream
+
+RealAsyncClient = httpx.AsyncClient
+
+
+async def _work(gate: asyncio.Event, result: str = "done"):
+    await gate.wait()
+    return result
+
+
+class TestDrainer:
+    """Tests de l'admission, du délai de grâce et du signal"""
+
+    @pytest.mark.asyncio
+    async def test_in_flight_work_finishes_within_grace(self):
+        drainer = Drainer(grace_seconds=5)
+        gate = asyncio.Event()
+        running = asyncio.create_task(drainer.run(_work(gate)))
+        await asyncio.sleep(0)
+        assert drainer.in_flight == 1
+        draining = asyncio.create_task(drainer.drain())
+        await asyncio.sleep(0)
+        assert drainer.draining
+        gate.set()
+        assert await draining == 0
+        assert await running == "done"
+        assert drainer.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_work_interrupted_after_grace(self):
+        drainer = Drainer(grace_seconds=0.05)
+        running = asyncio.create_task(drainer.run(_work(asyncio.Event()), "session"))
+        await asyncio.sleep(0)
+        assert await drainer.drain() == 1
+        with pytest.raises(ServerDraining) as excinfo:
+            await running
+        assert excinfo.value.interrupted
+        assert drainer.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_new_work_rejected_while_draining(self):
+        drainer = Drainer(grace_seconds=5)
+        drainer.begin()
+        work = _work(asyncio.Event())
+        with pytest.raises(ServerDraining) as excinfo:
+            await drainer.run(work)
+        assert not excinfo.value.interrupted
+        assert work.cr_frame is None  # coroutine fermée, jamais attendue
+
+    @pytest.mark.asyncio
+    async def test_client_cancellation_is_not_an_interruption(self):
+        drainer = Drainer(grace_seconds=5)
+        running = asyncio.create_task(drainer.run(_work(asyncio.Event())))
+        await asyncio.sleep(0)
+        running.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await running
+        assert drainer.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_sigterm_drains_then_hands_over(self):
+        drainer = Drainer(grace_seconds=5)
+        received = []
+        original = signal.signal(signal.SIGTERM, lambda signum, frame: received.append(signum))
+        try:
+            assert drainer.install_signal_handler()
+            gate = asyncio.Event()
+            running = asyncio.create_task(drainer.run(_work(gate)))
+            await asyncio.sleep(0)
+            signal.raise_signal(signal.SIGTERM)
+            await asyncio.sleep(0.01)
+            assert drainer.draining and received == []
+            gate.set()
+            await drainer._drain_task
+            assert await running == "done"
+            assert received == [signal.SIGTERM]
+        finally:
+            signal.signal(signal.SIGTERM, original)
+
+    @pytest.mark.asyncio
+    async def test_second_sigterm_stops_immediately(self):
+        drainer = Drainer(grace_seconds=60)
+        received = []
+        original = signal.signal(signal.SIGTERM, lambda signum, frame: received.append(signum))
+        try:
+            drainer.install_signal_handler()
+            running = asyncio.create_task(drainer.run(_work(asyncio.Event())))
+            await asyncio.sleep(0)
+            signal.raise_signal(signal.SIGTERM)
+            await asyncio.sleep(0.01)
+            signal.raise_signal(signal.SIGTERM)
+            with pytest.raises(ServerDraining):
+                await running
+            assert received == [signal.SIGTERM]
+        finally:
+            signal.signal(signal.SIGTERM, original)
+
+
+class TestEndpointsWhileDraining:
+    """Tests des endpoints pendant l'arrêt"""
+
+    @pytest.mark.asyncio
+    @patch('httpx.AsyncClient')
+    async def test_ready_and_generate_rejected(self, mock_client_class):
+        local = Drainer(grace_seconds=5)
+        local.begin()
+        mock_client = mock_upstream(mock_client_class, chat_response("ok"))
+        transport = httpx.ASGITransport(app=app)
+        with patch.object(main, "drainer", local), patch.object(readiness, "maybe_refresh"):
+            async with RealAsyncClient(transport=transport, base_url="http://test") as client:
+                ready = await client.get("/ready")
+                response = await client.post("/generate", json={"prompt": "hi", "mode": "cloud"})
+
+        assert ready.status_code == 503
+        assert any("shutting down" in reason for reason in ready.json()["reasons"])
+        assert response.status_code == 503
+        assert response.headers["retry-after"] == "1"
+        assert mock_client.stream.call_count == 0
+
+    @pytest.mark.asyncio
+    @patch('httpx.AsyncClient')
+    async def test_generate_interrupted_after_grace(self, mock_client_class):
+        local = Drainer(grace_seconds=0.05)
+        mock_upstream(mock_client_class, chat_response("late", delay=30))
+        transport = httpx.ASGITransport(app=app)
+        with patch.object(main, "drainer", local):
+            async with RealAsyncClient(transport=transport, base_url="http://test") as client:
+                request = asyncio.create_task(client.post("/generate", json={"prompt": "hi", "mode": "cloud"}))
+                while local.in_flight == 0:
+                    await asyncio.sleep(0.005)
+                assert await local.drain() == 1
+                response = await request
+
+        assert response.status_code == 503
+
+
+class TestStreamsWhileDraining:
+    """Tests des flux WebSocket multiplexés pendant l'arrêt"""
+
+    @pytest.mark.asyncio
+    async def test_stream_interrupted_with_partial_text(self):
+        drainer = Drainer(grace_seconds=0.05)
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        async def stream(params):
+            yield "Hello "
+            yield "wor"
+            await asyncio.Event().wait()
+
+        mux = StreamMultiplexer(send, stream, drainer=drainer)
+        sender = asyncio.create_task(mux.sender())
+        await mux.handle({"type": "generate", "id": "r1", "prompt": "hi"})
+        await asyncio.sleep(0.01)
+        assert await drainer.drain() == 1
+        await mux.handle({"type": "generate", "id": "r2", "prompt": "hi"})
+        await asyncio.sleep(0.01)
+        await mux.close(sender)
+
+        assert {"type": "interrupted", "id": "r1", "reason": "server_shutdown", "partial": "Hello wor"} in sent
+        rejected = [m for m in sent if m["id"] == "r2"]
+        assert rejected[0]["type"] == "error" and rejected[0]["retry"] is True
+        assert drainer.in_flight == 0
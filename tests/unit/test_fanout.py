@@ -0,0 +1,119 @@
+"""
+Tests unitaires du fan-out multi-modèles
+"""
+import asyncio
+import json
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from src.api.main import app
+from src.api.fanout import Fanout
+from tests.upstream_mock import chat_response, mock_upstream
+
+
+TARGETS = [("slow", "local"), ("fast", "local"), ("broken", "cloud")]
+
+
+def _fake_call(delays, cancelled=None):
+    async def call(index):
+        model = TARGETS[index][0]
+        try:
+            await asyncio.sleep(delays[model])
+        except asyncio.CancelledError:
+            if cancelled is not None:
+                cancelled.append(model)
+            raise
+        if model == "broken":
+            raise RuntimeError("upstream down")
+        return f"answer from {model}", "ollama"
+    return call
+
+
+class TestFanoutStrategies:
+    """Tests des stratégies first / all"""
+
+    @pytest.mark.asyncio
+    async def test_first_returns_fastest_and_cancels_others(self):
+        cancelled = []
+        fanout = Fanout(TARGETS, _fake_call({"slow": 5, "fast": 0.01, "broken": 0}, cancelled),
+                        max_concurrency=3, deadline_seconds=10)
+        winner, failures = await fanout.first()
+        await asyncio.sleep(0)
+        assert winner.model == "fast"
+        assert winner.response == "answer from fast"
+        assert [f.model for f in failures] == ["broken"]
+        assert "slow" in cancelled
+
+    @pytest.mark.asyncio
+    async def test_first_deadline(self):
+        fanout = Fanout(TARGETS[:1], _fake_call({"slow": 5}), max_concurrency=1, deadline_seconds=0.05)
+        winner, failures = await fanout.first()
+        assert winner is None
+        assert failures[0].error == "Deadline exceeded"
+
+    @pytest.mark.asyncio
+    async def test_all_yields_in_completion_order(self):
+        fanout = Fanout(TARGETS, _fake_call({"slow": 0.05, "fast": 0.01, "broken": 0}),
+                        max_concurrency=3, deadline_seconds=10)
+        results = [r async for r in fanout.all()]
+        assert [r.model for r in results] == ["broken", "fast", "slow"]
+        assert all(r.latency_ms >= 0 for r in results)
+
+    @pytest.mark.asyncio
+    async def test_concurrency_cap(self):
+        running = []
+        peak = []
+
+        async def call(index):
+            running.append(index)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.remove(index)
+            return "ok", "openai"
+
+        fanout = Fanout([("m", "cloud")] * 5, call, max_concurrency=2, deadline_seconds=10)
+        results = [r async for r in fanout.all()]
+        assert len(results) == 5
+        assert max(peak) == 2
+
+
+class TestFanoutEndpoint:
+    """Tests du endpoint /generate/fanout"""
+
+    def _mock_client(self, mock_client_class):
+        def stream(method, endpoint, json=None, headers=None, timeout=None):
+            return chat_response(f"from {json['model']}")
+
+        mock_upstream(mock_client_class, handler=stream)
+
+    @patch('httpx.AsyncClient')
+    def test_first(self, mock_client_class):
+        self._mock_client(mock_client_class)
+        response = TestClient(app).post("/generate/fanout", json={
+            "prompt": "hello",
+            "targets": [{"model": "llama3.2:1b", "mode": "local"}, {"model": "gpt-4o-mini"}],
+            "strategy": "first",
+        })
+        assert response.status_code == 200
+        assert response.json()["response"].startswith("from ")
+
+    @patch('httpx.AsyncClient')
+    def test_all_streams_ndjson(self, mock_client_class):
+        self._mock_client(mock_client_class)
+        response = TestClient(app).post("/generate/fanout", json={
+            "prompt": "hello",
+            "targets": [{"model": "llama3.2:1b", "mode": "local"}, {"model": "phi3:mini", "mode": "local"}],
+            "strategy": "all",
+        })
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert {line["model"] for line in lines[:-1]} == {"llama3.2:1b", "phi3:mini"}
+        assert lines[-1] == {**lines[-1], "done": True, "succeeded": 2, "total": 2}
+
+    def test_validation(self):
+        client = TestClient(app)
+        assert client.post("/generate/fanout", json={"prompt": "x", "targets": []}).status_code == 422
+        response = client.post("/generate/fanout", json={
+            "prompt": "x", "targets": [{"model": "m"}], "strategy": "random"
+        })
+        assert response.status_code == 422
@@ -0,0 +1,189 @@
+"""
+Tests unitaires des clés d'idempotence
+"""
+import asyncio
+import random
+import httpx
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from src.api import main
+from src.api.idempotency import IdempotencyConflict, IdempotencyStore, fingerprint
+from src.api.main import app
+from tests.upstream_mock import chat_response, mock_upstream
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+@pytest.fixture
+def store():
+    local = IdempotencyStore(ttl_seconds=60, max_bytes=1024 * 1024)
+    with patch.object(main, "idempotency", local):
+        yield local
+
+
+def _counting_work(body: bytes, gate: asyncio.Event = None):
+    calls = []
+
+    async def work():
+        calls.append(1)
+        if gate is not None:
+            await gate.wait()
+        return body, "application/json"
+
+    return work, calls
+
+
+class TestIdempotencyStore:
+    """Tests du stockage des réponses par clé"""
+
+    @pytest.mark.asyncio
+    async def test_replay_without_new_execution(self):
+        store = IdempotencyStore()
+        work, calls = _counting_work(b'{"response": "ok"}')
+        assert await store.execute("c", "k", "f", work) == ((b'{"response": "ok"}', "application/json"), False)
+        assert await store.execute("c", "k", "f", work) == ((b'{"response": "ok"}', "application/json"), True)
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_keys_are_scoped_per_client(self):
+        store = IdempotencyStore()
+        work, calls = _counting_work(b"{}")
+        await store.execute("alice", "k", "f", work)
+        _, replayed = await store.execute("bob", "k", "f", work)
+        assert not replayed and len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_different_body_is_rejected(self):
+        store = IdempotencyStore()
+        work, _ = _counting_work(b"{}")
+        await store.execute("c", "k", "f1", work)
+        with pytest.raises(IdempotencyConflict):
+            await store.execute("c", "k", "f2", work)
+
+    @pytest.mark.asyncio
+    async def test_concurrent_duplicates_wait_for_first(self):
+        store = IdempotencyStore()
+        gate = asyncio.Event()
+        work, calls = _counting_work(b'{"response": "once"}', gate)
+        tasks = [asyncio.create_task(store.execute("c", "k", "f", work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        gate.set()
+        results = await asyncio.gather(*tasks)
+        assert len(calls) == 1
+        assert [replayed for _, replayed in results] == [False, True, True]
+        assert {payload for payload, _ in results} == {(b'{"response": "once"}', "application/json")}
+
+    @pytest.mark.asyncio
+    async def test_failure_releases_key_for_waiter(self):
+        store = IdempotencyStore()
+        gate = asyncio.Event()
+        attempts = []
+
+        async def work():
+            attempts.append(1)
+            if len(attempts) == 1:
+                await gate.wait()
+                raise RuntimeError("upstream down")
+            return b"{}", "application/json"
+
+        first = asyncio.create_task(store.execute("c", "k", "f", work))
+        second = asyncio.create_task(store.execute("c", "k", "f", work))
+        await asyncio.sleep(0.01)
+        gate.set()
+        with pytest.raises(RuntimeError):
+            await first
+        assert await second == ((b"{}", "application/json"), False)
+        assert len(attempts) == 2
+
+    @pytest.mark.asyncio
+    async def test_expired_records_are_regenerated(self):
+        store = IdempotencyStore(ttl_seconds=60)
+        work, calls = _counting_work(b"{}")
+        with patch("src.api.idempotency.time.monotonic", return_value=1000.0):
+            await store.execute("c", "k", "f", work)
+        with patch("src.api.idempotency.time.monotonic", return_value=1061.0):
+            _, replayed = await store.execute("c", "k", "f", work)
+        assert not replayed and len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_memory_budget_evicts_oldest(self):
+        body = random.Random(0).randbytes(2048)  # 2 Ko incompressibles
+        store = IdempotencyStore(max_bytes=6000)
+        for key in ("a", "b", "c", "d"):
+            work, _ = _counting_work(body)
+            await store.execute("c", key, "f", work)
+        assert store.stored_bytes <= 6000
+        assert len(store) < 4
+        work, calls = _counting_work(body)
+        _, replayed = await store.execute("c", "d", "f", work)
+        assert replayed
+        _, replayed = await store.execute("c", "a", "f", work)
+        assert not replayed
+
+    @pytest.mark.asyncio
+    async def test_large_bodies_are_compressed(self):
+        store = IdempotencyStore()
+        body = b'{"response": "' + b"print('hello')\\n" * 500 + b'"}'
+        work, _ = _counting_work(body)
+        await store.execute("c", "k", "f", work)
+        assert store.stored_bytes < len(body) / 4
+        assert (await store.execute("c", "k", "f", work))[0] == (body, "application/json")
+
+
+class TestGenerateIdempotency:
+    """Tests du header Idempotency-Key sur /generate"""
+
+    @patch('httpx.AsyncClient')
+    def test_retry_replays_stored_response(self, mock_client_class, client, store):
+        mock_client = mock_upstream(mock_client_class, chat_response("print('hi')"))
+        request = {"prompt": "hello", "mode": "cloud"}
+        first = client.post("/generate", json=request, headers={"Idempotency-Key": "retry-1"})
+        second = client.post("/generate", json=request, headers={"Idempotency-Key": "retry-1"})
+
+        assert first.status_code == 200 and second.status_code == 200
+        assert second.content == first.content
+        assert first.json()["response"] == "print('hi')"
+        assert "idempotent-replayed" not in first.headers
+        assert second.headers["idempotent-replayed"] == "true"
+        assert mock_client.stream.call_count == 1
+
+    @patch('httpx.AsyncClient')
+    def test_reused_key_with_other_body_is_rejected(self, mock_client_class, client, store):
+        mock_upstream(mock_client_class, chat_response("ok"))
+        headers = {"Idempotency-Key": "reused"}
+        assert client.post("/generate", json={"prompt": "a"}, headers=headers).status_code == 200
+        response = client.post("/generate", json={"prompt": "b"}, headers=headers)
+        assert response.status_code == 422
+        assert "different request body" in response.json()["detail"]
+
+    @patch('httpx.AsyncClient')
+    @pytest.mark.parametrize("other", [{"X-Priority": "batch"}, {"X-Request-Timeout": "5"},
+                                       {"Accept": "application/msgpack"}])
+    def test_reused_key_with_other_headers_is_rejected(self, mock_client_class, other, client, store):
+        mock_client = mock_upstream(mock_client_class, chat_response("ok"))
+        headers = {"Idempotency-Key": "reused-headers"}
+        assert client.post("/generate", json={"prompt": "a"}, headers=headers).status_code == 200
+        response = client.post("/generate", json={"prompt": "a"}, headers={**headers, **other})
+        assert response.status_code == 422
+        assert mock_client.stream.call_count == 1
+
+    @patch('httpx.AsyncClient')
+    def test_upstream_error_is_not_stored(self, mock_client_class, client, store):
+        mock_client = mock_upstream(mock_client_class, chat_response("ok"))
+        mock_client.stream.side_effect = [httpx.ReadTimeout("slow"), chat_response("ok")]
+        headers = {"Idempotency-Key": "flaky"}
+        assert client.post("/generate", json={"prompt": "a"}, headers=headers).status_code == 504
+        response = client.post("/generate", json={"prompt": "a"}, headers=headers)
+        assert response.status_code == 200 and "idempotent-replayed" not in response.headers
+
+    def test_invalid_key(self, client, store):
+        response = client.post("/generate", json={"prompt": "a"}, headers={"Idempotency-Key": "x" * 300})
+        assert response.status_code == 422
+
+    def test_fingerprint_is_stable(self):
+        assert fingerprint('{"a": 1}') == fingerprint('{"a": 1}') != fingerprint('{"a": 2}')
+        assert fingerprint("{}", "batch", None) == fingerprint("{}", "batch", None) != fingerprint("{}", "batch", "5")
@@ -0,0 +1,84 @@
+"""
+Tests unitaires des limites de taille des corps HTTP
+"""
+import json
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from src.api import limits
+from src.api.limits import BodySizeLimitMiddleware, UpstreamBodyTooLarge, read_bounded, read_json_bounded
+from src.api.main import app
+from tests.upstream_mock import FakeUpstreamResponse, chat_response, mock_upstream
+
+
+class TestUpstreamBody:
+    """Tests de la lecture bornée des réponses upstream"""
+
+    @pytest.mark.asyncio
+    async def test_reads_body_under_limit(self):
+        response = FakeUpstreamResponse({"response": "ok"}, chunk_size=4)
+        assert await read_json_bounded(response, limit=1024) == {"response": "ok"}
+
+    @pytest.mark.asyncio
+    async def test_stops_reading_past_limit(self):
+        response = FakeUpstreamResponse(b"x" * 10_000, chunk_size=100)
+        with pytest.raises(UpstreamBodyTooLarge):
+            await read_bounded(response, limit=1000)
+        assert response.bytes_read <= 1100
+
+    @pytest.mark.asyncio
+    async def test_declared_length_rejected_before_reading(self):
+        response = FakeUpstreamResponse(b"x" * 10, headers={"content-length": "50000"})
+        with pytest.raises(UpstreamBodyTooLarge):
+            await read_bounded(response, limit=1000)
+        assert response.bytes_read == 0
+
+    @patch('httpx.AsyncClient')
+    def test_generate_aborts_oversized_upstream_reply(self, mock_client_class):
+        upstream = chat_response("y" * 5000, chunk_size=256)
+        mock_upstream(mock_client_class, upstream)
+        with patch.object(limits, "MAX_UPSTREAM_BODY_BYTES", 1024):
+            response = TestClient(app).post("/generate", json={"prompt": "hi", "mode": "cloud"})
+        assert response.status_code == 502
+        assert "exceeds 1024 bytes" in response.json()["detail"]
+        assert upstream.closed
+        assert upstream.bytes_read < 5000
+
+
+class TestRequestBody:
+    """Tests du plafond des corps de requête entrants"""
+
+    def test_declared_oversized_body_is_rejected(self):
+        client = TestClient(app)
+        response = client.post("/generate", json={"prompt": "x" * (limits.MAX_REQUEST_BODY_BYTES + 1)})
+        assert response.status_code == 413
+        assert "exceeds" in response.json()["detail"]
+
+    @pytest.mark.asyncio
+    async def test_streamed_body_is_cut_off(self):
+        called = {}
+
+        async def downstream(scope, receive, send):
+            # Lecture du corps par morceaux, comme Starlette
+            while True:
+                message = await receive()
+                called.setdefault("chunks", 0)
+                called["chunks"] += 1
+                if not message.get("more_body"):
+                    break
+
+        middleware = BodySizeLimitMiddleware(downstream, max_bytes=100)
+        chunks = [{"type": "http.request", "body": b"x" * 60, "more_body": True} for _ in range(10)]
+        sent = []
+
+        async def receive():
+            return chunks.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        await middleware({"type": "http", "headers": []}, receive, send)
+        assert called["chunks"] == 1
+        assert sent[0]["status"] == 413
+        assert json.loads(sent[1]["body"])["detail"] == "Request body exceeds 100 bytes"
+        assert len(chunks) == 8
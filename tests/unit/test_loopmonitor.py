@@ -0,0 +1,103 @@
+"""
+Tests unitaires de la surveillance de la boucle d'événements
+"""
+import asyncio
+import logging
+import time
+import pytest
+from src.api.loopmonitor import LOOP_BLOCKED, LOOP_LAG, LoopMonitor
+
+
+def _blocking_handler():
+    time.sleep(0.3)
+
+
+class TestLoopMonitor:
+    """Tests de la sonde, du chien de garde et du mode strict"""
+
+    @pytest.mark.asyncio
+    async def test_probe_observes_lag(self):
+        monitor = LoopMonitor(interval=0.01, threshold=1.0)
+        before = LOOP_LAG.count()
+        monitor.start()
+        try:
+            await asyncio.sleep(0.1)
+        finally:
+            await monitor.stop()
+        assert LOOP_LAG.count() > before
+        assert not monitor.blocked
+
+    @pytest.mark.asyncio
+    @pytest.mark.allow_blocking
+    async def test_watchdog_reports_blocking_location(self):
+        monitor = LoopMonitor(interval=0.01, threshold=0.1)
+        before = LOOP_BLOCKED.value()
+        monitor.start()
+        try:
+            await asyncio.sleep(0.05)
+            _blocking_handler()
+            await asyncio.sleep(0.05)
+        finally:
+            await monitor.stop()
+        assert len(monitor.blocked) == 1
+        call = monitor.blocked[0]
+        # Emplacement relevé pendant le blocage, durée réelle connue à la reprise
+        assert "_blocking_handler" in call.location
+        assert any("test_loopmonitor.py" in line for line in call.stack)
+        assert call.duration >= 0.2
+        assert LOOP_BLOCKED.value() >= before + 1
+
+    def test_reports_are_rate_limited_per_location(self, caplog):
+        monitor = LoopMonitor(report_interval=60)
+        with caplog.at_level(logging.WARNING, logger="prompt2prod.loop"):
+            for _ in range(3):
+                monitor.record("app.py:10 in handler", 0.2)
+            monitor.record("app.py:20 in other", 0.2)
+        assert len(monitor.blocked) == 4
+        messages = [r.getMessage() for r in caplog.records]
+        assert len(messages) == 2
+        assert "app.py:10 in handler" in messages[0]
+
+        monitor.report_interval = 0
+        with caplog.at_level(logging.WARNING, logger="prompt2prod.loop"):
+            monitor.record("app.py:10 in handler", 0.2)
+        assert "2 similar reports suppressed" in caplog.records[-1].getMessage()
+
+    @pytest.mark.asyncio
+    @pytest.mark.allow_blocking
+    async def test_callback_timer_records_slow_callbacks(self):
+        monitor = LoopMonitor(threshold=0.05)
+
+        async def slow_step():
+            time.sleep(0.1)
+
+        async def fast_step():
+            await asyncio.sleep(0)
+
+        monitor.install_callback_timer()
+        try:
+            await asyncio.create_task(fast_step())
+            await asyncio.create_task(slow_step())
+        finally:
+            monitor.uninstall_callback_timer()
+        assert len(monitor.blocked) == 1
+        assert "slow_step" in monitor.blocked[0].location
+        assert monitor.blocked[0].duration >= 0.1
+
+    @pytest.mark.asyncio
+    async def test_callback_timer_ignores_garbage_collector_pauses(self):
+        monitor = LoopMonitor(threshold=0.05)
+
+        async def step_interrupted_by_gc():
+            # Collecte simulée : la pause est mesurée par gc.callbacks
+            monitor._on_gc("start", {})
+            time.sleep(0.1)
+            monitor._on_gc("stop", {})
+
+        monitor.install_callback_timer()
+        try:
+            await asyncio.create_task(step_interrupted_by_gc())
+        finally:
+            monitor.uninstall_callback_timer()
+        assert not monitor.blocked
+        assert monitor._gc_time >= 0.1
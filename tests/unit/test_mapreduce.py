@@ -0,0 +1,218 @@
+"""
+Tests unitaires de la génération map-reduce des prompts surdimensionnés
+"""
+import asyncio
+import json
+import httpx
+import pytest
+from unittest.mock import patch
+from src.api import main
+from src.api.main import app
+from src.api.mapreduce import MapReducer, TooManyChunks, pack_chunks, split_sources, split_units
+from tests.upstream_mock import chat_response, mock_upstream
+
+RealAsyncClient = httpx.AsyncClient
+
+
+def _function(name: str, lines: int = 12) -> str:
+    body = "".join(f"    value_{i} = compute_{name}({i}) + offset\n" for i in range(lines))
+    return f"def {name}(offset):\n{body}    return value_0\n\n"
+
+
+def _module(prefix: str, functions: int = 6) -> str:
+    return "import os\n\n" + "".join(_function(f"{prefix}_{i}") for i in range(functions))
+
+
+PROMPT = (
+    "Refactor these modules to use type hints.\n\n"
+    f"utils.py\n```python\n{_module('util')}```\n\n"
+    f"```python core/models.py\n{_module('model')}```\n"
+)
+
+
+def _fake_call(delay: float = 0.0, active: list = None):
+    calls = []
+
+    async def call(messages):
+        content = messages[-1]["content"]
+        calls.append(content)
+        if active is not None:
+            active.append(active[-1] + 1 if active else 1)
+        await asyncio.sleep(delay)
+        if active is not None:
+            active.append(active[-1] - 1)
+        if content.startswith("Refactor") and "Merge the partial results" in content:
+            return "merged", "openai", {}
+        part = content.split("part ", 1)[1].split("/", 1)[0]
+        return f"result {part}", "openai", {}
+    return call, calls
+
+
+class TestSplitting:
+    """Tests du découpage structurel"""
+
+    def test_split_sources(self):
+        instruction, sources = split_sources(PROMPT)
+        assert instruction == "Refactor these modules to use type hints."
+        assert [(s.label, s.language) for s in sources] == [("utils.py", "python"), ("core/models.py", "python")]
+        instruction, sources = split_sources("Explain this log.\n\nline 1\nline 2")
+        assert instruction == "Explain this log." and sources[0].code == "line 1\nline 2"
+        assert split_sources("Hello") == ("Hello", [])
+
+    def test_split_units_keeps_definitions_whole(self):
+        code = "import os\n\n@decorator\n@other\ndef a():\n    pass\n\nclass B:\n    def c(self):\n        pass\n"
+        units = split_units(code)
+        assert [u.splitlines()[0] for u in units] == ["import os", "@decorator", "class B:"]
+        assert "def c(self)" in units[2]
+
+    def test_pack_chunks_respects_budget_and_order(self):
+        _, sources = split_sources(PROMPT)
+        chunks = pack_chunks(sources, budget=200)
+        assert len(chunks) > 2
+        assert all(chunk.tokens <= 200 for chunk in chunks)
+        text = "".join(chunk.text for chunk in chunks)
+        assert text.index("def util_5") < text.index("def model_0")
+        # Aucune fonction coupée en deux morceaux
+        for i in range(6):
+            assert sum(f"def model_{i}(" in chunk.text for chunk in chunks) == 1
+        assert chunks[0].labels == ("utils.py",)
+
+    def test_oversized_definition_split_by_lines(self):
+        chunks = pack_chunks(split_sources(f"Fix.\n\n```python\n{_function('big', 200)}```")[1], budget=300)
+        assert len(chunks) > 1 and all(chunk.tokens <= 300 for chunk in chunks)
+
+    def test_plan(self):
+        reducer = MapReducer(chunk_tokens=300, max_chunks=32)
+        assert reducer.plan("Create a hello world") is None
+        plan = reducer.plan(PROMPT)
+        assert plan.instruction.startswith("Refactor") and len(plan.chunks) >= 2
+        # Fenêtre du modèle plus petite que le budget configuré
+        assert len(MapReducer(chunk_tokens=4096).plan(PROMPT, context_tokens=1324).chunks) > 1
+        with pytest.raises(TooManyChunks):
+            MapReducer(chunk_tokens=256, max_chunks=2).plan(PROMPT)
+
+
+class TestMapReducer:
+    """Tests de l'exécution parallèle bornée et de la fusion"""
+
+    @pytest.mark.asyncio
+    async def test_parallel_map_then_reduce(self):
+        reducer = MapReducer(chunk_tokens=300, max_concurrency=3)
+        plan = reducer.plan(PROMPT)
+        active, events = [], []
+        call, calls = _fake_call(delay=0.05, active=active)
+        text, provider, report = await reducer.run(plan, call, events.append)
+
+        assert text == "merged" and provider == "openai"
+        assert max(active) == 3
+        assert len(calls) == len(plan.chunks) + 1
+        merge = calls[-1]
+        # Résultats partiels fusionnés dans l'ordre des morceaux
+        assert [merge.index(f"result {i + 1}\n") for i in range(len(plan.chunks) - 1)] == sorted(
+            merge.index(f"result {i + 1}\n") for i in range(len(plan.chunks) - 1))
+        assert [e["event"] for e in events][0] == "plan"
+        assert sum(e["event"] == "chunk" for e in events) == len(plan.chunks)
+        assert report["chunks"] == len(plan.chunks) and report["reduce_rounds"] == 1
+        # Plus rapide qu'un passage séquentiel des mêmes appels
+        assert report["elapsed_ms"] < report["sequential_ms"]
+        assert report["speedup"] > 1.5
+
+    @pytest.mark.asyncio
+    async def test_hierarchical_reduce_when_partials_too_large(self):
+        reducer = MapReducer(chunk_tokens=300, max_concurrency=8)
+        plan = reducer.plan(PROMPT)
+
+        async def call(messages):
+            content = messages[-1]["content"]
+            if "Merge the partial results" in content:
+                return "m" * 400, "openai", {}
+            return "r" * 600, "openai", {}
+
+        text, _, report = await reducer.run(plan, call)
+        assert report["reduce_rounds"] > 1
+        assert report["calls"] > len(plan.chunks) + 1
+
+    @pytest.mark.asyncio
+    async def test_failure_cancels_other_calls(self):
+        reducer = MapReducer(chunk_tokens=300, max_concurrency=32)
+        plan = reducer.plan(PROMPT)
+        cancelled = []
+
+        async def call(messages):
+            if "part 1/" in messages[-1]["content"]:
+                raise httpx.ConnectError("down")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+            return "", "openai", {}
+
+        with pytest.raises(httpx.ConnectError):
+            await reducer.run(plan, call)
+        assert len(cancelled) == len(plan.chunks) - 1
+
+
+class TestGenerateMapReduce:
+    """Tests du mode map-reduce de /generate"""
+
+    @staticmethod
+    def _handler(calls):
+        def handler(method, url, json=None, headers=None, timeout=None):
+            content = json["messages"][-1]["content"]
+            calls.append(json)
+            return chat_response("merged" if "Merge the partial results" in content else "partial", delay=0.02)
+        return handler
+
+    @pytest.mark.asyncio
+    @patch('httpx.AsyncClient')
+    async def test_generate_map_reduce(self, mock_client_class):
+        calls = []
+        mock_upstream(mock_client_class, handler=self._handler(calls))
+        transport = httpx.ASGITransport(app=app)
+        with patch.object(main, "mapreducer", MapReducer(chunk_tokens=300, max_concurrency=4)):
+            async with RealAsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post("/generate", json={"prompt": PROMPT, "mode": "cloud",
+                                                                "map_reduce": True})
+                small = await client.post("/generate", json={"prompt": "hi", "mode": "cloud",
+                                                             "map_reduce": True})
+
+        assert response.status_code == 200
+        body = response.json()
+        report = body["map_reduce"]
+        assert body["response"] == "merged"
+        assert report["calls"] == report["chunks"] + 1
+        assert all(call["max_tokens"] == 1024 for call in calls[:report["calls"]])
+        # Prompt qui tient en un appel : chemin normal
+        assert len(calls) == report["calls"] + 1
+        assert small.json()["response"] == "partial" and "map_reduce" not in small.json()
+
+    @pytest.mark.asyncio
+    @patch('httpx.AsyncClient')
+    async def test_streamed_progress(self, mock_client_class):
+        calls = []
+        mock_upstream(mock_client_class, handler=self._handler(calls))
+        transport = httpx.ASGITransport(app=app)
+        with patch.object(main, "mapreducer", MapReducer(chunk_tokens=300, max_concurrency=4)):
+            async with RealAsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post("/generate", json={"prompt": PROMPT, "mode": "cloud",
+                                                                "map_reduce": True},
+                                             headers={"Accept": "application/x-ndjson"})
+
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        events = [json.loads(line) for line in response.text.splitlines()]
+        assert events[0]["event"] == "plan"
+        chunks = events[0]["chunks"]
+        assert [e["done"] for e in events if e["event"] == "chunk"] == list(range(1, chunks + 1))
+        assert events[-2]["event"] == "reduce"
+        assert events[-1]["event"] == "result" and events[-1]["response"] == "merged"
+
+    @patch('httpx.AsyncClient')
+    def test_too_many_chunks(self, mock_client_class):
+        from fastapi.testclient import TestClient
+        mock_client = mock_upstream(mock_client_class, chat_response("x"))
+        with patch.object(main, "mapreducer", MapReducer(chunk_tokens=256, max_chunks=2)):
+            response = TestClient(app).post("/generate", json={"prompt": PROMPT, "mode": "cloud",
+                                                               "map_reduce": True})
+        assert response.status_code == 413
+        assert mock_client.stream.call_count == 0
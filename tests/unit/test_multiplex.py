@@ -0,0 +1,142 @@
+"""
+Tests unitaires du streaming multiplexé (WebSocket)
+"""
+import asyncio
+import pytest
+from unittest.mock import patch, MagicMock
+from fastapi.testclient import TestClient
+from src.api.main import app
+from src.api.multiplex import StreamMultiplexer
+
+
+class _FakeStreamResponse:
+    """Réponse httpx en streaming (SSE format OpenAI)"""
+
+    def __init__(self, fragments):
+        self.status_code = 200
+        self.fragments = fragments
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        return None
+
+    async def aiter_lines(self):
+        for fragment in self.fragments:
+            yield 'data: {"choices": [{"delta": {"content": "%s"}}]}' % fragment
+            await asyncio.sleep(0)
+        yield "data: [DONE]"
+
+
+def _mock_streaming_client(mock_client_class):
+    def stream(method, endpoint, json=None, headers=None, timeout=None):
+        prompt = json["messages"][-1]["content"]
+        return _FakeStreamResponse([f"{prompt}-{i}" for i in range(3)])
+
+    mock_client = MagicMock()
+    mock_client.__aenter__ = MagicMock()
+    async def aenter():
+        return mock_client
+    async def aexit(*args):
+        return None
+    mock_client.__aenter__.side_effect = aenter
+    mock_client.__aexit__ = MagicMock(side_effect=aexit)
+    mock_client.stream = MagicMock(side_effect=stream)
+    mock_client_class.return_value = mock_client
+    return mock_client
+
+
+class TestStreamMultiplexer:
+    """Tests du multiplexeur"""
+
+    @pytest.mark.asyncio
+    async def test_backpressure_bounds_the_send_queue(self):
+        produced = []
+
+        async def stream(params):
+            for i in range(100):
+                produced.append(i)
+                yield str(i)
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        mux = StreamMultiplexer(send, stream, queue_size=4)
+        await mux.handle({"type": "generate", "id": "a"})
+        for _ in range(10):
+            await asyncio.sleep(0)
+        # Sans lecteur, le producteur est bloqué dès que la file est pleine
+        assert mux.queue.qsize() == 4
+        assert len(produced) <= 5
+
+        sender = asyncio.create_task(mux.sender())
+        while "a" in mux.tasks:
+            await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        await mux.close(sender)
+        assert [m["type"] for m in sent].count("token") == 100
+        assert sent[-1]["type"] == "done"
+
+    @pytest.mark.asyncio
+    async def test_cancel_and_limits(self):
+        gate = asyncio.Event()
+
+        async def stream(params):
+            yield "first"
+            await gate.wait()
+            yield "never"
+
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        mux = StreamMultiplexer(send, stream, max_streams=1)
+        sender = asyncio.create_task(mux.sender())
+        await mux.handle({"type": "generate", "id": "a"})
+        await mux.handle({"type": "generate", "id": "b"})
+        await asyncio.sleep(0.01)
+        await mux.handle({"type": "cancel", "id": "a"})
+        await asyncio.sleep(0.01)
+        await mux.close(sender)
+
+        by_id = [(m["type"], m["id"]) for m in sent]
+        assert ("error", "b") in by_id
+        assert ("token", "a") in by_id
+        assert ("cancelled", "a") in by_id
+        assert all(m.get("data") != "never" for m in sent)
+
+
+class TestWebSocketEndpoint:
+    """Tests du endpoint /ws/generate"""
+
+    @patch('httpx.AsyncClient')
+    def test_interleaved_streams(self, mock_client_class):
+        mock_client = _mock_streaming_client(mock_client_class)
+        client = TestClient(app)
+        with client.websocket_connect("/ws/generate") as ws:
+            ws.send_json({"type": "generate", "id": "r1", "prompt": "a", "mode": "cloud"})
+            ws.send_json({"type": "generate", "id": "r2", "prompt": "b", "mode": "cloud"})
+            tokens = {"r1": [], "r2": []}
+            done = set()
+            while len(done) < 2:
+                message = ws.receive_json()
+                if message["type"] == "token":
+                    tokens[message["id"]].append(message["data"])
+                elif message["type"] == "done":
+                    done.add(message["id"])
+                else:
+                    pytest.fail(f"unexpected message {message}")
+        assert tokens == {"r1": ["a-0", "a-1", "a-2"], "r2": ["b-0", "b-1", "b-2"]}
+        assert mock_client.stream.call_args.kwargs["json"]["stream"] is True
+
+    def test_invalid_messages(self):
+        client = TestClient(app)
+        with client.websocket_connect("/ws/generate") as ws:
+            ws.send_text("not json")
+            assert ws.receive_json()["error"] == "Invalid JSON message"
+            ws.send_json({"type": "generate"})
+            assert ws.receive_json()["error"] == "Missing request id"
@@ -0,0 +1,120 @@
+"""
+Tests unitaires du pré-traitement des prompts
+"""
+import ast
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from src.api import main
+from src.api.main import app
+from src.api.preprocess import PromptPreprocessor
+from tests.upstream_mock import chat_response, mock_upstream
+
+CODE = (
+    "def area(shape,   scale):\n"
+    "    if shape.kind == 'circle':   \n"
+    "        return 3.14  *  shape.r ** 2 * scale\n"
+    "\n\n\n\n"
+    "    return  shape.w * shape.h * scale\n"
+)
+
+PROMPT = (
+    "Please   review   this   file:\r\n\n\n\n"
+    f"```python\n{CODE}```\n\n\n"
+    "And   the copy   attached by mistake:\n\n"
+    f"```python\n{CODE}```\n   \n"
+)
+
+
+class TestPromptPreprocessor:
+    """Tests des règles de pré-traitement"""
+
+    def test_whitespace_keeps_fenced_code_byte_identical(self):
+        result = PromptPreprocessor(["whitespace"]).process(PROMPT)
+        assert result.text.startswith("Please review this file:\n\n```python\n")
+        code = result.text.split("```python\n")[1].split("```")[0]
+        # Contenu clôturé intact : espaces intérieurs, fins de ligne et lignes vides
+        assert code == CODE
+        assert result.applied == ["whitespace"]
+
+    def test_indented_text_is_preserved(self):
+        text = "Steps:\n    first   step\n\tsecond"
+        assert PromptPreprocessor(["whitespace"]).process(text).text == text
+
+    def test_unfenced_code_is_untouched(self):
+        code = (
+            'x = "a    b"\n'
+            "return x  # two\n"
+            'doc = """line   \n'
+            "\n\n\n"
+            'end  """\n'
+        )
+        text = f"Fix this   code:\n\n{code}"
+        result = PromptPreprocessor(["whitespace"]).process(text)
+        assert result.text == f"Fix this code:\n\n{code}"
+        assert 'x = "a    b"' in result.text and "return x  # two" in result.text
+
+    def test_whitespace_significant_strings_in_fences(self):
+        code = 'SQL = """\nSELECT  a,   b   \n\n\n\nFROM t  \n"""\n'
+        text = f"Review:\n\n```python\n{code}```\n"
+        result = PromptPreprocessor(["whitespace"]).process(text)
+        assert result.text.split("```python\n")[1].split("```")[0] == code
+
+    def test_dedupe_replaces_repeated_blocks(self):
+        result = PromptPreprocessor(dedup_min_tokens=8).process(PROMPT)
+        assert result.text.count("return  shape.w") == 1
+        assert "[omitted: identical to an earlier block starting with 'def area(shape, scale):']" in result.text
+        assert result.applied == ["whitespace", "dedupe"]
+        assert result.tokens_after < result.tokens_before
+        assert result.to_dict() == {
+            "tokens_before": result.tokens_before,
+            "tokens_after": result.tokens_after,
+            "rules": ["whitespace", "dedupe"],
+        }
+
+    def test_short_blocks_are_kept(self):
+        text = "ok\n\nok\n\nok"
+        assert PromptPreprocessor(["dedupe"], dedup_min_tokens=16).process(text).text == text
+
+    def test_deterministic_and_idempotent(self):
+        preprocessor = PromptPreprocessor(dedup_min_tokens=8)
+        once = preprocessor.process(PROMPT).text
+        assert preprocessor.process(PROMPT).text == once
+        again = preprocessor.process(once)
+        assert again.text == once
+        assert again.applied == []
+
+    def test_unknown_rule(self):
+        with pytest.raises(ValueError):
+            PromptPreprocessor(["whitespace", "summarize"])
+
+    def test_activation(self):
+        assert not PromptPreprocessor().active()
+        assert PromptPreprocessor().active(True)
+        assert not PromptPreprocessor(enabled=True).active(False)
+        assert not PromptPreprocessor([], enabled=True).active(True)
+
+
+class TestGeneratePreprocessing:
+    """Tests de /generate avec pré-traitement"""
+
+    @patch('httpx.AsyncClient')
+    def test_preprocessed_prompt_is_sent(self, mock_client_class):
+        mock_client = mock_upstream(mock_client_class, chat_response("ok"))
+        with patch.object(main, "preprocessor", PromptPreprocessor(dedup_min_tokens=8)):
+            response = TestClient(app).post("/generate", json={"prompt": PROMPT, "preprocess": True})
+
+        assert response.status_code == 200
+        report = response.json()["preprocessing"]
+        assert report["rules"] == ["whitespace", "dedupe"]
+        assert report["tokens_after"] < report["tokens_before"]
+        sent = mock_client.stream.call_args.kwargs["json"]["messages"][0]["content"]
+        assert sent.count("return  shape.w") == 1
+
+    @patch('httpx.AsyncClient')
+    def test_disabled_by_default(self, mock_client_class):
+        mock_client = mock_upstream(mock_client_class, chat_response("ok"))
+        response = TestClient(app).post("/generate", json={"prompt": PROMPT})
+
+        assert "preprocessing" not in response.json()
+        assert mock_client.stream.call_args.kwargs["json"]["messages"][0]["content"] == PROMPT
@@ -0,0 +1,99 @@
+"""
+Tests unitaires du profilage à la demande
+"""
+import asyncio
+import time
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from src.api import main
+from src.api.main import app
+from src.api.profiling import SamplingProfiler
+from tests.upstream_mock import chat_response, mock_upstream
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestSamplingProfiler:
+    """Tests du profileur"""
+
+    def test_activation(self):
+        assert not SamplingProfiler().sampled("anything")
+        profiler = SamplingProfiler(token="secret")
+        assert profiler.sampled("secret")
+        assert not profiler.sampled("wrong")
+        assert not profiler.sampled(None)
+        assert SamplingProfiler(sample_rate=1.0).sampled()
+
+    @pytest.mark.asyncio
+    @pytest.mark.allow_blocking
+    async def test_captures_async_waits_and_cpu(self):
+        profiler = SamplingProfiler(token="t", interval=0.001)
+
+        async def waiting_step():
+            await asyncio.sleep(0.05)
+
+        async def handler():
+            await waiting_step()
+            _busy(0.05)
+            return "done"
+
+        assert await profiler.profiled(handler(), {"model": "m"}) == "done"
+        profile = profiler.profiles[-1]
+        assert profile.samples > 0
+        text = profiler.collapsed()
+        assert text.startswith("profile 1 m;")
+        # Attente asynchrone : chaîne de coroutines + objet attendu
+        assert any("waiting_step" in line and "[await" in line for line in text.splitlines())
+        # CPU sur la boucle : pile synchrone sous la coroutine
+        assert any(line.split(" ")[-2].endswith("_busy") for line in text.splitlines())
+
+    @pytest.mark.asyncio
+    async def test_ring_buffer_is_bounded(self):
+        profiler = SamplingProfiler(token="t", capacity=2)
+
+        async def noop():
+            return None
+
+        for _ in range(3):
+            await profiler.profiled(noop())
+        assert [p.id for p in profiler.profiles] == [2, 3]
+
+
+class TestProfilesEndpoint:
+    """Tests de /debug/profiles"""
+
+    def test_disabled_by_default(self):
+        assert TestClient(app).get("/debug/profiles").status_code == 404
+
+    def test_profiles_not_served_without_token(self):
+        local = SamplingProfiler(sample_rate=1.0, interval=0.001)
+        asyncio.run(local.profiled(asyncio.sleep(0.02)))
+        client = TestClient(app)
+        with patch.object(main, "profiler", local):
+            assert local.enabled and local.profiles
+            assert client.get("/debug/profiles").status_code == 404
+            assert client.get("/debug/profiles", headers={"X-Profile-Token": ""}).status_code == 404
+            assert client.get(f"/debug/profiles/{local.profiles[0].id}").status_code == 404
+
+    @patch('httpx.AsyncClient')
+    def test_profiled_generate_request(self, mock_client_class):
+        mock_upstream(mock_client_class, chat_response("ok", delay=0.05))
+        local = SamplingProfiler(token="secret", interval=0.001)
+        client = TestClient(app)
+        with patch.object(main, "profiler", local):
+            response = client.post("/generate", json={"prompt": "hi", "mode": "cloud"},
+                                   headers={"X-Profile-Token": "secret"})
+            assert response.status_code == 200
+            assert client.get("/debug/profiles").status_code == 403
+            profiles = client.get("/debug/profiles?format=json",
+                                  headers={"X-Profile-Token": "secret"}).json()
+            collapsed = client.get(f"/debug/profiles/{profiles[0]['id']}",
+                                   headers={"X-Profile-Token": "secret"}).text
+        assert profiles[0]["model"] == "gpt-4o-mini"
+        assert profiles[0]["samples"] > 0
+        assert "main.py:call_llm" in collapsed
@@ -0,0 +1,188 @@
+"""
+Tests unitaires du rate limiting par client
+"""
+import os
+import time
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from starlette.requests import Request
+from src.api.main import app
+from src.api import ratelimit
+from src.api.ratelimit import BucketResult, InMemoryStore, RateLimiter, RateLimitStore, rate_limit_headers
+from src.api.tokens import estimate_tokens, usage_tokens
+from tests.upstream_mock import FakeUpstreamResponse, mock_upstream
+
+
+@pytest.fixture
+def strict_limiter():
+    """Limiteur global remplacé par un limiteur très restrictif"""
+    local = RateLimiter(requests_per_minute=2, tokens_per_minute=1000, store=InMemoryStore())
+    with patch.object(ratelimit, "limiter", local), \
+            patch("src.api.main.limiter", local):
+        yield local
+
+
+class SharedDictStore(RateLimitStore):
+    """Double de test d'un store partagé (type Redis) : un seul dict pour tous les réplicas"""
+
+    data = {}
+
+    def _refill(self, key, capacity, refill_per_sec):
+        now = time.monotonic()
+        tokens, updated = self.data.get(key, (float(capacity), now))
+        return min(float(capacity), tokens + (now - updated) * refill_per_sec), now
+
+    def take(self, key, capacity, refill_per_sec, cost=1.0):
+        tokens, now = self._refill(key, capacity, refill_per_sec)
+        allowed = tokens >= max(cost, 1.0)
+        if allowed:
+            tokens -= cost
+        self.data[key] = (tokens, now)
+        return BucketResult(allowed, capacity, max(0, int(tokens)), 0.0 if allowed else 60.0 / capacity)
+
+    def debit(self, key, capacity, refill_per_sec, cost):
+        tokens, now = self._refill(key, capacity, refill_per_sec)
+        self.data[key] = (tokens - cost, now)
+        return BucketResult(True, capacity, max(0, int(tokens - cost)), 0.0)
+
+
+def _request(headers=None, peer="10.0.0.7"):
+    return Request({"type": "http", "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+                    "client": (peer, 1234)})
+
+
+def _mock_upstream(mock_client_class, payload):
+    return mock_upstream(mock_client_class, FakeUpstreamResponse(payload))
+
+
+class TestTokenBucket:
+    """Tests du store en mémoire"""
+
+    def test_take_until_empty(self):
+        store = InMemoryStore()
+        assert store.take("k", 2, 0.001).allowed
+        assert store.take("k", 2, 0.001).allowed
+        result = store.take("k", 2, 0.001)
+        assert not result.allowed
+        assert result.remaining == 0
+        assert result.reset_seconds > 0
+
+    def test_debit_can_go_negative(self):
+        store = InMemoryStore()
+        store.debit("k", 100, 0.001, 150)
+        assert not store.take("k", 100, 0.001, 0.0).allowed
+
+    def test_idle_keys_are_evicted(self):
+        store = InMemoryStore(idle_seconds=0.0)
+        store.take("a", 10, 1.0)
+        store.take("b", 10, 1.0)
+        assert len(store) == 1
+
+    def test_max_keys_bound(self):
+        store = InMemoryStore(max_keys=3)
+        for i in range(10):
+            store.take(f"k{i}", 10, 1.0)
+        assert len(store) == 3
+
+    def test_headers(self):
+        store = InMemoryStore()
+        store.take("k", 1, 1.0)
+        headers = rate_limit_headers(store.take("k", 1, 1.0))
+        assert headers["RateLimit-Limit"] == "1"
+        assert headers["RateLimit-Remaining"] == "0"
+        assert int(headers["Retry-After"]) >= 1
+
+
+class TestClientIdentity:
+    """Tests de l'identification du client (clé API, IP, proxies de confiance)"""
+
+    def test_disabled_by_default(self):
+        if not any(os.getenv(v) for v in ("RATE_LIMIT_REQUESTS_PER_MINUTE", "RATE_LIMIT_TOKENS_PER_MINUTE")):
+            assert not ratelimit.limiter.enabled
+        assert not RateLimiter(0, 0).enabled
+
+    def test_forwarded_for_ignored_without_trusted_hops(self):
+        limiter = RateLimiter(10, 0)
+        assert limiter.client_key(_request({"X-Forwarded-For": "1.2.3.4"})) == "ip:10.0.0.7"
+
+    def test_trusted_hops_pick_the_proxy_appended_address(self):
+        one_hop = RateLimiter(10, 0, trusted_hops=1)
+        # Entrée de gauche fournie par le client : ignorée
+        spoofed = {"X-Forwarded-For": "6.6.6.6, 203.0.113.9"}
+        assert one_hop.client_key(_request(spoofed)) == "ip:203.0.113.9"
+        two_hops = RateLimiter(10, 0, trusted_hops=2)
+        assert two_hops.client_key(_request({"X-Forwarded-For": "6.6.6.6, 203.0.113.9, 10.1.0.2"})) == \
+            "ip:203.0.113.9"
+        # Chaîne trop courte : pair TCP
+        assert two_hops.client_key(_request({"X-Forwarded-For": "203.0.113.9"})) == "ip:10.0.0.7"
+
+    def test_api_key_takes_precedence(self):
+        limiter = RateLimiter(10, 0, trusted_hops=1)
+        key = limiter.client_key(_request({"X-API-Key": "team-a", "X-Forwarded-For": "203.0.113.9"}))
+        assert key.startswith("key:") and "team-a" not in key
+
+
+class TestSharedStore:
+    """Tests d'un store partagé chargé par RATE_LIMIT_STORE"""
+
+    def test_store_loaded_from_env(self, monkeypatch):
+        monkeypatch.setenv("RATE_LIMIT_STORE", "tests.unit.test_ratelimit:SharedDictStore")
+        assert isinstance(ratelimit._store_from_env(), SharedDictStore)
+
+    def test_quota_shared_between_replicas(self):
+        SharedDictStore.data.clear()
+        replicas = [RateLimiter(3, 100, store=SharedDictStore()) for _ in range(2)]
+        allowed = [replicas[i % 2].check("ip:1").allowed for i in range(4)]
+        assert allowed == [True, True, True, False]
+        replicas[0].record_tokens("ip:2", 150)
+        assert not replicas[1].check("ip:2").allowed
+
+
+class TestTokenUsage:
+    """Tests de la comptabilisation des tokens"""
+
+    def test_usage_from_upstream(self):
+        assert usage_tokens({"usage": {"total_tokens": 60}}) == 60
+        assert usage_tokens({"usage": {"prompt_tokens": 10, "completion_tokens": 5}}) == 15
+        assert usage_tokens({"eval_count": 7, "prompt_eval_count": 3}) == 10
+        assert usage_tokens({"choices": []}) is None
+
+    def test_estimate(self):
+        assert estimate_tokens("") == 0
+        assert estimate_tokens("abcd" * 10) == 10
+
+
+class TestGenerateRateLimit:
+    """Tests du rate limiting sur /generate"""
+
+    @patch('httpx.AsyncClient')
+    def test_request_limit_returns_429(self, mock_client_class, strict_limiter):
+        _mock_upstream(mock_client_class, {"choices": [{"message": {"content": "ok"}}]})
+        client = TestClient(app)
+
+        first = client.post("/generate", json={"prompt": "hi"})
+        assert first.status_code == 200
+        assert first.headers["RateLimit-Limit"] == "2"
+
+        client.post("/generate", json={"prompt": "hi"})
+        denied = client.post("/generate", json={"prompt": "hi"})
+        assert denied.status_code == 429
+        assert "Retry-After" in denied.headers
+
+        # Un autre client (clé API) a son propre quota
+        other = client.post("/generate", json={"prompt": "hi"}, headers={"X-API-Key": "team-b"})
+        assert other.status_code == 200
+
+    @patch('httpx.AsyncClient')
+    def test_token_usage_is_debited(self, mock_client_class, strict_limiter):
+        _mock_upstream(mock_client_class, {
+            "choices": [{"message": {"content": "ok"}}],
+            "usage": {"total_tokens": 5000},
+        })
+        client = TestClient(app)
+        headers = {"X-API-Key": "heavy"}
+
+        assert client.post("/generate", json={"prompt": "hi"}, headers=headers).status_code == 200
+        denied = client.post("/generate", json={"prompt": "hi"}, headers=headers)
+        assert denied.status_code == 429
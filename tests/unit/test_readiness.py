@@ -0,0 +1,116 @@
+"""
+Tests unitaires de la readiness tenant compte de la charge
+"""
+import asyncio
+import pytest
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+from src.api.main import app
+from src.api.readiness import ReadinessMonitor, readiness
+from src.api.scheduler import SATURATION, FairScheduler
+
+WEIGHTS = {"interactive": 8.0, "batch": 1.0}
+
+
+async def _load(scheduler, count):
+    """Occupe le backend avec `count` appels bloqués ; retourne (gate, tâches)"""
+    gate = asyncio.Event()
+
+    async def call():
+        async with scheduler.slot("t"):
+            await gate.wait()
+
+    tasks = [asyncio.create_task(call()) for _ in range(count)]
+    await asyncio.sleep(0)
+    return gate, tasks
+
+
+class TestReadinessMonitor:
+    """Tests de la décision de readiness"""
+
+    @pytest.mark.asyncio
+    async def test_queue_depth_threshold_with_hysteresis(self):
+        scheduler = FairScheduler("test-ready", 1, WEIGHTS)
+        monitor = ReadinessMonitor([], max_queue_depth=4, max_in_flight=100, recovery_ratio=0.5)
+
+        gate, tasks = await _load(scheduler, 6)  # 1 en cours, 5 en file
+        ready, report = monitor.check([scheduler])
+        assert not ready
+        assert report["reasons"] == ["queue depth 5 on test-ready"]
+        assert report["saturation"] == 6.0
+        assert SATURATION.value(backend="test-ready") == 6.0
+
+        # 3 en file : sous le seuil (4) mais au-dessus du seuil de retour (2)
+        for task in tasks[1:3]:
+            task.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queued == 3
+        assert not monitor.check([scheduler])[0]
+
+        for task in tasks[3:5]:
+            task.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queued == 1
+        assert monitor.check([scheduler])[0]
+
+        gate.set()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    @pytest.mark.asyncio
+    async def test_in_flight_threshold(self):
+        scheduler = FairScheduler("test-ready-inflight", 4, WEIGHTS)
+        monitor = ReadinessMonitor([], max_queue_depth=100, max_in_flight=3)
+        gate, tasks = await _load(scheduler, 4)
+        ready, report = monitor.check([scheduler])
+        assert not ready
+        assert report["reasons"] == ["4 requests in flight"]
+        gate.set()
+        await asyncio.gather(*tasks)
+
+    @pytest.mark.asyncio
+    @patch('httpx.AsyncClient')
+    async def test_upstream_probes_are_cached_and_backgrounded(self, mock_client_class):
+        mock_client = AsyncMock()
+        mock_client.get.side_effect = OSError("connection refused")
+        mock_client_class.return_value = mock_client
+
+        monitor = ReadinessMonitor(["http://a", "http://b"], probe_interval=60)
+        # Aucun résultat encore : inconnu = joignable, sondes lancées en fond
+        assert monitor.check([])[0]
+        await monitor._refresh_task
+        ready, report = monitor.check([])
+        assert not ready
+        assert report["reasons"] == ["all upstreams unreachable"]
+        # Pas de nouvelle sonde avant l'intervalle
+        assert mock_client.get.call_count == 2
+        # Un seul client pour toutes les sondes
+        assert mock_client_class.call_count == 1
+
+        # Un seul upstream joignable suffit
+        monitor.probes[0].reachable = True
+        assert monitor.check([])[0]
+        await monitor.aclose()
+        mock_client.aclose.assert_awaited_once()
+
+
+class TestReadyEndpoint:
+    """Tests de /ready et /health"""
+
+    def test_ready_and_health(self):
+        client = TestClient(app)
+        with patch.object(readiness, "maybe_refresh"):
+            response = client.get("/ready")
+        assert response.status_code == 200
+        body = response.json()
+        assert body["status"] == "ready"
+        assert set(body["backends"]) == {"ollama", "openai"}
+        assert client.get("/health").json() == {"status": "healthy"}
+
+    def test_ready_returns_503_when_upstreams_down(self):
+        client = TestClient(app)
+        probe = readiness.probes[0]
+        with patch.object(readiness, "maybe_refresh"), \
+                patch.object(probe, "reachable", False):
+            response = client.get("/ready")
+        assert response.status_code == 503
+        assert "all upstreams unreachable" in response.json()["reasons"]
@@ -0,0 +1,120 @@
+"""
+Tests unitaires de l'ordonnanceur (priorités + weighted fair queuing)
+"""
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from src.api.main import app
+from src.api.scheduler import BUILTIN_WEIGHTS, FairScheduler, QUEUE_WAIT, class_weights, parse_weights
+
+WEIGHTS = {"interactive": 8.0, "batch": 1.0}
+
+
+async def _run_queue(scheduler, requests):
+    """Occupe l'unique slot, met `requests` en file, puis libère et relève l'ordre de service"""
+    order = []
+    gate = asyncio.Event()
+
+    async def holder():
+        async with scheduler.slot("holder", "batch"):
+            await gate.wait()
+
+    async def worker(name, tenant, priority):
+        async with scheduler.slot(tenant, priority):
+            order.append(name)
+
+    hold = asyncio.create_task(holder())
+    await asyncio.sleep(0)
+    tasks = []
+    for name, tenant, priority in requests:
+        tasks.append(asyncio.create_task(worker(name, tenant, priority)))
+        await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(hold, *tasks)
+    return order
+
+
+class TestFairScheduler:
+    """Tests de l'ordre de service"""
+
+    def test_parse_weights(self):
+        assert parse_weights("interactive=8, batch=1") == {"interactive": 8.0, "batch": 1.0}
+        # Classes intégrées toujours présentes, poids surchargeables
+        assert class_weights("bulk=0.5") == {"interactive": 8.0, "batch": 1.0, "bulk": 0.5}
+        assert class_weights("interactive=4") == {"interactive": 4.0, "batch": 1.0}
+        assert class_weights("") == BUILTIN_WEIGHTS
+
+    @pytest.mark.asyncio
+    async def test_interactive_jumps_ahead_of_batch(self):
+        scheduler = FairScheduler("test-prio", 1, WEIGHTS)
+        order = await _run_queue(scheduler, [
+            ("ci-1", "ci", "batch"), ("ci-2", "ci", "batch"), ("ci-3", "ci", "batch"),
+            ("user", "alice", "interactive"),
+        ])
+        assert order[0] == "user"
+
+    @pytest.mark.asyncio
+    async def test_fairness_between_tenants(self):
+        scheduler = FairScheduler("test-fair", 1, WEIGHTS)
+        order = await _run_queue(scheduler, [
+            ("a1", "a", "batch"), ("a2", "a", "batch"), ("a3", "a", "batch"), ("a4", "a", "batch"),
+            ("b1", "b", "batch"),
+        ])
+        # Le client b n'attend pas derrière toute la rafale du client a
+        assert order.index("b1") <= 1
+
+    @pytest.mark.asyncio
+    async def test_starvation_protection(self):
+        scheduler = FairScheduler("test-starve", 1, WEIGHTS, starvation_seconds=0.0)
+        order = await _run_queue(scheduler, [
+            ("old-batch", "ci", "batch"), ("user-1", "u", "interactive"), ("user-2", "u", "interactive"),
+        ])
+        assert order[0] == "old-batch"
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_frees_its_place(self):
+        scheduler = FairScheduler("test-cancel", 1, WEIGHTS)
+        gate = asyncio.Event()
+
+        async def holder():
+            async with scheduler.slot("h", "batch"):
+                await gate.wait()
+
+        async def waiter():
+            async with scheduler.slot("w", "batch"):
+                pass
+
+        hold = asyncio.create_task(holder())
+        await asyncio.sleep(0)
+        waiting = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        assert scheduler.queued == 1
+        waiting.cancel()
+        await asyncio.sleep(0)
+        assert scheduler.queued == 0
+        gate.set()
+        await hold
+        assert scheduler.active == 0
+
+    @pytest.mark.asyncio
+    async def test_queue_wait_is_exported(self):
+        scheduler = FairScheduler("test-metrics", 1, WEIGHTS)
+        await _run_queue(scheduler, [("x", "t", "interactive")])
+        assert QUEUE_WAIT.count(backend="test-metrics", priority="interactive") == 1
+        assert QUEUE_WAIT.count(backend="test-metrics", priority="batch") == 1
+
+
+class TestPriorityApi:
+    """Tests de l'API de priorité"""
+
+    def test_unknown_priority_is_rejected(self):
+        client = TestClient(app)
+        response = client.post("/generate", json={"prompt": "x", "priority": "urgent"})
+        assert response.status_code == 422
+        response = client.post("/generate", json={"prompt": "x"}, headers={"X-Priority": "vip"})
+        assert response.status_code == 422
+
+    def test_metrics_endpoint(self):
+        response = TestClient(app).get("/metrics")
+        assert response.status_code == 200
+        assert "prompt2prod_queue_wait_seconds" in response.text
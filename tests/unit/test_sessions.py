@@ -0,0 +1,136 @@
+"""
+Tests unitaires des sessions de conversation
+"""
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from src.api.main import app
+from src.api.sessions import Session, SessionStore, Message
+from tests.upstream_mock import chat_response, mock_upstream
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def _mock_upstream(mock_client_class, content):
+    return mock_upstream(mock_client_class, chat_response(content))
+
+
+class TestMessageStorage:
+    """Tests du stockage compact"""
+
+    def test_large_content_is_compressed(self):
+        content = "def f():\n    return 1\n" * 500
+        message = Message("user", content)
+        assert isinstance(message._data, bytes)
+        assert len(message._data) < len(content)
+        assert message.content == content
+        assert message.as_dict() == {"role": "user", "content": content}
+
+    def test_store_lru_bound(self):
+        store = SessionStore(max_sessions=2)
+        first = store.create("m", "local")
+        store.create("m", "local")
+        store.create("m", "local")
+        assert len(store) == 2
+        assert store.get(first.id) is None
+
+    def test_store_checks_owner(self):
+        store = SessionStore()
+        session = store.create("m", "local", owner="key:a")
+        assert store.get(session.id, owner="key:b") is None
+        assert not store.delete(session.id, owner="key:b")
+        assert store.get(session.id, owner="key:a") is session
+
+
+class TestContextPacking:
+    """Tests de l'empaquetage du contexte"""
+
+    def _session_with_history(self, turns, size=400):
+        session = Session("llama3.2:1b", "local", system="You write code.")
+        for i in range(turns):
+            session.append("user", f"question {i} " + "x" * size, 1000)
+            session.append("assistant", f"answer {i} " + "y" * size, 1000)
+        return session
+
+    def test_everything_fits(self):
+        session = self._session_with_history(2)
+        messages, stats = session.pack("now add tests", 4000)
+        assert messages[0]["role"] == "system"
+        assert messages[-1] == {"role": "user", "content": "now add tests"}
+        assert len(messages) == 6
+        assert stats["dropped_messages"] == 0
+
+    def test_window_respects_budget(self):
+        session = self._session_with_history(20)
+        messages, stats = session.pack("next", 1000)
+        assert stats["context_tokens"] <= 1000
+        assert stats["dropped_messages"] > 0
+        # La fenêtre commence toujours par un message utilisateur
+        assert messages[1]["role"] == "user"
+        assert messages[0]["role"] == "system"
+
+    def test_prefix_is_stable_between_turns(self):
+        session = self._session_with_history(20)
+        first, _ = session.pack("turn a", 1000)
+        session.append("user", "turn a", 1000)
+        session.append("assistant", "ok", 1000)
+        second, _ = session.pack("turn b", 1000)
+        # Le tour suivant réutilise exactement le même préfixe (cache KV)
+        assert second[:len(first) - 1] == first[:-1]
+
+    def test_oversized_prompt_is_truncated(self):
+        session = Session("m", "local")
+        messages, stats = session.pack("z" * 10000, 100)
+        assert stats["truncated_prompt"] == 1
+        assert len(messages[-1]["content"]) <= 400
+
+
+class TestSessionEndpoints:
+    """Tests des endpoints /sessions"""
+
+    @patch('httpx.AsyncClient')
+    def test_conversation_flow(self, mock_client_class, client):
+        mock_client = _mock_upstream(mock_client_class, "def add(a, b): return a + b")
+
+        created = client.post("/sessions", json={"model": "llama3.2:1b", "mode": "local",
+                                                 "system": "You write Python."})
+        assert created.status_code == 200
+        session_id = created.json()["session_id"]
+
+        first = client.post(f"/sessions/{session_id}/messages", json={"prompt": "write add()"})
+        assert first.status_code == 200
+        assert first.json()["response"] == "def add(a, b): return a + b"
+        assert first.json()["session_id"] == session_id
+
+        second = client.post(f"/sessions/{session_id}/messages", json={"prompt": "now add tests"})
+        assert second.status_code == 200
+        sent = mock_client.stream.call_args.kwargs["json"]["messages"]
+        assert [m["role"] for m in sent] == ["system", "user", "assistant", "user"]
+        assert sent[-1]["content"] == "now add tests"
+
+        history = client.get(f"/sessions/{session_id}").json()
+        assert len(history["messages"]) == 4
+
+        assert client.delete(f"/sessions/{session_id}").status_code == 200
+        assert client.get(f"/sessions/{session_id}").status_code == 404
+
+    @patch('httpx.AsyncClient')
+    def test_session_is_private_to_its_owner(self, mock_client_class, client):
+        mock_client = _mock_upstream(mock_client_class, "ok")
+        owner, other = {"X-API-Key": "owner-key"}, {"X-API-Key": "other-key"}
+        session_id = client.post("/sessions", json={"mode": "local"}, headers=owner).json()["session_id"]
+        assert client.post(f"/sessions/{session_id}/messages", json={"prompt": "hi"}, headers=owner).status_code == 200
+
+        assert client.get(f"/sessions/{session_id}", headers=other).status_code == 404
+        assert client.post(f"/sessions/{session_id}/messages", json={"prompt": "hi"},
+                           headers=other).status_code == 404
+        assert client.delete(f"/sessions/{session_id}", headers=other).status_code == 404
+        assert mock_client.stream.call_count == 1
+        assert len(client.get(f"/sessions/{session_id}", headers=owner).json()["messages"]) == 2
+
+    def test_unknown_session(self, client):
+        response = client.post("/sessions/unknown/messages", json={"prompt": "hi"})
+        assert response.status_code == 404
@@ -0,0 +1,180 @@
+"""
+Tests unitaires du trafic miroir vers les modèles candidats
+"""
+import asyncio
+import httpx
+import pytest
+from unittest.mock import patch
+from src.api import main
+from src.api.main import app
+from src.api.scheduler import WEIGHTS, FairScheduler
+from src.api.shadow import Shadower, ShadowRule, parse_rules
+from tests.upstream_mock import chat_response, mock_upstream
+
+RealAsyncClient = httpx.AsyncClient
+RULE = ShadowRule("gpt-4o-mini", "cloud", "llama3.2:1b", "local")
+
+
+def _call(text: str = "candidate", gate: asyncio.Event = None, error: Exception = None):
+    async def call():
+        if gate is not None:
+            await gate.wait()
+        if error is not None:
+            raise error
+        return text
+    return call
+
+
+class TestShadower:
+    """Tests de la sélection, du plafond et des comparaisons"""
+
+    def test_parse_rules(self):
+        assert parse_rules("gpt-4o-mini@cloud>llama3.2:1b@local; a>b ;bad") == [
+            RULE, ShadowRule("a", None, "b", None),
+        ]
+
+    def test_select(self):
+        shadower = Shadower([RULE], sample_rate=1.0)
+        assert shadower.select("gpt-4o-mini", "cloud") == [RULE]
+        assert shadower.select("gpt-4o-mini", "local") == []
+        assert shadower.select("other", "cloud") == []
+        assert Shadower([RULE], sample_rate=0).select("gpt-4o-mini", "cloud") == []
+
+    @pytest.mark.asyncio
+    async def test_comparison_recorded(self):
+        shadower = Shadower([RULE], sample_rate=1.0)
+        assert shadower.submit(RULE, _call("x" * 50), primary_latency=2.0, primary_chars=100)
+        await shadower.drain()
+        pair = shadower.report()["pairs"]["gpt-4o-mini>llama3.2:1b"]
+        assert pair["mirrored"] == 1 and pair["errors"] == 0
+        assert pair["latency_seconds"]["primary"]["p50"] == 2.0
+        assert pair["latency_seconds"]["candidate"]["p50"] < 1.0
+        assert pair["response_chars_ratio"] == 0.5
+        assert pair["latency_p50_ratio"] < 0.5
+
+    @pytest.mark.asyncio
+    async def test_concurrency_cap_drops_instead_of_queueing(self):
+        shadower = Shadower([RULE], sample_rate=1.0, max_concurrency=2)
+        gate = asyncio.Event()
+        accepted = [shadower.submit(RULE, _call(gate=gate), 1.0, 10) for _ in range(4)]
+        assert accepted == [True, True, False, False]
+        assert shadower.active == 2
+        gate.set()
+        await shadower.drain()
+        assert shadower.active == 0
+        pair = shadower.report()["pairs"][RULE.pair]
+        assert pair["mirrored"] == 2 and pair["dropped"] == 2
+        assert shadower.submit(RULE, _call(), 1.0, 10)
+        await shadower.drain()
+
+    @pytest.mark.asyncio
+    async def test_errors_are_counted_not_raised(self):
+        shadower = Shadower([RULE], sample_rate=1.0)
+        shadower.submit(RULE, _call(error=httpx.ConnectError("down")), 1.0, 10)
+        await shadower.drain()
+        pair = shadower.report()["pairs"][RULE.pair]
+        assert pair["errors"] == 1 and pair["latency_seconds"]["candidate"] is None
+        assert shadower.active == 0
+
+    @pytest.mark.asyncio
+    async def test_busy_candidate_backend_not_mirrored(self):
+        shadower = Shadower([RULE], sample_rate=1.0, max_concurrency=8)
+        scheduler = FairScheduler("local", 2, WEIGHTS)
+        gate = asyncio.Event()
+
+        async def interactive():
+            async with scheduler.slot(priority="interactive"):
+                await gate.wait()
+
+        running = [asyncio.create_task(interactive()) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert not shadower.submit(RULE, _call(), 1.0, 10, scheduler)
+        assert shadower.report()["pairs"][RULE.pair]["dropped"] == 1
+        gate.set()
+        await asyncio.gather(*running)
+        assert shadower.submit(RULE, _call(), 1.0, 10, scheduler)
+        await shadower.drain()
+
+    @pytest.mark.asyncio
+    async def test_interactive_requests_not_delayed(self):
+        shadower = Shadower([RULE], sample_rate=1.0, max_concurrency=8)
+        scheduler = FairScheduler("local", 2, WEIGHTS)
+        gate = asyncio.Event()
+
+        def mirrored():
+            async def call():
+                async with scheduler.slot(tenant="shadow", priority="batch"):
+                    await gate.wait()
+                return "candidate"
+            return call
+
+        accepted = [shadower.submit(RULE, mirrored(), 1.0, 10, scheduler) for _ in range(3)]
+        await asyncio.sleep(0)
+        # Un seul appel miroir sur deux slots : le trafic réel trouve toujours un slot libre
+        assert accepted == [True, False, False]
+        assert scheduler.active == 1
+        async with scheduler.slot(priority="interactive"):
+            assert scheduler.queued == 0
+        gate.set()
+        await shadower.drain()
+        assert shadower._per_backend == {"local": 0}
+
+    @pytest.mark.asyncio
+    async def test_drain_timeout(self):
+        shadower = Shadower([RULE], sample_rate=1.0)
+        shadower.submit(RULE, _call("fast"), 1.0, 10)
+        shadower.submit(RULE, _call(gate=asyncio.Event()), 1.0, 10)
+        await shadower.drain(timeout=0.05)
+        assert shadower.active == 1
+        assert shadower.report()["pairs"][RULE.pair]["mirrored"] == 1
+        await shadower.aclose()
+        assert shadower.active == 0
+
+    @pytest.mark.asyncio
+    async def test_aclose_cancels_pending_calls(self):
+        shadower = Shadower([RULE], sample_rate=1.0)
+        shadower.submit(RULE, _call(gate=asyncio.Event()), 1.0, 10)
+        await shadower.aclose()
+        assert shadower.active == 0
+
+
+class TestGenerateShadow:
+    """Tests du miroir sur /generate"""
+
+    @pytest.mark.asyncio
+    @patch('httpx.AsyncClient')
+    async def test_request_mirrored_after_response(self, mock_client_class):
+        local = Shadower([RULE], sample_rate=1.0)
+        calls = []
+
+        def handler(method, url, json=None, headers=None, timeout=None):
+            calls.append((url, json["model"]))
+            return chat_response("primary answer" if json["model"] == "gpt-4o-mini" else "local")
+
+        mock_upstream(mock_client_class, handler=handler)
+        transport = httpx.ASGITransport(app=app)
+        with patch.object(main, "shadow", local):
+            async with RealAsyncClient(transport=transport, base_url="http://test") as client:
+                response = await client.post("/generate", json={"prompt": "hi", "model": "gpt-4o-mini",
+                                                                "mode": "cloud"})
+                await local.drain()
+                report = (await client.get("/debug/shadow")).json()
+
+        assert response.status_code == 200
+        assert response.json()["response"] == "primary answer"
+        assert [model for _, model in calls] == ["gpt-4o-mini", "llama3.2:1b"]
+        pair = report["pairs"]["gpt-4o-mini>llama3.2:1b"]
+        assert pair["mirrored"] == 1
+        assert pair["response_chars"]["candidate"]["mean"] == len("local")
+
+    @patch('httpx.AsyncClient')
+    def test_unmatched_request_not_mirrored(self, mock_client_class):
+        from fastapi.testclient import TestClient
+        local = Shadower([RULE], sample_rate=1.0)
+        mock_client = mock_upstream(mock_client_class, chat_response("ok"))
+        with patch.object(main, "shadow", local):
+            response = TestClient(app).post("/generate", json={"prompt": "hi", "model": "llama3.2:1b",
+                                                               "mode": "local"})
+        assert response.status_code == 200
+        assert mock_client.stream.call_count == 1
+        assert local.report()["pairs"][RULE.pair]["mirrored"] == 0
@@ -0,0 +1,127 @@
+"""
+Tests unitaires du tracing distribué (W3C traceparent)
+"""
+import logging
+import threading
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from src.api.main import app
+from src.api import tracing
+from src.api.tracing import (
+    Tracer, InMemoryExporter, FileExporter, NonRecordingSpan,
+    parse_traceparent, format_traceparent,
+)
+from tests.upstream_mock import FakeUpstreamResponse, mock_upstream
+
+
+INCOMING = "00-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01"
+
+
+@pytest.fixture
+def exporter():
+    """Tracer global échantillonné à 100% avec exporter en mémoire"""
+    memory = InMemoryExporter()
+    with patch.object(tracing.tracer, "exporter", memory), \
+            patch.object(tracing.tracer, "sample_rate", 1.0):
+        yield memory
+
+
+def _mock_upstream(mock_client_class, payload):
+    return mock_upstream(mock_client_class, FakeUpstreamResponse(payload))
+
+
+class TestTraceparent:
+    """Tests du format W3C traceparent"""
+
+    def test_parse_valid(self):
+        trace_id, parent_id, sampled = parse_traceparent(INCOMING)
+        assert trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert parent_id == "00f067aa0ba902b7"
+        assert sampled is True
+
+    def test_parse_invalid(self):
+        assert parse_traceparent(None) is None
+        assert parse_traceparent("garbage") is None
+        assert parse_traceparent("00-" + "0" * 32 + "-00f067aa0ba902b7-01") is None
+        assert parse_traceparent("ff-4bf92f3577b34da6a3ce929d0e0e4736-00f067aa0ba902b7-01") is None
+
+    def test_format_roundtrip(self):
+        header = format_traceparent("a" * 32, "b" * 16, False)
+        assert header == f"00-{'a' * 32}-{'b' * 16}-00"
+        assert parse_traceparent(header)[2] is False
+
+
+class TestSampling:
+    """Tests de l'échantillonnage en tête"""
+
+    def test_unsampled_spans_are_not_exported(self):
+        memory = InMemoryExporter()
+        local_tracer = Tracer(sample_rate=0.0, exporter=memory)
+        with local_tracer.start_span("root") as root:
+            assert isinstance(root, NonRecordingSpan)
+            with local_tracer.start_span("child") as child:
+                assert child.sampled is False
+            headers = local_tracer.inject({})
+        assert headers["traceparent"].endswith("-00")
+        assert memory.finished() == []
+
+    def test_incoming_sampled_flag_is_honored(self):
+        memory = InMemoryExporter()
+        local_tracer = Tracer(sample_rate=0.0, exporter=memory)
+        with local_tracer.start_span("root", traceparent=INCOMING):
+            with local_tracer.start_span("child"):
+                pass
+        names = [s.name for s in memory.finished()]
+        assert names == ["child", "root"]
+        root = memory.finished("root")[0]
+        assert root.trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert root.parent_id == "00f067aa0ba902b7"
+        assert memory.finished("child")[0].parent_id == root.span_id
+
+    def test_file_exporter(self, tmp_path):
+        path = tmp_path / "traces.jsonl"
+        local_tracer = Tracer(sample_rate=1.0, exporter=FileExporter(str(path)))
+        threads = []
+        emit = logging.FileHandler.emit
+
+        def recording_emit(handler, record):
+            threads.append(threading.current_thread())
+            emit(handler, record)
+
+        with patch.object(logging.FileHandler, "emit", recording_emit):
+            with local_tracer.start_span("root", {"k": "v"}):
+                pass
+            local_tracer.shutdown()
+        # Écriture faite par le thread du QueueListener, pas par l'appelant
+        assert threads and threading.current_thread() not in threads
+        content = path.read_text()
+        assert '"name": "root"' in content
+        assert '"k": "v"' in content
+
+
+class TestPropagation:
+    """Tests de la propagation vers KGateway"""
+
+    @patch('httpx.AsyncClient')
+    def test_generate_propagates_traceparent(self, mock_client_class, exporter):
+        mock_client = _mock_upstream(mock_client_class, {
+            "choices": [{"message": {"content": "ok"}}]
+        })
+        client = TestClient(app)
+
+        response = client.post("/generate", json={"prompt": "hi", "mode": "cloud"},
+                               headers={"traceparent": INCOMING})
+
+        assert response.status_code == 200
+        sent_headers = mock_client.stream.call_args.kwargs["headers"]
+        trace_id, parent_id, sampled = parse_traceparent(sent_headers["traceparent"])
+        assert trace_id == "4bf92f3577b34da6a3ce929d0e0e4736"
+        assert sampled is True
+
+        attempt = exporter.finished("upstream.attempt")[0]
+        request_span = exporter.finished("http.request")[0]
+        assert attempt.span_id == parent_id
+        assert attempt.parent_id == request_span.span_id
+        assert attempt.attributes["http.status_code"] == 200
+        assert request_span.attributes["http.status_code"] == 200
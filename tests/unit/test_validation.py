@@ -0,0 +1,110 @@
+"""
+Tests unitaires de la validation du code généré
+"""
+import os
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from src.api.main import app
+from src.api.validation import CodeValidator, check_syntax, extract_code_blocks, repair_prompt
+from tests.upstream_mock import chat_response, mock_upstream
+
+BROKEN = "Here you go:\n```python\ndef add(a, b)\n    return a + b\n```\n"
+FIXED = "Fixed:\n```python\ndef add(a, b):\n    return a + b\n```\n"
+
+
+def _crash(language, code):
+    """Remplace check_syntax dans le processus du pool : le processus meurt"""
+    os._exit(1)
+
+
+@pytest.fixture
+def validator():
+    local = CodeValidator(workers=1)
+    yield local
+    local.shutdown()
+
+
+class TestSyntaxChecks:
+    """Tests des vérifications par langage"""
+
+    def test_extract_blocks(self):
+        text = "a\n```py\nx = 1\n```\nb\n```json\n{\"a\": 1}\n```\n```\nplain\n```"
+        assert extract_code_blocks(text) == [("python", "x = 1\n"), ("json", '{"a": 1}\n'), ("text", "plain\n")]
+
+    def test_python(self):
+        assert check_syntax("python", "x = 1\n")["status"] == "valid"
+        result = check_syntax("python", "def f(:\n")
+        assert result["status"] == "invalid"
+        assert result["line"] == 1
+
+    def test_json_and_toml(self):
+        assert check_syntax("json", '{"a": 1}')["status"] == "valid"
+        assert check_syntax("json", '{"a": }')["status"] == "invalid"
+        assert check_syntax("toml", 'a = 1\n')["status"] == "valid"
+        assert check_syntax("toml", 'a = \n')["status"] == "invalid"
+
+    def test_unknown_language_is_skipped(self):
+        assert check_syntax("rust", "fn main() {")["status"] == "skipped"
+
+
+class TestCodeValidator:
+    """Tests du validateur (pool de processus + cache)"""
+
+    @pytest.mark.asyncio
+    async def test_report(self, validator):
+        report = await validator.validate(BROKEN + "```json\n[1, 2]\n```\n")
+        assert report["valid"] is False
+        assert report["checked"] == 2
+        assert [b["status"] for b in report["blocks"]] == ["invalid", "valid"]
+        assert "block 1 [python]" in repair_prompt(report)
+
+    @pytest.mark.asyncio
+    async def test_results_are_cached(self, validator):
+        await validator.validate(FIXED)
+        with patch("src.api.validation.check_syntax", side_effect=AssertionError("not cached")):
+            report = await validator.validate(FIXED)
+        assert report["valid"] is True
+
+    @pytest.mark.asyncio
+    async def test_crashed_worker_is_reported_and_pool_recreated(self, validator):
+        with patch("src.api.validation.check_syntax", _crash):
+            report = await validator.validate(FIXED)
+        assert report["valid"] is False
+        assert report["blocks"][0]["error"].startswith("BrokenProcessPool")
+        # Pool recréé, erreur non mise en cache
+        report = await validator.validate(FIXED)
+        assert report["valid"] is True
+
+    @pytest.mark.asyncio
+    async def test_text_without_code_is_valid(self, validator):
+        report = await validator.validate("No code here.")
+        assert report == {"valid": True, "checked": 0, "blocks": []}
+
+
+class TestGenerateValidation:
+    """Tests de /generate avec validation et réparation"""
+
+    @patch('httpx.AsyncClient')
+    def test_auto_repair(self, mock_client_class):
+        mock_client = mock_upstream(mock_client_class, chat_response(BROKEN), chat_response(FIXED))
+
+        response = TestClient(app).post("/generate", json={
+            "prompt": "write add", "validate_code": True, "max_repairs": 1
+        })
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["response"] == FIXED
+        assert data["validation"]["valid"] is True
+        assert data["validation"]["repairs"] == 1
+        repair_messages = mock_client.stream.call_args.kwargs["json"]["messages"]
+        assert [m["role"] for m in repair_messages] == ["user", "assistant", "user"]
+        assert "does not parse" in repair_messages[-1]["content"]
+
+    @patch('httpx.AsyncClient')
+    def test_validation_is_opt_in(self, mock_client_class):
+        mock_upstream(mock_client_class, chat_response(BROKEN))
+
+        response = TestClient(app).post("/generate", json={"prompt": "write add"})
+        assert "validation" not in response.json()
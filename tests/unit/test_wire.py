@@ -0,0 +1,144 @@
+"""
+Tests unitaires du format binaire MessagePack (parité avec le chemin JSON)
+"""
+import httpx
+import pytest
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+from src.api.main import PromptRequest, PromptResponse, app
+from src.api.wire import MSGPACK, prefers_msgpack
+from tests.unit.test_multiplex import _mock_streaming_client
+from tests.upstream_mock import chat_response, mock_upstream
+
+msgpack = pytest.importorskip("msgpack")
+
+CODE = "def parse(path):\n    return [dict(r) for r in csv.DictReader(open(path))]\n" * 50
+BODY = {"prompt": "Parse a CSV file", "mode": "cloud", "model": "gpt-4o-mini", "priority": "batch"}
+
+
+def _msgpack_post(client, url, body, **headers):
+    return client.post(url, content=msgpack.packb(body), headers={
+        "Content-Type": MSGPACK, "Accept": MSGPACK, **headers,
+    })
+
+
+class TestNegotiation:
+    """Tests du choix de format par le header Accept"""
+
+    def test_prefers_msgpack(self):
+        assert prefers_msgpack("application/msgpack")
+        assert prefers_msgpack("application/x-msgpack, application/json;q=0.5")
+        assert not prefers_msgpack(None)
+        assert not prefers_msgpack("application/json")
+        assert not prefers_msgpack("*/*")
+        assert not prefers_msgpack("application/msgpack, application/json")
+        assert not prefers_msgpack("application/msgpack;q=0")
+        # Le type précis bat les jokers ; seul un JSON explicite départage
+        assert prefers_msgpack("application/msgpack, */*")
+        assert prefers_msgpack("application/*, application/msgpack")
+        assert not prefers_msgpack("application/msgpack;q=0.5, */*")
+        assert not prefers_msgpack("application/msgpack, application/json, */*")
+
+    def test_schema_mapping(self):
+        request = PromptRequest(**BODY)
+        assert PromptRequest.model_validate(msgpack.unpackb(msgpack.packb(request.model_dump()))) == request
+        response = PromptResponse(response=CODE, model="gpt-4o-mini", provider="openai", mode="cloud",
+                                  validation={"valid": True, "blocks": []})
+        decoded = msgpack.unpackb(msgpack.packb(response.model_dump(mode="json", exclude_none=True)))
+        assert PromptResponse.model_validate(decoded) == response
+
+
+class TestGenerateParity:
+    """Tests de parité JSON / MessagePack sur les endpoints"""
+
+    @patch('httpx.AsyncClient')
+    def test_generate(self, mock_client_class):
+        mock_client = mock_upstream(mock_client_class, chat_response(CODE))
+        client = TestClient(app)
+        as_json = client.post("/generate", json=BODY)
+        as_msgpack = _msgpack_post(client, "/generate", BODY)
+
+        assert as_msgpack.status_code == as_json.status_code == 200
+        assert as_msgpack.headers["content-type"] == MSGPACK
+        assert msgpack.unpackb(as_msgpack.content) == as_json.json()
+        assert len(as_msgpack.content) < len(as_json.content)
+        payloads = [call.kwargs["json"] for call in mock_client.stream.call_args_list]
+        assert payloads[0] == payloads[1]
+
+    @patch('httpx.AsyncClient')
+    def test_json_body_msgpack_response_and_reverse(self, mock_client_class):
+        mock_upstream(mock_client_class, chat_response("ok"))
+        client = TestClient(app)
+        response = client.post("/generate", json=BODY, headers={"Accept": MSGPACK})
+        assert msgpack.unpackb(response.content)["response"] == "ok"
+        response = client.post("/generate", content=msgpack.packb(BODY), headers={"Content-Type": MSGPACK})
+        assert response.headers["content-type"] == "application/json"
+        assert response.json()["response"] == "ok"
+
+    def test_validation_errors_match(self):
+        client = TestClient(app)
+        body = {**BODY, "max_repairs": -1}
+        as_json = client.post("/generate", json=body)
+        as_msgpack = _msgpack_post(client, "/generate", body)
+        assert as_msgpack.status_code == as_json.status_code == 422
+        assert as_msgpack.json()["detail"][0]["loc"] == as_json.json()["detail"][0]["loc"]
+
+    def test_invalid_body(self):
+        response = TestClient(app).post("/generate", content=b"\xc1", headers={"Content-Type": MSGPACK})
+        assert response.status_code == 400
+
+    @patch('httpx.AsyncClient')
+    def test_idempotent_replay(self, mock_client_class):
+        mock_client = mock_upstream(mock_client_class, chat_response("once"))
+        client = TestClient(app)
+        first = _msgpack_post(client, "/generate", BODY, **{"Idempotency-Key": "wire-replay"})
+        replay = _msgpack_post(client, "/generate", BODY, **{"Idempotency-Key": "wire-replay"})
+        assert replay.headers["idempotent-replayed"] == "true"
+        assert replay.content == first.content
+        assert replay.headers["content-type"] == MSGPACK
+        # Même clé, autre format négocié : conflit, pas de rejeu
+        as_json = client.post("/generate", json=BODY, headers={"Idempotency-Key": "wire-replay"})
+        assert as_json.status_code == 422
+        assert mock_client.stream.call_count == 1
+
+    @patch('httpx.AsyncClient')
+    def test_fanout_stream(self, mock_client_class):
+        mock_upstream(mock_client_class, chat_response("ok"))
+        body = {"prompt": "hello", "strategy": "all",
+                "targets": [{"model": "llama3.2:1b", "mode": "local"}, {"model": "phi3:mini", "mode": "local"}]}
+        response = _msgpack_post(TestClient(app), "/generate/fanout", body)
+        assert response.headers["content-type"] == MSGPACK
+        unpacker = msgpack.Unpacker(raw=False)
+        unpacker.feed(response.content)
+        objects = list(unpacker)
+        assert {o["model"] for o in objects[:-1]} == {"llama3.2:1b", "phi3:mini"}
+        assert objects[-1] == {**objects[-1], "done": True, "succeeded": 2, "total": 2}
+
+    @patch('httpx.AsyncClient')
+    def test_models_and_text_routes(self, mock_client_class):
+        mock_client = mock_upstream(mock_client_class)
+        mock_client.get = AsyncMock(side_effect=httpx.ConnectError("down"))
+        client = TestClient(app)
+        models = client.get("/models", headers={"Accept": MSGPACK})
+        assert models.headers["content-type"] == MSGPACK
+        assert set(msgpack.unpackb(models.content)["models"]) == set(client.get("/models").json()["models"])
+        # Routes texte : pas de négociation
+        assert client.get("/metrics", headers={"Accept": MSGPACK}).headers["content-type"].startswith("text/plain")
+
+
+class TestWebSocketMsgPack:
+    """Tests du sous-protocole msgpack du WebSocket"""
+
+    @patch('httpx.AsyncClient')
+    def test_binary_frames(self, mock_client_class):
+        _mock_streaming_client(mock_client_class)
+        client = TestClient(app)
+        with client.websocket_connect("/ws/generate", subprotocols=["msgpack"]) as ws:
+            assert ws.accepted_subprotocol == "msgpack"
+            ws.send_bytes(msgpack.packb({"type": "generate", "id": "r1", "prompt": "a", "mode": "cloud"}))
+            messages = []
+            while not messages or messages[-1]["type"] != "done":
+                messages.append(msgpack.unpackb(ws.receive_bytes()))
+            ws.send_bytes(b"\xc1")
+            assert msgpack.unpackb(ws.receive_bytes())["error"] == "Invalid MessagePack message"
+        assert [m["data"] for m in messages if m["type"] == "token"] == ["a-0", "a-1", "a-2"]
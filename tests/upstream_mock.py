@@ -0,0 +1,78 @@
+"""
+Mock des appels upstream pour les tests unitaires
+
+Les appels de génération lisent la réponse en streaming
+(`httpx.AsyncClient.stream`) : ces helpers simulent la réponse et son corps.
+"""
+import asyncio
+import json
+from typing import Callable, Optional, Union
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+
+
+class FakeUpstreamResponse:
+    """Réponse streaming (context manager) avec corps découpé en morceaux"""
+
+    def __init__(self, body: Union[dict, str, bytes] = b"", status_code: int = 200,
+                 headers: Optional[dict] = None, chunk_size: int = 1024, delay: float = 0.0):
+        if isinstance(body, dict):
+            body = json.dumps(body)
+        if isinstance(body, str):
+            body = body.encode()
+        self.body = body
+        self.status_code = status_code
+        self.headers = httpx.Headers(headers or {"content-type": "application/json"})
+        self.request = httpx.Request("POST", "http://upstream.test")
+        self.chunk_size = chunk_size
+        self.delay = delay
+        self.closed = False
+        self.bytes_read = 0
+
+    async def __aenter__(self):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        return self
+
+    async def __aexit__(self, *args):
+        self.closed = True
+        return None
+
+    async def aiter_bytes(self):
+        for start in range(0, len(self.body), self.chunk_size):
+            chunk = self.body[start:start + self.chunk_size]
+            self.bytes_read += len(chunk)
+            yield chunk
+            await asyncio.sleep(0)
+
+    async def aiter_lines(self):
+        for line in self.body.decode().splitlines():
+            yield line
+            await asyncio.sleep(0)
+
+
+def chat_response(content: str, **kwargs) -> FakeUpstreamResponse:
+    """Réponse au format OpenAI (chat completions)"""
+    return FakeUpstreamResponse({"choices": [{"message": {"content": content}}]}, **kwargs)
+
+
+def mock_upstream(mock_client_class, *responses: FakeUpstreamResponse,
+                  handler: Optional[Callable] = None):
+    """
+    Branche un client httpx mocké sur `mock_client_class` (patch de httpx.AsyncClient).
+
+    Une réponse : renvoyée à chaque appel ; plusieurs : une par appel ;
+    `handler(method, url, json=..., headers=..., timeout=...)` : réponse calculée.
+    """
+    mock_client = MagicMock()
+    mock_client.__aenter__ = AsyncMock(return_value=mock_client)
+    mock_client.__aexit__ = AsyncMock(return_value=None)
+    if handler is not None:
+        mock_client.stream = MagicMock(side_effect=handler)
+    elif len(responses) == 1:
+        mock_client.stream = MagicMock(return_value=responses[0])
+    else:
+        mock_client.stream = MagicMock(side_effect=list(responses))
+    mock_client_class.return_value = mock_client
+    return mock_client